@@ -0,0 +1,106 @@
+""" serial vs concurrent remote fetch against a local http.server with simulated latency
+
+    python benchmarks/remote_fetch.py --latency 0.05 --files 64 --size 262144
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import functools
+import http.server
+import socketserver
+import urllib.request
+from tfbox.loaders.remote import RemoteReader
+
+
+#
+# CONSTANTS
+#
+LATENCY=0.05
+NB_FILES=64
+FILE_SIZE=2**18
+BATCH_SIZE=16
+
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version='HTTP/1.1'
+    latency=LATENCY
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        return super().do_GET()
+
+
+    def log_message(self,*args):
+        pass
+
+
+
+
+class _Server(socketserver.ThreadingMixIn,http.server.HTTPServer):
+    daemon_threads=True
+    request_queue_size=128
+
+
+
+
+def serial(urls,directory):
+    """ one blocking request per file (the pre-RemoteReader behavior) """
+    for i,url in enumerate(urls):
+        with urllib.request.urlopen(url) as response:
+            with open(os.path.join(directory,f'{i}.bin'),'wb') as file:
+                shutil.copyfileobj(response,file)
+
+
+def concurrent(urls,directory,batch_size,**kwargs):
+    """ RemoteReader fetch of each batch of files """
+    reader=RemoteReader(directory=directory,**kwargs)
+    try:
+        for i in range(0,len(urls),batch_size):
+            reader.fetch(urls[i:i+batch_size],key=i)
+            reader.release(i)
+    finally:
+        reader.close()
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency',type=float,default=LATENCY)
+    parser.add_argument('--files',type=int,default=NB_FILES)
+    parser.add_argument('--size',type=int,default=FILE_SIZE)
+    parser.add_argument('--batch-size',type=int,default=BATCH_SIZE)
+    args=parser.parse_args()
+    root=tempfile.mkdtemp(prefix='tfbox_bench_')
+    try:
+        source=os.path.join(root,'source')
+        os.makedirs(source)
+        for i in range(args.files):
+            with open(os.path.join(source,f'f{i}.bin'),'wb') as file:
+                file.write(os.urandom(args.size))
+        _Handler.latency=args.latency
+        server=_Server(('127.0.0.1',0),functools.partial(_Handler,directory=source))
+        threading.Thread(target=server.serve_forever,daemon=True).start()
+        origin=f'http://127.0.0.1:{server.server_address[1]}'
+        urls=[f'{origin}/f{i}.bin' for i in range(args.files)]
+        print(f'{args.files} files of {args.size} bytes, {1000*args.latency:.0f}ms latency')
+        runs=[
+            ('serial',lambda d: serial(urls,d)),
+            (f'concurrent (batches of {args.batch_size})',
+                lambda d: concurrent(urls,d,args.batch_size)),
+            ('concurrent (all)',lambda d: concurrent(urls,d,len(urls))) ]
+        for name,run in runs:
+            directory=tempfile.mkdtemp(dir=root)
+            start=time.perf_counter()
+            run(directory)
+            print(f'  {name:<28}{time.perf_counter()-start:>8.2f}s')
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(root,ignore_errors=True)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,51 @@
+""" DFSequence.select_batch time as the manifest grows
+
+    python benchmarks/select_rows.py --rows 10000 100000 1000000
+"""
+import time
+import argparse
+import pandas as pd
+from tfbox.loaders.dfsequence import DFSequence
+
+
+#
+# CONSTANTS
+#
+ROWS=[10_000,100_000,1_000_000]
+ROWS_PER_IDENT=2
+BATCH_SIZE=16
+NB_BATCHES=20
+
+
+
+def manifest(nb_rows,rows_per_ident=ROWS_PER_IDENT):
+    """ synthetic manifest with `rows_per_ident` rows (inputs) per target """
+    return pd.DataFrame({
+        'input': [f'input_{i}.tif' for i in range(nb_rows)],
+        'target': [f'target_{i//rows_per_ident}.tif' for i in range(nb_rows)] })
+
+
+def select_time(nb_rows,batch_size=BATCH_SIZE,nb_batches=NB_BATCHES):
+    """ mean seconds per select_batch (no images are read) """
+    sequence=DFSequence(manifest(nb_rows),nb_classes=2,batch_size=batch_size)
+    nb_batches=min(nb_batches,sequence.nb_batches)
+    start=time.perf_counter()
+    for i in range(nb_batches):
+        sequence.select_batch(i)
+    return (time.perf_counter()-start)/nb_batches
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows',type=int,nargs='+',default=ROWS)
+    parser.add_argument('--batch-size',type=int,default=BATCH_SIZE)
+    parser.add_argument('--batches',type=int,default=NB_BATCHES)
+    args=parser.parse_args()
+    print(f'select_batch (batch_size={args.batch_size}, {ROWS_PER_IDENT} rows per ident)')
+    for nb_rows in args.rows:
+        seconds=select_time(nb_rows,args.batch_size,args.batches)
+        print(f'  {nb_rows:>10} rows {1000*seconds:>10.3f} ms/batch')
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+#
+# CONSTANTS
+#
+NB_TILES=8
+NB_BANDS=4
+NB_CLASSES=5
+TILE_SIZE=64
+WINDOW_SIZE=32
+BATCH_SIZE=4
+MEANS=[1000,1200,1400,1600]
+STDEVS=[500,600,700,800]
+
+
+
+#
+# HELPERS
+#
+def _write(path,im):
+    rio=pytest.importorskip('rasterio')
+    from rasterio.transform import from_origin
+    profile=dict(
+        driver='GTiff',
+        width=im.shape[2],
+        height=im.shape[1],
+        count=im.shape[0],
+        dtype=im.dtype.name,
+        transform=from_origin(0,im.shape[1],1,1))
+    with rio.open(path,'w',**profile) as dst:
+        dst.write(im)
+
+
+def _manifest(directory):
+    rng=np.random.default_rng(0)
+    rows=[]
+    for i in range(NB_TILES):
+        input_path=str(directory/f'input_{i}.tif')
+        target_path=str(directory/f'target_{i}.tif')
+        _write(input_path,rng.integers(0,3000,(NB_BANDS,TILE_SIZE,TILE_SIZE)).astype('uint16'))
+        _write(target_path,rng.integers(0,NB_CLASSES,(1,TILE_SIZE,TILE_SIZE)).astype('uint8'))
+        for w in range(4):
+            window=(WINDOW_SIZE*(w%2),WINDOW_SIZE*(w//2),WINDOW_SIZE,WINDOW_SIZE)
+            rows.append(dict(
+                input=input_path,
+                target=target_path,
+                tile=f't{i}',
+                win_index=w,
+                window=str(window),
+                weight=float(rng.random()),
+                year=2020,
+                means_2020=str(MEANS),
+                stdevs_2020=str(STDEVS),
+                region=f'r{i%3}'))
+    path=directory/'manifest.csv'
+    pd.DataFrame(rows).to_csv(path,index=False)
+    return str(path)
+
+
+
+
+#
+# FIXTURES
+#
+@pytest.fixture(scope='session')
+def manifest(tmp_path_factory):
+    """ csv manifest of NB_TILES uint16 input/uint8 target tiles with 4 windows each """
+    return _manifest(tmp_path_factory.mktemp('data'))
+
+
+@pytest.fixture
+def sequence_kwargs():
+    """ DFSequence kwargs for `manifest` (windowed rows, per-year stats, sample weights) """
+    return dict(
+        nb_classes=NB_CLASSES,
+        batch_size=BATCH_SIZE,
+        converters={'means_2020': eval,'stdevs_2020': eval},
+        means_column='means.year',
+        stdevs_column='stdevs.year',
+        sample_weight_column='weight',
+        has_windows=True,
+        window_index_column='win_index',
+        group_column='tile',
+        size=TILE_SIZE)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+import tensorflow as tf
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.loaders.augment import augment_batch, augment_dataset
+
+
+#
+# CONSTANTS
+#
+SEED=13
+CROP=24
+
+
+
+#
+# HELPERS
+#
+def _dihedral(im):
+    """ the 8 rotations/flips of a (H,W,C) image """
+    rotations=[np.rot90(im,k,axes=(0,1)) for k in range(4)]
+    return rotations+[r[::-1] for r in rotations]
+
+
+def _transform_index(augmented,original):
+    for i,t in enumerate(_dihedral(original)):
+        if (t.shape==augmented.shape) and np.array_equal(t,augmented):
+            return i
+    return None
+
+
+def _unaugmented_batch(manifest,sequence_kwargs):
+    sequence=DFSequence(manifest,seed=SEED,augment=False,**sequence_kwargs)
+    return sequence[0]
+
+
+
+
+#
+# TESTS
+#
+def test_batch_augmentation_matches_dihedral_transforms(manifest,sequence_kwargs):
+    x,y,w=_unaugmented_batch(manifest,sequence_kwargs)
+    (ax,ay,aw)=augment_batch((x,y,w),seed=tf.constant([SEED,0],dtype=tf.int64))
+    ax,ay=ax.numpy(),ay.numpy()
+    assert np.array_equal(aw,w)
+    for b in range(len(x)):
+        # inputs are random, so the transform is identified by the input alone
+        index=_transform_index(ax[b],x[b])
+        assert index is not None
+        assert np.array_equal(ay[b],_dihedral(y[b])[index])
+
+
+def test_crops_are_aligned(manifest,sequence_kwargs):
+    x,y,w=_unaugmented_batch(manifest,sequence_kwargs)
+    labels=np.eye(sequence_kwargs['nb_classes'],dtype=y.dtype)[np.argmax(x,axis=-1)]
+    ax,ay,_=augment_batch((x,labels,w),crop=CROP)
+    assert ax.shape[1:3]==(CROP,CROP)
+    assert ay.shape[1:3]==(CROP,CROP)
+    expected=np.eye(sequence_kwargs['nb_classes'],dtype=y.dtype)[np.argmax(ax.numpy(),axis=-1)]
+    assert np.array_equal(ay.numpy(),expected)
+
+
+def test_non_square_batches_are_not_transposed():
+    images=np.arange(2*4*6*1,dtype=np.float32).reshape(2,4,6,1)
+    signature=(tf.TensorSpec((None,None,None,1)),tf.TensorSpec((None,None,None,1)))
+    augment=tf.function(lambda x,y: augment_batch((x,y)),input_signature=signature)
+    for _ in range(8):
+        ax,ay=augment(images,images)
+        assert tuple(ax.shape)==images.shape
+        assert np.array_equal(ax.numpy(),ay.numpy())
+
+
+def test_seeded_dataset_augmentation(manifest,sequence_kwargs):
+    batch=_unaugmented_batch(manifest,sequence_kwargs)
+    def _dataset():
+        ds=tf.data.Dataset.from_tensors(batch).repeat(4)
+        return augment_dataset(ds,seed=SEED,deterministic=True)
+    first=_dataset()
+    epochs=[[b[0].numpy() for b in first] for _ in range(2)]
+    repeated=[b[0].numpy() for b in _dataset()]
+    assert all(np.array_equal(a,b) for a,b in zip(epochs[0],repeated))
+    assert not all(np.array_equal(a,b) for a,b in zip(epochs[0],epochs[1]))
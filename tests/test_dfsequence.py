@@ -0,0 +1,240 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+
+
+#
+# CONSTANTS
+#
+SEED=7
+
+
+
+#
+# HELPERS
+#
+def _sequence(manifest,sequence_kwargs,**kwargs):
+    kwargs.setdefault('seed',SEED)
+    kwargs.setdefault('augment',True)
+    return DFSequence(manifest,**dict(sequence_kwargs,**kwargs))
+
+
+def _copy(batch):
+    """ copy of (nested) batch arrays """
+    if isinstance(batch,(list,tuple)):
+        return [_copy(b) for b in batch]
+    else:
+        return np.array(batch)
+
+
+def _epoch(sequence):
+    batches=[_copy(sequence[i]) for i in range(len(sequence))]
+    sequence.on_epoch_end()
+    return batches
+
+
+def _assert_equal(batches,expected):
+    assert len(batches)==len(expected)
+    for batch,expected_batch in zip(batches,expected):
+        if isinstance(expected_batch,list):
+            _assert_equal(batch,expected_batch)
+        else:
+            assert batch.dtype==expected_batch.dtype
+            assert np.array_equal(batch,expected_batch)
+
+
+
+
+#
+# TESTS
+#
+def test_threaded_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    threaded=_sequence(manifest,sequence_kwargs,num_workers=3)
+    for _ in range(2):
+        _assert_equal(_epoch(threaded),_epoch(serial))
+    threaded.close()
+
+
+def test_process_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    processes=_sequence(manifest,sequence_kwargs,num_workers=2,worker_type='processes')
+    try:
+        for _ in range(2):
+            _assert_equal(_epoch(processes),_epoch(serial))
+    finally:
+        processes.close()
+
+
+def test_reused_buffers_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    buffered=_sequence(manifest,sequence_kwargs,reuse_buffers=True,nb_buffers=2)
+    batches=[buffered[i] for i in range(2)]
+    assert batches[0][0] is not batches[1][0]
+    assert buffered[2][0] is batches[0][0]
+    buffered.on_epoch_end()
+    serial.on_epoch_end()
+    _assert_equal(_epoch(buffered),_epoch(serial))
+
+
+def test_cached_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    cached=_sequence(manifest,sequence_kwargs,cache_bytes=2**28)
+    for _ in range(2):
+        _assert_equal(_epoch(cached),_epoch(serial))
+    assert cached.cache.hits>0
+
+
+def test_array_cache_evicts_least_recently_used():
+    from tfbox.loaders.cache import ArrayCache
+    cache=ArrayCache(max_bytes=3*80)
+    for i in range(3):
+        cache.put(i,np.zeros(10))
+    assert cache.get(0) is not None
+    cache.put(3,np.zeros(10))
+    assert cache.get(1) is None
+    assert all(cache.get(k) is not None for k in [0,2,3])
+    assert cache.nbytes==3*80
+    with pytest.raises(ValueError):
+        cache.get(0)[0]=1
+
+
+def test_disk_cached_batches_match_serial(manifest,sequence_kwargs,tmp_path):
+    serial=_sequence(manifest,sequence_kwargs)
+    expected=_epoch(serial)
+    first=_sequence(manifest,sequence_kwargs,cache_dir=str(tmp_path/'cache'))
+    _assert_equal(_epoch(first),expected)
+    assert first.disk_cache.misses>0
+    second=_sequence(manifest,sequence_kwargs,cache_dir=str(tmp_path/'cache'))
+    _assert_equal(_epoch(second),expected)
+    assert second.disk_cache.hits>0
+    assert second.disk_cache.misses==0
+
+
+def test_prefetched_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    prefetched=_sequence(manifest,sequence_kwargs,prefetch=2,num_workers=2)
+    try:
+        for _ in range(2):
+            _assert_equal(_epoch(prefetched),_epoch(serial))
+        batches=[_copy(prefetched[i]) for i in [3,0,1]]
+        _assert_equal(batches,[_copy(serial[i]) for i in [3,0,1]])
+    finally:
+        prefetched.close()
+
+
+def test_profiled_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs)
+    profiled=_sequence(manifest,sequence_kwargs,profile=True)
+    _assert_equal(_epoch(profiled),_epoch(serial))
+    summary=profiled.profiler.summary(-1)
+    nb_batches=len(profiled)
+    nb_examples=nb_batches*profiled.batch_size
+    assert summary['stages']['batch']['count']==nb_batches
+    assert summary['stages']['read']['count']==2*nb_examples
+    assert summary['counters']['bytes_decoded']>0
+
+
+def test_coalesced_batches_match_serial(manifest,sequence_kwargs):
+    serial=_sequence(manifest,sequence_kwargs,colocate_windows=True,profile=True)
+    coalesced=_sequence(
+        manifest,
+        sequence_kwargs,
+        colocate_windows=True,
+        coalesce_windows=True,
+        profile=True)
+    _assert_equal(_epoch(coalesced),_epoch(serial))
+    reads=[s.profiler.summary(-1)['stages']['read']['count'] for s in [coalesced,serial]]
+    assert reads[0]<reads[1]
+
+
+def test_colocated_windows_share_batches(manifest,sequence_kwargs):
+    sequence=_sequence(manifest,sequence_kwargs,colocate_windows=True)
+    for i in range(len(sequence)):
+        sequence.select_batch(i)
+        tiles={r['tile'] for r in sequence.batch_rows}
+        assert len(tiles)==1
+
+
+@pytest.mark.parametrize('group_maps',[
+    [{'indices': [0,1]},{'indices': [2,3,4]}],
+    [1,{'indices': [1,2]},{'indices': [3,4],'method': 'avg'},0] ])
+def test_numpy_grouping_matches_groups_layer(manifest,sequence_kwargs,group_maps):
+    from tfbox.nn.addons import Groups
+    sequence=_sequence(manifest,sequence_kwargs,group_maps=group_maps)
+    for i in range(2):
+        x,(y,grouped),w=sequence[i]
+        expected=Groups(group_maps)(y).numpy()
+        assert grouped.dtype==y.dtype
+        assert np.allclose(grouped,expected)
+
+
+def test_seeded_shards_are_disjoint(manifest,sequence_kwargs):
+    count=3
+    full=_sequence(manifest,sequence_kwargs)
+    shards=[_sequence(manifest,sequence_kwargs) for _ in range(count)]
+    for index,shard in enumerate(shards):
+        shard.shard(index,count)
+    for _ in range(2):
+        assert len({len(s) for s in shards})==1
+        assert len(shards[0])==len(full)//count
+        idents=[s.idents for s in shards]
+        assert len(np.unique(np.concatenate(idents)))==sum(len(i) for i in idents)
+        assert set(np.concatenate(idents))<=set(full.idents)
+        for shard in shards:
+            shard.on_epoch_end()
+        full.on_epoch_end()
+    with pytest.raises(ValueError):
+        _sequence(manifest,sequence_kwargs,seed=None).shard(0,count)
+
+
+def test_shard_state_is_restored(manifest,sequence_kwargs):
+    shard=_sequence(manifest,sequence_kwargs)
+    shard.shard(1,2)
+    shard[0]
+    restored=_sequence(manifest,sequence_kwargs)
+    restored.load_state_dict(shard.state_dict())
+    assert (restored.shard_index,restored.shard_count)==(1,2)
+    _assert_equal(
+        [_copy(restored[i]) for i in range(len(restored))],
+        [_copy(shard[i]) for i in range(1,len(shard))])
+
+
+def _variable_shape_data(manifest,sequence_kwargs):
+    import pandas as pd
+    data=pd.read_csv(manifest,converters=sequence_kwargs.pop('converters'))
+    tiles=data.tile.str[1:].astype(int)
+    heights=np.where(tiles%2,16,32)
+    data['window']=[
+        str((32*(w%2),32*(w//2),32,h)) for w,h in zip(data.win_index.tolist(),heights.tolist()) ]
+    return data
+
+
+def test_bucketed_batches_match_examples(manifest,sequence_kwargs):
+    data=_variable_shape_data(manifest,sequence_kwargs)
+    bucketed=_sequence(data,sequence_kwargs,bucket_shapes=True,augment=False)
+    plain=_sequence(data,sequence_kwargs,augment=False)
+    assert sorted(bucketed.buckets)==[(16,32),(32,32)]
+    assert len(bucketed)==int((bucketed.bucket_counts//bucketed.batch_size).sum())
+    idents=[]
+    for i in range(len(bucketed)):
+        x,y,w=bucketed[i]
+        idents+=list(bucketed.batch_idents)
+        for b,row in enumerate(bucketed.batch_rows):
+            expected=plain._read_example(row.name,set_augment=False,onehot=True)
+            assert np.array_equal(x[b],expected[0])
+            assert np.array_equal(y[b],expected[1])
+    assert len(set(idents))==len(idents)
+
+
+def test_bucketed_augmentation_keeps_shapes(manifest,sequence_kwargs):
+    data=_variable_shape_data(manifest,sequence_kwargs)
+    bucketed=_sequence(data,sequence_kwargs,bucket_shapes=True)
+    for _ in range(2):
+        for x,y,w in _epoch(bucketed):
+            assert x.shape[1:3]==y.shape[1:3]
+            assert x.shape[1:3] in [(16,32),(32,32)]
+    for x,y,w in bucketed.as_dataset():
+        assert tuple(x.shape[1:3]) in [(16,32),(32,32)]
+        assert x.shape[1:3]==y.shape[1:3]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence, sparse_dtype
+from tfbox.loaders.packed import pack, PackedSequence
+from tfbox.loaders import tfrecords
+
+
+#
+# HELPERS
+#
+def _packed(sequence,directory,**kwargs):
+    pack(sequence,str(directory),noisy=False)
+    return PackedSequence(str(directory),**kwargs)
+
+
+
+
+#
+# TESTS
+#
+def test_packed_batches_match_dfsequence(manifest,sequence_kwargs,tmp_path):
+    sequence=DFSequence(manifest,shuffle=False,augment=False,**sequence_kwargs)
+    packed=_packed(sequence,tmp_path/'packed',shuffle=False)
+    assert len(packed)==len(sequence)
+    for i in range(len(sequence)):
+        for a,b in zip(packed[i],sequence[i]):
+            assert a.dtype==b.dtype
+            assert np.array_equal(a,b)
+
+
+def test_onehot_targets_are_packed_as_sparse_dtype(manifest,sequence_kwargs,tmp_path):
+    sequence=DFSequence(manifest,shuffle=False,augment=False,**sequence_kwargs)
+    nb_classes=sequence_kwargs['nb_classes']
+    packed=_packed(sequence,tmp_path/'packed')
+    target_field=[f for f in packed.fields if f.name=='target'][0]
+    assert target_field.dtype==sparse_dtype(nb_classes)
+    index=tfrecords.write_tfrecords(sequence,str(tmp_path/'records'),noisy=False)
+    assert index['specs'][1]['dtype']==np.dtype(sparse_dtype(nb_classes)).name
+
+
+def test_non_square_examples_are_augmented(manifest,sequence_kwargs,tmp_path):
+    data=pd.read_csv(manifest,converters=sequence_kwargs.pop('converters'))
+    data['window']=[str((x,y,32,16)) for x,y in zip(data.win_index%2*32,data.win_index//2*32)]
+    sequence=DFSequence(data,shuffle=False,augment=False,**sequence_kwargs)
+    packed=_packed(sequence,tmp_path/'packed',augment=True)
+    for _ in range(3):
+        for i in range(len(packed)):
+            x,y,w=packed[i]
+            assert x.shape[1:3]==(16,32)
+            assert y.shape[1:3]==(16,32)
+        packed.on_epoch_end()
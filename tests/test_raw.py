@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.nn.addons import Normalize
+
+
+#
+# HELPERS
+#
+def _pair(manifest,**kwargs):
+    normalized=DFSequence(manifest,augment=False,shuffle=False,**kwargs)
+    raw=DFSequence(manifest,augment=False,shuffle=False,input_format='raw',**kwargs)
+    return normalized, raw
+
+
+
+
+#
+# TESTS
+#
+@pytest.mark.parametrize('stats',[
+    dict(),
+    dict(input_bands=[1,3]),
+    dict(means_column=None,stdevs_column=None,means=1000.0,stdevs=500.0),
+    dict(means_column=None,stdevs_column=None,means=1000.0,stdevs=500.0,input_bands=[1,3]),
+    dict(means_column=None,stdevs_column=None,means=1000.0),
+    dict(means_column=None,stdevs_column=None,means=[1000,1200,1400,1600],stdevs=500.0) ])
+def test_raw_normalize_matches_normalized(manifest,sequence_kwargs,stats):
+    sequence_kwargs.update(stats)
+    normalized,raw=_pair(manifest,**sequence_kwargs)
+    x,y,w=normalized[0]
+    (raw_x,raw_stats),raw_y,raw_w=raw[0]
+    assert raw_x.dtype==np.uint16
+    assert raw_stats.shape==(x.shape[0],2,x.shape[-1])
+    assert np.allclose(Normalize()([raw_x,raw_stats]).numpy(),x,atol=1e-4)
+    assert np.array_equal(raw_y,y)
+    assert np.array_equal(raw_w,w)
+
+
+def test_raw_rejects_band_indices(manifest,sequence_kwargs):
+    with pytest.raises(ValueError):
+        DFSequence(manifest,input_format='raw',band_indices=['ndvi'],**sequence_kwargs)
@@ -0,0 +1,261 @@
+import os
+import time
+import pickle
+import threading
+import functools
+import http.server
+import socketserver
+import pytest
+from tfbox.loaders.remote import RemoteReader, RemoteError
+
+
+#
+# CONSTANTS
+#
+NB_FILES=8
+FILE_SIZE=2**16
+SLOW_CHUNKS=6
+SLOW_DELAY=0.1
+
+
+
+#
+# LOCAL SERVER
+#
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    """ static files with fail-once, redirect and slow routes (requests are logged on the server) """
+    protocol_version='HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.path,dict(self.headers)))
+        if self.path.startswith('/fail-once/'):
+            if self.path not in self.server.failed:
+                self.server.failed.add(self.path)
+                return self._empty(503)
+            self.path=self.path[len('/fail-once'):]
+        elif self.path.startswith('/redirect/'):
+            location=f'{self.server.redirect_origin}/{self.path[len("/redirect/"):]}'
+            self.send_response(302)
+            self.send_header('Location',location)
+            self.send_header('Content-Length','0')
+            self.end_headers()
+            return
+        elif self.path=='/slow':
+            return self._slow()
+        return super().do_GET()
+
+
+    def log_message(self,*args):
+        pass
+
+
+    def _empty(self,status):
+        self.send_response(status)
+        self.send_header('Content-Length','0')
+        self.end_headers()
+
+
+    def _slow(self):
+        chunk=b'x'*1024
+        self.send_response(200)
+        self.send_header('Content-Length',str(len(chunk)*SLOW_CHUNKS))
+        self.end_headers()
+        for _ in range(SLOW_CHUNKS):
+            time.sleep(SLOW_DELAY)
+            self.wfile.write(chunk)
+            self.wfile.flush()
+
+
+
+
+class _Server(socketserver.ThreadingMixIn,http.server.HTTPServer):
+    daemon_threads=True
+    request_queue_size=128
+
+
+
+
+def _serve(directory):
+    server=_Server(('127.0.0.1',0),functools.partial(_Handler,directory=str(directory)))
+    server.requests=[]
+    server.failed=set()
+    server.redirect_origin=None
+    server.origin=f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def files(tmp_path):
+    directory=tmp_path/'files'
+    directory.mkdir()
+    for i in range(NB_FILES):
+        (directory/f'f{i}.bin').write_bytes(os.urandom(FILE_SIZE))
+    return directory
+
+
+@pytest.fixture
+def server(files):
+    server=_serve(files)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def reader(tmp_path):
+    reader=RemoteReader(directory=str(tmp_path/'downloads'),backoff=0.01)
+    yield reader
+    reader.close()
+
+
+
+
+#
+# TESTS
+#
+def test_fetch_and_release(server,files,reader):
+    urls=[f'{server.origin}/f{i}.bin' for i in range(NB_FILES)]
+    paths=reader.fetch(urls,key=0)
+    for i,url in enumerate(urls):
+        with open(paths[url],'rb') as file:
+            assert file.read()==(files/f'f{i}.bin').read_bytes()
+    reader.release(0)
+    time.sleep(0.1)
+    assert not os.listdir(reader.directory)
+
+
+def test_shared_files_released_by_last_key(server,reader):
+    url=f'{server.origin}/f0.bin'
+    path=reader.fetch([url],key=0)[url]
+    reader.fetch([url],key=1)
+    reader.release(0)
+    time.sleep(0.1)
+    assert os.path.exists(path)
+    reader.release(1)
+    time.sleep(0.1)
+    assert not os.path.exists(path)
+
+
+def test_retry(server,reader):
+    url=f'{server.origin}/fail-once/f0.bin'
+    reader.fetch([url],key=0)
+    assert len([p for p,_ in server.requests if p=='/fail-once/f0.bin'])==2
+
+
+def test_missing_file_raises(server,reader):
+    with pytest.raises(RemoteError):
+        reader.fetch([f'{server.origin}/missing.bin'])
+
+
+def test_failed_download_is_requested_again(server,tmp_path):
+    reader=RemoteReader(directory=str(tmp_path/'downloads'),retries=0)
+    url=f'{server.origin}/fail-once/f0.bin'
+    with pytest.raises(RemoteError):
+        reader.fetch([url],key=0)
+    reader.release(0)
+    path=reader.fetch([url],key=0)[url]
+    assert os.path.getsize(path)==FILE_SIZE
+    reader.close()
+
+
+def test_failed_batch_fetch_is_released(manifest,sequence_kwargs):
+    pytest.importorskip('imagebox')
+    import pandas as pd
+    from tfbox.loaders.dfsequence import DFSequence
+    directory=os.path.dirname(manifest)
+    server=_serve(directory)
+    try:
+        data=pd.read_csv(manifest,converters=sequence_kwargs.pop('converters'))
+        for col in ['input','target']:
+            data[col]=[f'{server.origin}/{os.path.basename(p)}' for p in data[col]]
+        data.loc[0,'input']=f'{server.origin}/missing.tif'
+        sequence=DFSequence(
+            data,
+            shuffle=False,
+            augment=False,
+            remote_fetch={'retries': 0},
+            remote_lookahead=0,
+            **sequence_kwargs)
+        with pytest.raises(RemoteError):
+            sequence[0]
+        assert not sequence.remote._keys
+        assert sequence[1][0].shape[0]==sequence.batch_size
+        sequence.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_credentials_dropped_on_cross_origin_redirect(server,files,tmp_path):
+    other=_serve(files)
+    try:
+        reader=RemoteReader(
+            directory=str(tmp_path/'downloads'),
+            headers={'Authorization': 'Bearer SECRET'})
+        server.redirect_origin=server.origin
+        reader.fetch([f'{server.origin}/redirect/f0.bin'])
+        assert server.requests[-1][1].get('Authorization')=='Bearer SECRET'
+        server.redirect_origin=other.origin
+        reader.fetch([f'{server.origin}/redirect/f1.bin'])
+        assert server.requests[-1][1].get('Authorization')=='Bearer SECRET'
+        assert other.requests[-1][0]=='/f1.bin'
+        assert 'Authorization' not in other.requests[-1][1]
+        reader.close()
+    finally:
+        other.shutdown()
+        other.server_close()
+
+
+def test_timeout_is_per_read(server,tmp_path):
+    reader=RemoteReader(
+        directory=str(tmp_path/'downloads'),
+        timeout=SLOW_DELAY*(SLOW_CHUNKS-1),
+        retries=0)
+    url=f'{server.origin}/slow'
+    path=reader.fetch([url])[url]
+    assert os.path.getsize(path)==1024*SLOW_CHUNKS
+    reader.close()
+
+
+def test_concurrent_readers_share_directory(server,files,reader):
+    url=f'{server.origin}/f0.bin'
+    copies=[pickle.loads(pickle.dumps(reader)) for _ in range(4)]
+    threads=[ threading.Thread(target=c.fetch,args=([url],)) for c in copies ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert os.listdir(reader.directory)==[os.path.basename(reader.local_path(url))]
+    with open(reader.local_path(url),'rb') as file:
+        assert file.read()==(files/'f0.bin').read_bytes()
+    for c in copies:
+        c.close()
+
+
+def test_failed_body_leaves_no_partial_file(server,tmp_path):
+    reader=RemoteReader(directory=str(tmp_path/'downloads'),timeout=SLOW_DELAY/2,retries=0)
+    with pytest.raises(Exception):
+        reader.fetch([f'{server.origin}/slow'])
+    assert not os.listdir(reader.directory)
+    reader.close()
+
+
+def test_pickled_reader_shares_directory(server,reader):
+    url=f'{server.origin}/f0.bin'
+    path=reader.fetch([url],key=0)[url]
+    copy=pickle.loads(pickle.dumps(reader))
+    assert copy.fetch([url],key=0)[url]==path
+    copy.release(0)
+    copy.close()
+    assert os.path.exists(path)
+
+
+def test_head_collects_errors(server,reader):
+    urls=[f'{server.origin}/f0.bin',f'{server.origin}/missing.bin']
+    heads,errors=reader.head(urls,raise_errors=False)
+    assert int(heads[urls[0]]['content-length'])==FILE_SIZE
+    assert list(errors)==[urls[1]]
+    assert isinstance(errors[urls[1]],RemoteError)
+    with pytest.raises(RemoteError):
+        reader.head(urls)
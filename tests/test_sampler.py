@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.loaders.sampler import class_index, AliasSampler, ClassSampler
+
+
+#
+# CONSTANTS
+#
+SEED=11
+NB_DRAWS=200000
+
+
+
+#
+# HELPERS
+#
+def _histograms(sequence):
+    """ class histograms of the (un-augmented, windowed) targets read one row at a time """
+    nb_classes=sequence.nb_classes
+    counts=[]
+    for p in range(len(sequence.data)):
+        row=sequence.table.row(p)
+        sequence.handler.set_window(window=sequence._window(row))
+        sequence.handler.set_augmentation(k=False,flip=False)
+        targ=np.asarray(sequence.get_target(row,onehot=False)).astype(np.int64).ravel()
+        counts.append(np.bincount(targ,minlength=nb_classes))
+    return np.array(counts)
+
+
+
+
+#
+# TESTS
+#
+def test_class_index_matches_targets(manifest,sequence_kwargs,tmp_path):
+    sequence=DFSequence(manifest,**sequence_kwargs)
+    path=str(tmp_path/'index.npz')
+    counts=class_index(sequence,path=path,noisy=False)
+    assert np.array_equal(counts,_histograms(sequence))
+    cropped=DFSequence(manifest,cropping=4,**sequence_kwargs)
+    cropped_counts=class_index(cropped,path=path,noisy=False)
+    assert np.array_equal(cropped_counts,_histograms(cropped))
+    assert not np.array_equal(cropped_counts,counts)
+
+
+def test_alias_sampler_frequencies():
+    weights=np.array([0,1,2,3,4],dtype=np.float64)
+    draws=AliasSampler(weights).sample(NB_DRAWS,np.random.default_rng(SEED))
+    frequencies=np.bincount(draws,minlength=len(weights))/NB_DRAWS
+    assert frequencies[0]==0
+    assert np.allclose(frequencies,weights/weights.sum(),atol=0.01)
+
+
+def test_class_sampler_epochs(manifest,sequence_kwargs):
+    sequence=DFSequence(manifest,seed=SEED,**sequence_kwargs)
+    weights=np.zeros(len(sequence.groups))
+    weights[::2]=1
+    sequence.set_sampler(ClassSampler(weights,nb_samples=3*sequence.batch_size))
+    assert len(sequence)==3
+    for _ in range(2):
+        sampled=set()
+        for i in range(len(sequence)):
+            sequence.select_batch(i)
+            sampled.update(sequence.batch_idents)
+        assert sampled<=set(sequence.groups[::2])
+        sequence.on_epoch_end()
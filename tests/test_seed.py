@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+
+
+#
+# HELPERS
+#
+def _sequences(manifest,sequence_kwargs,**kwargs):
+    return [
+        DFSequence(manifest,augment=True,**kwargs,**sequence_kwargs)
+        for _ in range(2) ]
+
+
+def _equal(a,b):
+    return all(np.array_equal(x,y) for x,y in zip(a,b))
+
+
+
+
+#
+# TESTS
+#
+def test_seeded_batches_repeat(manifest,sequence_kwargs):
+    first,second=_sequences(manifest,sequence_kwargs,seed=5)
+    for _ in range(2):
+        assert np.array_equal(first.idents,second.idents)
+        for i in range(len(first)):
+            assert _equal(first[i],second[i])
+        first.on_epoch_end()
+        second.on_epoch_end()
+
+
+def test_seeded_select_and_get_repeat(manifest,sequence_kwargs):
+    sequence_kwargs.update(group_column='tile',window_index_column=None)
+    first,second=_sequences(manifest,sequence_kwargs,seed=5)
+    for _ in range(4):
+        first.select()
+        second.select()
+        assert first.index==second.index
+        assert first.row.name==second.row.name
+    for i in range(4):
+        assert _equal(first.get(i),second.get(i))
+        assert first.row.name==second.row.name
+
+
+def test_float_cropping_rejects_seed(manifest,sequence_kwargs):
+    with pytest.raises(ValueError,match='float_cropping'):
+        DFSequence(manifest,seed=0,float_cropping=2,**sequence_kwargs)
+    sequence=DFSequence(manifest,float_cropping=2,**sequence_kwargs)
+    state=sequence.state_dict()
+    state['seed']=0
+    with pytest.raises(ValueError,match='float_cropping'):
+        sequence.load_state_dict(state)
+    assert sequence.seed is None
+
+
+@pytest.mark.parametrize('seed',[None,5])
+def test_as_dataset_resumes_restored_state(manifest,sequence_kwargs,seed):
+    augment=seed is not None
+    source=DFSequence(manifest,seed=seed,augment=augment,**sequence_kwargs)
+    for i in range(2):
+        source[i]
+    restored=DFSequence(manifest,seed=seed,augment=augment,**sequence_kwargs)
+    restored.load_state_dict(source.state_dict())
+    batches=list(restored.as_dataset(deterministic=True))
+    assert len(batches)==len(source)-2
+    for i,(x,y,w) in enumerate(batches):
+        expected=source[i+2]
+        assert _equal([x.numpy(),y.numpy(),w.numpy()],expected)
+    assert restored.epoch==source.epoch+1
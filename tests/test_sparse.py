@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+import tensorflow as tf
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox import losses
+
+
+#
+# CONSTANTS
+#
+SEED=3
+GROUP_MAPS=[{'a': [0,1]},{'b': [2,3]}]
+
+
+
+#
+# TESTS
+#
+def test_sparse_targets_match_onehot_targets(manifest,sequence_kwargs):
+    nb_classes=sequence_kwargs['nb_classes']
+    nb_groups=len(GROUP_MAPS)
+    onehot=DFSequence(manifest,seed=SEED,group_maps=GROUP_MAPS,**sequence_kwargs)
+    sparse=DFSequence(
+        manifest,
+        seed=SEED,
+        group_maps=GROUP_MAPS,
+        target_format='sparse',
+        **sequence_kwargs)
+    for i in range(len(onehot)):
+        x,(y,grouped),w=onehot[i]
+        sparse_x,(sparse_y,sparse_grouped),sparse_w=sparse[i]
+        assert np.array_equal(sparse_x,x)
+        assert sparse_y.dtype==np.uint8
+        assert np.array_equal(np.eye(nb_classes,dtype=y.dtype)[sparse_y],y)
+        assert np.array_equal(np.eye(nb_groups+1,dtype=y.dtype)[sparse_grouped][...,:nb_groups],grouped)
+
+
+@pytest.mark.parametrize('loss_func,kwargs',[
+    ('categorical_crossentropy',{}),
+    ('weighted_categorical_crossentropy',{'weights': [1,2,3,4,5]}) ])
+def test_sparse_losses_match_onehot_losses(loss_func,kwargs):
+    rng=np.random.default_rng(0)
+    targ=rng.integers(0,5,size=(2,8,8)).astype(np.uint8)
+    pred=tf.nn.softmax(rng.normal(size=(2,8,8,5)).astype(np.float32))
+    expected=losses.get(loss_func,**kwargs)(np.eye(5,dtype=np.float32)[targ],pred)
+    loss=losses.get(loss_func,sparse=True,**kwargs)(targ,pred)
+    assert np.allclose(loss,expected,atol=1e-5)
@@ -0,0 +1,68 @@
+import gc
+import weakref
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.loaders.streaming import StreamingDFSequence, manifest_chunks
+
+
+#
+# CONSTANTS
+#
+CHUNK_BYTES=1000
+
+
+
+#
+# TESTS
+#
+def test_unshuffled_batches_match_dfsequence(manifest,sequence_kwargs):
+    sequence=DFSequence(manifest,shuffle=False,augment=False,**sequence_kwargs)
+    streaming=StreamingDFSequence(
+        manifest,
+        chunk_bytes=2**20,
+        shuffle=False,
+        augment=False,
+        **sequence_kwargs)
+    batches=list(streaming)
+    assert len(batches)==len(sequence)
+    for i,(x,y,w) in enumerate(batches):
+        expected_x,expected_y,expected_w=sequence[i]
+        assert np.array_equal(x,expected_x)
+        assert np.array_equal(y,expected_y)
+        assert np.array_equal(w,expected_w)
+
+
+def test_seeded_epochs_repeat(manifest,sequence_kwargs):
+    kwargs=dict(chunk_bytes=CHUNK_BYTES,shuffle_buffer=8,seed=3,augment=True)
+    first=list(StreamingDFSequence(manifest,**kwargs,**sequence_kwargs))
+    second=list(StreamingDFSequence(manifest,**kwargs,**sequence_kwargs))
+    assert len(first)==len(second)
+    for a,b in zip(first,second):
+        assert np.array_equal(a[0],b[0])
+
+
+def test_shuffle_buffer_does_not_keep_chunks(manifest,sequence_kwargs):
+    streaming=StreamingDFSequence(
+        manifest,
+        chunk_bytes=CHUNK_BYTES,
+        shuffle_buffer=10**6,
+        seed=0,
+        **sequence_kwargs)
+    assert len(manifest_chunks(manifest,CHUNK_BYTES))>2
+    chunks=[]
+    chunk_sequence=streaming.chunk_sequence
+    def _chunk_sequence(chunk):
+        sequence=chunk_sequence(chunk)
+        chunks.append(weakref.ref(sequence))
+        return sequence
+    streaming.chunk_sequence=_chunk_sequence
+    items=list(streaming._items())
+    gc.collect()
+    assert len(chunks)==len(manifest_chunks(manifest,CHUNK_BYTES))
+    assert all(ref() is None for ref in chunks)
+    record,_=items[0]
+    assert record[sequence_kwargs['sample_weight_column']]==streaming.sequence._read_row(
+        record,
+        set_augment=False)[-1]
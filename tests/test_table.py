@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.loaders.table import Table, compact
+
+
+#
+# TESTS
+#
+def test_table_rows_match_dataframe():
+    data=compact(pd.DataFrame({
+        'path': ['a.tif','b.tif',None,'a.tif'],
+        'weight': [0.5,1.0,1.5,2.0],
+        'index': [3,2,1,0] }),float32_columns=['weight'])
+    table=Table(data,{'window': np.arange(8,dtype=np.int32).reshape(4,2)})
+    assert table.columns==['path','weight','index','window']
+    for p in range(len(data)):
+        row=table.row(p)
+        for c in data.columns:
+            expected=data[c].iloc[p]
+            assert (row[c]==expected) or (pd.isna(row[c]) and pd.isna(expected))
+        assert row['window']==(2*p,2*p+1)
+    assert pd.Series(table.column('path')).equals(pd.Series(data['path'].to_numpy()))
+
+
+def test_windows_are_read_from_the_windows_array(manifest,sequence_kwargs):
+    sequence=DFSequence(manifest,shuffle=False,**sequence_kwargs)
+    assert sequence.window_column not in sequence.data.columns
+    assert sequence.windows.dtype==np.int32
+    source=pd.read_csv(manifest)
+    windows={
+        (r.tile,r.win_index): eval(r.window)
+        for r in source.itertuples() }
+    for p in range(len(sequence.data)):
+        row=sequence.table.row(p)
+        assert row['window']==windows[(row['tile'],row['win_index'])]
+        assert row['window']==sequence._window(row)
+    sequence.select(0)
+    assert list(sequence.matched_rows['window'])==[sequence.row['window']]
+
+
+def test_packed_rows_keep_windows(manifest,sequence_kwargs,tmp_path):
+    from tfbox.loaders.packed import pack, PackedSequence
+    sequence=DFSequence(manifest,shuffle=False,**sequence_kwargs)
+    pack(sequence,str(tmp_path/'packed'),noisy=False)
+    packed=PackedSequence(str(tmp_path/'packed'),shuffle=False)
+    packed.select_batch(0)
+    for p,row in zip(packed.batch_positions,packed.batch_rows):
+        assert row['window']==sequence.table.row(p)['window']
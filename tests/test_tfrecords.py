@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+pytest.importorskip('imagebox')
+from tfbox.loaders.dfsequence import DFSequence
+from tfbox.loaders import tfrecords
+
+
+#
+# CONSTANTS
+#
+RECORDS_PER_SHARD=5
+
+
+
+#
+# TESTS
+#
+def test_tfrecord_batches_match_dfsequence(manifest,sequence_kwargs,tmp_path):
+    sequence=DFSequence(manifest,shuffle=False,augment=False,**sequence_kwargs)
+    directory=str(tmp_path/'records')
+    index=tfrecords.write_tfrecords(
+        sequence,
+        directory,
+        records_per_shard=RECORDS_PER_SHARD,
+        row_keys=['region'],
+        noisy=False)
+    assert len(index['shards'])==int(np.ceil(len(sequence.groups)/RECORDS_PER_SHARD))
+    ds=tfrecords.tfrecord_dataset(directory,shuffle=False,deterministic=True,with_rows=True)
+    batches=list(ds)
+    assert len(batches)==len(sequence)
+    for i,(x,y,w,rows) in enumerate(batches):
+        expected_x,expected_y,expected_w=sequence[i]
+        assert np.array_equal(x.numpy(),expected_x)
+        assert np.array_equal(y.numpy(),expected_y)
+        assert np.array_equal(w.numpy(),expected_w)
+        assert [r.decode() for r in rows['region'].numpy()]==[
+            r['region'] for r in sequence.batch_rows ]
+
+
+def test_read_record_matches_example(manifest,sequence_kwargs,tmp_path):
+    sequence=DFSequence(manifest,shuffle=False,augment=False,**sequence_kwargs)
+    directory=str(tmp_path/'records')
+    tfrecords.write_tfrecords(sequence,directory,records_per_shard=RECORDS_PER_SHARD,noisy=False)
+    shard_index,record_index=divmod(7,RECORDS_PER_SHARD)
+    arrays=tfrecords.read_record(directory,shard_index,record_index)
+    expected=sequence._read_example(sequence.group_starts[7],set_augment=False)
+    assert len(arrays)==len(expected)
+    for a,b in zip(arrays,expected):
+        assert np.array_equal(a,b)
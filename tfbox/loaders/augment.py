@@ -0,0 +1,151 @@
+import tensorflow as tf
+
+
+#
+# CONSTANTS
+#
+AUTOTUNE=tf.data.experimental.AUTOTUNE
+NB_DRAWS=5
+CROP_SHAPE_ERROR='batch_augment: crops require inputs and targets with the same spatial shape ({} != {})'
+
+
+
+#
+# PUBLIC
+#
+def augment_batch(
+        batch,
+        flip=True,
+        rotate=True,
+        crop=None,
+        seed=None):
+    """ randomly flip/rotate/crop each example of an (inputs,targets[,weights]) batch
+
+    Every spatial tensor (the input image and each target) of an example gets
+    the same transform: an element of the dihedral group (a transpose followed
+    by vertical/horizontal flips, ie. `rot90(k)` with an optional flip) and a
+    random crop. Transforms are applied to the whole batch with `tf.where`
+    selects and gathers. Transposes are skipped for non-square batches
+    (checked at run time if the spatial dims are unknown). Input stats
+    (`input_format='raw'`) and sample weights are passed through.
+
+    Args:
+        - batch<tuple>: (inputs,targets[,weights]) with bands-last images
+        - flip<bool>: random vertical/horizontal flips
+        - rotate<bool>: random transposes (square batches only)
+        - crop<int|tuple|None>: (optional) (height,width) of random crops
+        - seed<tensor|None>: (optional) shape [2] seed for stateless draws
+
+    Returns:
+        augmented batch with the same structure
+    """
+    inpts,targs=batch[0],batch[1]
+    if isinstance(inpts,(tuple,list)):
+        image,stats=inpts[0],tuple(inpts[1:])
+    else:
+        image,stats=inpts,None
+    images=[tf.convert_to_tensor(im) for im in [image]+tf.nest.flatten(targs)]
+    batch_size=tf.shape(image)[0]
+    draws=_uniform([NB_DRAWS,batch_size],seed)
+    if rotate:
+        images=_transposes(images,draws[0]<0.5)
+    if flip:
+        images=[_select(draws[1]<0.5,tf.reverse(im,axis=[1]),im) for im in images]
+        images=[_select(draws[2]<0.5,tf.reverse(im,axis=[2]),im) for im in images]
+    if crop:
+        images=_crop(images,crop,draws[3],draws[4])
+    if stats is None:
+        inpts=images[0]
+    else:
+        inpts=(images[0],)+stats
+    targs=tf.nest.pack_sequence_as(targs,images[1:])
+    return (inpts,targs)+tuple(batch[2:])
+
+
+def augment_dataset(
+        dataset,
+        flip=True,
+        rotate=True,
+        crop=None,
+        seed=None,
+        deterministic=False):
+    """ map `augment_batch` over a dataset of (un-augmented) batches
+
+    Args:
+        - dataset<tf.data.Dataset>: (inputs,targets[,weights]) batches
+        - flip/rotate/crop: see `augment_batch`
+        - seed<int|None>:
+            (optional) if set each batch is augmented with the stateless
+            seed (seed,draw) where draws come from a seeded random dataset
+            that is re-randomized on each iteration (epoch), so runs are
+            reproducible but epochs differ
+        - deterministic<bool>: preserve batch order
+    """
+    if seed is None:
+        return dataset.map(
+            lambda *batch: augment_batch(batch,flip=flip,rotate=rotate,crop=crop),
+            num_parallel_calls=AUTOTUNE,
+            deterministic=deterministic)
+    def _augment(batch,draw):
+        batch_seed=tf.stack([tf.constant(seed,dtype=tf.int64),draw])
+        return augment_batch(batch,flip=flip,rotate=rotate,crop=crop,seed=batch_seed)
+    draws=tf.data.Dataset.random(seed=seed,rerandomize_each_iteration=True)
+    return tf.data.Dataset.zip((dataset,draws)).map(
+        _augment,
+        num_parallel_calls=AUTOTUNE,
+        deterministic=deterministic)
+
+
+
+
+#
+# INTERNAL
+#
+def _uniform(shape,seed):
+    if seed is None:
+        return tf.random.uniform(shape)
+    else:
+        return tf.random.stateless_uniform(shape,seed=seed)
+
+
+def _transposes(images,condition):
+    """ per-example transposes (skipped if the images are not square) """
+    def _transposed():
+        return [_select(condition,_transpose(im),im) for im in images]
+    height,width=images[0].shape[1],images[0].shape[2]
+    if (height is not None) and (width is not None):
+        if height==width:
+            return _transposed()
+        else:
+            return images
+    shape=tf.shape(images[0])
+    return tf.cond(tf.equal(shape[1],shape[2]),_transposed,lambda: list(images))
+
+
+def _transpose(im):
+    perm=[0,2,1]+list(range(3,im.shape.rank))
+    return tf.transpose(im,perm)
+
+
+def _select(condition,a,b):
+    """ per-example select """
+    condition=tf.reshape(condition,[-1]+[1]*(a.shape.rank-1))
+    return tf.where(condition,a,b)
+
+
+def _crop(images,crop,y_draws,x_draws):
+    """ per-example random crops (gathered rows and columns) """
+    if isinstance(crop,int):
+        crop=(crop,crop)
+    height,width=crop
+    shape=tf.shape(images[0])
+    for im in images[1:]:
+        if im.shape[1:3]!=images[0].shape[1:3]:
+            raise ValueError(CROP_SHAPE_ERROR.format(images[0].shape[1:3],im.shape[1:3]))
+    ys=tf.cast(y_draws*tf.cast(shape[1]-height+1,tf.float32),tf.int32)
+    xs=tf.cast(x_draws*tf.cast(shape[2]-width+1,tf.float32),tf.int32)
+    rows=ys[:,None]+tf.range(height)[None]
+    cols=xs[:,None]+tf.range(width)[None]
+    return [
+        tf.gather(tf.gather(im,rows,axis=1,batch_dims=1),cols,axis=2,batch_dims=1)
+        for im in images ]
@@ -0,0 +1,34 @@
+import numpy as np
+
+
+class BatchBuffers(object):
+    """ ring of pre-allocated batch arrays
+
+    Batches are written in place into the next set of arrays in the ring
+    instead of being built from lists. Arrays handed out are overwritten
+    after `nb_buffers` further calls to `next`.
+
+    Args:
+        - specs<list>: (shape,dtype) for each (flat) array of a single example
+        - batch_size<int>: batch size
+        - nb_buffers<int>: number of batches in the ring
+    """
+    def __init__(self,specs,batch_size,nb_buffers=2):
+        self.specs=specs
+        self.batch_size=batch_size
+        self.nb_buffers=nb_buffers
+        self.buffers=[
+            [np.empty((batch_size,)+tuple(shape),dtype=dtype) for shape,dtype in specs]
+            for _ in range(nb_buffers) ]
+        self.index=-1
+
+
+    def next(self):
+        """ return the next list of batch arrays in the ring """
+        self.index=(self.index+1)%self.nb_buffers
+        return self.buffers[self.index]
+
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for arrays in self.buffers for a in arrays)
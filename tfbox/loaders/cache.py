@@ -0,0 +1,307 @@
+import os
+import glob
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+#
+# CONSTANTS
+#
+NPY_EXT='.npy'
+TMP_EXT='.tmp'
+
+
+class ArrayCache(object):
+    """ in-memory LRU cache of arrays bounded by bytes
+
+    Values are numpy arrays or lists of numpy arrays. Cached arrays are set
+    read-only so consumers can not modify the cached data in place.
+
+    Args:
+        - max_bytes<int>: maximum total bytes of cached arrays
+    """
+    def __init__(self,max_bytes):
+        self.max_bytes=int(max_bytes)
+        self._data=OrderedDict()
+        self._lock=threading.Lock()
+        self.nbytes=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+
+    def get(self,key):
+        """ return cached value (and mark as recently used) or None """
+        with self._lock:
+            entry=self._data.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            self.hits+=1
+            self._data.move_to_end(key)
+            return entry[0]
+
+
+    def put(self,key,value):
+        """ cache value, evicting least-recently-used values as needed """
+        value=_read_only(value)
+        nbytes=_nbytes(value)
+        if nbytes>self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._data:
+                self.nbytes-=self._data.pop(key)[1]
+            while self._data and (self.nbytes+nbytes>self.max_bytes):
+                _,(_,evicted_bytes)=self._data.popitem(last=False)
+                self.nbytes-=evicted_bytes
+                self.evictions+=1
+            self._data[key]=(value,nbytes)
+            self.nbytes+=nbytes
+        return value
+
+
+    def clear(self):
+        with self._lock:
+            self._data=OrderedDict()
+            self.nbytes=0
+
+
+    def stats(self):
+        """ dict of cache counters """
+        return {
+            'size': len(self._data),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions }
+
+
+    def __len__(self):
+        return len(self._data)
+
+
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state['_lock']=None
+        return state
+
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._lock=threading.Lock()
+
+
+
+
+class DiskCache(object):
+    """ persistent on-disk cache of arrays read with memory-mapping
+
+    Arrays are written as `.npy` files (lists of arrays as one file per element)
+    and read back with `np.load(mmap_mode='r')`. File names are a hash of the 
+    key, the source-file's mtime/size and `config`, so changes to the source file
+    or config invalidate the cached data. Stale files are removed by the LRU 
+    cleanup (least recently used files are removed first once `max_bytes` is
+    exceeded).
+
+    Args:
+        - directory<str>: cache directory
+        - max_bytes<int|None>: maximum total bytes of cached files
+        - config<any>: configuration (ie. handler-config) included in the file hashes
+    """
+    def __init__(self,directory,max_bytes=None,config=None):
+        self.directory=directory
+        self.max_bytes=max_bytes
+        self.config_hash=_hash(config)
+        os.makedirs(directory,exist_ok=True)
+        self._lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.nbytes=sum(os.path.getsize(p) for p in self._files())
+        if self.max_bytes and (self.nbytes>self.max_bytes):
+            self._cleanup()
+
+
+    def get(self,key,source=None):
+        """ return memory-mapped cached value or None
+        
+        Args:
+            - key<hashable>: cache key
+            - source<str|None>: source path. if local, mtime/size validate the cache
+        """
+        paths,is_list=self._paths(self._name(key,source))
+        value=None
+        if paths:
+            try:
+                arrays=[np.load(p,mmap_mode='r') for p in paths]
+                for p in paths:
+                    os.utime(p)
+                if is_list:
+                    value=arrays
+                else:
+                    value=arrays[0]
+            except (FileNotFoundError,ValueError):
+                value=None
+        with self._lock:
+            if value is None:
+                self.misses+=1
+            else:
+                self.hits+=1
+        return value
+
+
+    def put(self,key,value,source=None):
+        """ write value to cache, then cleanup least-recently-used files as needed """
+        name=self._name(key,source)
+        if isinstance(value,(list,tuple)):
+            items=[(f'{name}-{i}{NPY_EXT}',v) for i,v in enumerate(value)]
+        else:
+            items=[(f'{name}{NPY_EXT}',value)]
+        nbytes=0
+        for fname,v in items:
+            path=os.path.join(self.directory,fname)
+            tmp_path=f'{path}.{os.getpid()}.{threading.get_ident()}{TMP_EXT}'
+            with open(tmp_path,'wb') as file:
+                np.save(file,np.asarray(v))
+            os.replace(tmp_path,path)
+            nbytes+=os.path.getsize(path)
+        with self._lock:
+            self.nbytes+=nbytes
+            if self.max_bytes and (self.nbytes>self.max_bytes):
+                self._cleanup()
+        return value
+
+
+    def clear(self):
+        for p in self._files():
+            _remove(p)
+        self.nbytes=0
+
+
+    def stats(self):
+        """ dict of cache counters """
+        return {
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions }
+
+
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state['_lock']=None
+        return state
+
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._lock=threading.Lock()
+
+
+    #
+    # INTERNAL
+    #
+    def _name(self,key,source):
+        return _hash((key,_source_stamp(source),self.config_hash))
+
+
+    def _paths(self,name):
+        """ returns (paths,is_list) for the cached files of name """
+        path=os.path.join(self.directory,f'{name}{NPY_EXT}')
+        if os.path.isfile(path):
+            return [path], False
+        paths=[]
+        while True:
+            path=os.path.join(self.directory,f'{name}-{len(paths)}{NPY_EXT}')
+            if os.path.isfile(path):
+                paths.append(path)
+            else:
+                return paths, True
+
+
+    def _files(self):
+        return glob.glob(os.path.join(self.directory,f'*{NPY_EXT}'))
+
+
+    def _cleanup(self):
+        """ remove least-recently-used files until under max_bytes (with 10% headroom) """
+        stats=[]
+        for p in self._files():
+            try:
+                st=os.stat(p)
+                stats.append((st.st_mtime,st.st_size,p))
+            except FileNotFoundError:
+                pass
+        self.nbytes=sum(s[1] for s in stats)
+        target_bytes=0.9*self.max_bytes
+        for _,size,p in sorted(stats):
+            if self.nbytes<=target_bytes:
+                break
+            if _remove(p):
+                self.nbytes-=size
+                self.evictions+=1
+
+
+
+
+#
+# HELPERS
+#
+def _nbytes(value):
+    if isinstance(value,(list,tuple)):
+        return sum(v.nbytes for v in value)
+    else:
+        return value.nbytes
+
+
+def _read_only(value):
+    if isinstance(value,(list,tuple)):
+        return [_read_only(v) for v in value]
+    else:
+        value=np.asarray(value)
+        value.setflags(write=False)
+        return value
+
+
+def _source_stamp(path):
+    if path is None:
+        return None
+    try:
+        st=os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except (OSError,ValueError):
+        return None
+
+
+def _hash(value):
+    return hashlib.md5(repr(_canonical(value)).encode()).hexdigest()
+
+
+def _canonical(value):
+    """ deterministic (address free) representation of nested config values """
+    if isinstance(value,dict):
+        return tuple(sorted((str(k),_canonical(v)) for k,v in value.items()))
+    elif isinstance(value,(list,tuple)):
+        return tuple(_canonical(v) for v in value)
+    elif isinstance(value,np.ndarray):
+        return (str(value.dtype),value.shape,value.tolist())
+    elif isinstance(value,(type,np.dtype)):
+        return str(value)
+    elif callable(value):
+        return f'{getattr(value,"__module__","")}.{getattr(value,"__qualname__",type(value).__name__)}'
+    elif hasattr(value,'__dict__'):
+        return (type(value).__name__,_canonical(vars(value)))
+    else:
+        return value
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
@@ -1,13 +1,25 @@
 import os
 os.environ['IMAGE_BOX_BAND_ORDERING']='last'
-import re
-import random
+import copy
+import json
+import itertools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from tensorflow.keras.utils import to_categorical
 from imagebox.handler import InputTargetHandler,BAND_ORDERING
+import imagebox.processor as proc
 import tfbox.nn.addons as addons
+from tfbox.loaders.workers import SharedMemoryPool
+from tfbox.loaders.buffers import BatchBuffers
+from tfbox.loaders.cache import ArrayCache, DiskCache, _hash, _source_stamp
+from tfbox.loaders.prefetch import BatchPrefetcher
+from tfbox.loaders.remote import RemoteReader, is_remote, file_md5
+from tfbox.loaders.table import Table, Record, compact
+from tfbox.loaders.profiler import Profiler, NULL_TIMER
+from tfbox.loaders.augment import augment_dataset
 
 
 BATCH_SIZE=6
@@ -20,8 +32,57 @@ TARGET_COL='target'
 WINDOW_INDEX_COL=None
 WINDOW_COL='window'
 WINDOWED_GROUP_COL='__win_group_id'
+INPUT_SOURCE_COL='__input_source'
+TARGET_SOURCE_COL='__target_source'
+SYNC_MANIFEST='.tfbox_sync.json'
+SYNC_LOCALIZE_ERROR='sync_local requires localized paths (`localize`)'
 INPUT_DTYPE=np.float32
 TARGET_DTYPE=np.int64
+ONEHOT_DTYPE=np.float32
+ONEHOT_FORMAT='onehot'
+SPARSE_FORMAT='sparse'
+NORMALIZED_FORMAT='normalized'
+RAW_FORMAT='raw'
+RAW_INPUT_DTYPE=np.uint16
+STATS_DTYPE=np.float32
+RAW_HANDLER_KWARGS=['band_indices','input_bounds']
+RAW_HANDLER_ERROR=(
+    "input_format='raw' does not support `{}`: "
+    "computed (float) values would be truncated to the raw dtype" )
+SEED_ROWS=0
+SEED_AUGMENT=1
+SEED_SHUFFLE=2
+SEED_SELECT=3
+REMOTE_READ_KEY='read'
+STATE_SIZE_ERROR='state permutation has {} idents (expected {})'
+PROFILE_LOG='log'
+COALESCE_AREA_RATIO=1.0
+SHARD_SEED_ERROR='shuffled (or sampled) shards require a shared `seed`'
+SHARD_INDEX_ERROR='shard index {} not in [0,{})'
+FLOAT_CROPPING_SEED_ERROR=(
+    '`float_cropping` offsets are drawn from the global random state '
+    'and can not be reproduced with a `seed`' )
+BUCKET_SAMPLER_ERROR='samplers are not supported with `bucket_shapes`'
+BUCKET_ASSEMBLY_ERROR='`bucket_shapes` does not support reuse_buffers or process workers'
+UINT8_CLASSES=256
+THREADS='threads'
+PROCESSES='processes'
+INPUT='input'
+TARGET='target'
+HANDLER_STATE_ATTRS=[
+    'input_window',
+    'target_window',
+    'window_index',
+    'float_x',
+    'float_y',
+    'k',
+    'flip',
+    'input_path',
+    'target_path' ]
+WINDOW_CHARS=str.maketrans('','',' ()[]')
+PARQUET_EXTS=['.parquet','.pq']
+FEATHER_EXTS=['.feather','.arrow']
+AUTOTUNE=tf.data.experimental.AUTOTUNE
 
 
 
@@ -62,20 +123,95 @@ class DFSequence(tf.keras.utils.Sequence):
             example_path=None,
             input_dtype=INPUT_DTYPE,
             target_dtype=TARGET_DTYPE,
+            num_workers=None,
+            worker_type=THREADS,
+            nb_slots=None,
+            reuse_buffers=False,
+            nb_buffers=2,
+            cache_bytes=None,
+            cache_dir=None,
+            cache_dir_bytes=None,
+            prefetch=None,
+            remote_fetch=False,
+            remote_lookahead=1,
+            columns=None,
+            metadata_cache=None,
+            target_format=ONEHOT_FORMAT,
+            input_format=NORMALIZED_FORMAT,
+            raw_dtype=RAW_INPUT_DTYPE,
+            seed=None,
+            profile=False,
+            coalesce_windows=False,
+            colocate_windows=False,
+            shape_column=None,
+            bucket_shapes=False,
             **handler_kwargs):
-        self.onehot=onehot
+        self.target_format=target_format
+        self.input_format=input_format
+        self.raw_inputs=(input_format==RAW_FORMAT)
+        self.sparse=(target_format==SPARSE_FORMAT)
+        self.onehot=onehot and (not self.sparse)
         self.droplast=droplast
-        if nb_classes or (not onehot):
+        if nb_classes or (not (onehot or self.sparse)):
             self.nb_classes=nb_classes
         else:
-            raise ValueError('onehot encoding requires nb_classes')
+            raise ValueError('onehot encoding and sparse targets require nb_classes')
         self.nb_classes_list=isinstance(self.nb_classes,list)
         self.batch_size=batch_size
         self.shuffle=shuffle
+        self.seed=seed
+        self.sampler=None
+        self.shard_index=0
+        self.shard_count=1
+        if coalesce_windows is True:
+            coalesce_windows=COALESCE_AREA_RATIO
+        self.coalesce_windows=coalesce_windows
+        self.colocate_windows=colocate_windows
+        self._ident_sources=None
+        self.shape_column=shape_column
+        self.bucket_shapes=bucket_shapes
+        if bucket_shapes and (reuse_buffers or (worker_type==PROCESSES and num_workers)):
+            raise ValueError(BUCKET_ASSEMBLY_ERROR)
+        self.epoch=0
+        self.cursor=0
+        self.offset=0
+        self.num_workers=num_workers
+        self.worker_type=worker_type
+        self.nb_slots=nb_slots
+        self._executor=None
+        self._shared_pool=None
+        self._shared_slot=None
+        self.reuse_buffers=reuse_buffers
+        self.prefetch=prefetch
+        if prefetch:
+            nb_buffers=max(nb_buffers,prefetch+2)
+        self.nb_buffers=nb_buffers
+        self._buffers=None
+        self._prefetcher=None
+        self._plan_lock=threading.Lock()
+        if profile:
+            self.profiler=Profiler(noisy=(profile==PROFILE_LOG))
+        else:
+            self.profiler=None
+        if cache_bytes:
+            self.cache=ArrayCache(cache_bytes)
+        else:
+            self.cache=None
+        self.planned_positions={}
         if read_from_gcs:
             self.localize=False
         else:
             self.localize=localize
+        self.read_from_gcs=read_from_gcs
+        if remote_fetch:
+            if remote_fetch is True:
+                remote_fetch={}
+            self.remote=RemoteReader(**remote_fetch)
+            read_from_gcs=False
+        else:
+            self.remote=None
+        self.remote_lookahead=remote_lookahead
+        self._remote_keys=itertools.count()
         self._set_columns(
             input_column,
             target_column,
@@ -87,11 +223,25 @@ class DFSequence(tf.keras.utils.Sequence):
             window_index_column,
             window_column)
         self._set_local_data_root(local_data_root)
-        self._init_dataset(data,converters,limit)
+        self._init_dataset(data,converters,limit,columns,metadata_cache)
         if group_maps:
             self.grouping=addons.Groups(group_maps)
         else:
             self.grouping=False
+        if self.grouping and self.sparse:
+            self.group_lookup=self.grouping.sparse_lookup(self._group_nb_classes())
+        else:
+            self.group_lookup=None
+        if self.raw_inputs:
+            for kwarg in RAW_HANDLER_KWARGS:
+                if handler_kwargs.get(kwarg) is not None:
+                    raise ValueError(RAW_HANDLER_ERROR.format(kwarg))
+            input_dtype=raw_dtype
+            self.raw_means=handler_kwargs.pop('means',None)
+            self.raw_stdevs=handler_kwargs.pop('stdevs',None)
+        else:
+            self.raw_means=None
+            self.raw_stdevs=None
         self.handler=InputTargetHandler(
             input_bands=input_bands,
             cropping=cropping,
@@ -107,19 +257,38 @@ class DFSequence(tf.keras.utils.Sequence):
             augment=augment,
             read_from_gcs=read_from_gcs,
             **handler_kwargs)
+        if (seed is not None) and self.handler.float_cropping:
+            raise ValueError(FLOAT_CROPPING_SEED_ERROR)
+        if cache_dir:
+            self.disk_cache=DiskCache(
+                cache_dir,
+                max_bytes=cache_dir_bytes,
+                config=self._handler_config())
+        else:
+            self.disk_cache=None
+        self._local=threading.local()
 
 
     #
     # PUBLIC
     #
     def select(self,index=None):
-        """ select single example (w/o loading images) """
+        """ select single example (w/o loading images)
+
+        with a `seed` the row (and random index) selected is fixed for the epoch
+        """
         if index is None:
-            index=np.random.randint(0,len(self.idents))
+            index=int(self._selections.integers(0,len(self.idents)))
         self.index=index
-        self.ident=self.idents[index]
-        self.matched_rows=self.data[self.data[self.group_column]==self.ident]
-        self.row=self._sample_row(data=self.matched_rows)
+        code=self.idents[index]
+        self.ident=self.groups[code]
+        start=self.group_starts[code]
+        self.matched_rows=self.data.iloc[start:start+self.group_counts[code]]
+        if self.windows is not None:
+            windows=self.windows[start:start+self.group_counts[code]]
+            self.matched_rows=self.matched_rows.assign(
+                **{ self.window_column: list(map(tuple,windows.tolist())) })
+        self.row=self.table.row(self._row_positions([code],self._rng(SEED_SELECT,index))[0])
 
 
     def select_batch(self,batch_index):
@@ -129,8 +298,8 @@ class DFSequence(tf.keras.utils.Sequence):
         self.batch_index=batch_index
         self.start_index=self.batch_index*self.batch_size
         self.end_index=self.start_index+self.batch_size
-        self.batch_idents=self.idents[self.start_index:self.end_index]
-        self.batch_rows=[ self._sample_row(ident) for ident in self.batch_idents ]
+        self.batch_idents=self.groups[self.idents[self.start_index:self.end_index]]
+        self.batch_rows=[ self.table.row(p) for p in self._batch_positions(batch_index) ]
 
         
     def get(self,index,set_window=True,set_augment=True):
@@ -142,14 +311,12 @@ class DFSequence(tf.keras.utils.Sequence):
                 if false ignore any window-cropping or augmentation
         """
         self.select(index)
-        if set_window:
-            self.handler.set_window(window=self._window(self.row))
-        if set_augment:
-            self.handler.set_augmentation()
-        inpt=self.get_input()
-        targ=self.get_target()
+        if (set_augment is True) and (self.seed is not None):
+            set_augment=self._example_augmentation(self.index)
+        with self._fetched(self._remote_urls([self.row])):
+            inpt,targ=self._load_example(self.row,self.handler,set_window,set_augment)
         if self.grouping:
-            targ=[targ,self.grouping(targ)]
+            targ=self._group(targ)
         if self.sample_weight_column:
             return inpt, targ, self.row[self.sample_weight_column]
         else:
@@ -165,30 +332,93 @@ class DFSequence(tf.keras.utils.Sequence):
                 if false ignore any window-cropping or augmentation
                 setup through `handler_kwargs`
         """
-        self.select_batch(batch_index)
-        inpts=[]
-        targs=[]
-        for r in self.batch_rows:
-            if set_window:
-                self.handler.set_window(window=self._window(r))
-            if set_augment:
-                self.handler.set_augmentation()
-            inpts.append(self.get_input(r))
-            targs.append(self.get_target(r))
-        inpts=np.array(inpts)
-        if self.nb_classes_list:
-            targs=[np.array(a) for a in list(zip(*targs))]
+        with self._timer('batch'):
+            self.select_batch(batch_index)
+            self.cursor=batch_index+1
+            if self.prefetch and (not self._uses_processes()):
+                if self._prefetcher is None:
+                    self._prefetcher=BatchPrefetcher(self.prefetch)
+                return self._prefetcher.get(
+                    batch_index,
+                    lambda i: self._assemble(i,set_window,set_augment,self._local_handler()),
+                    self.nb_batches,
+                    key=(set_window,set_augment))
+            else:
+                return self._assemble(batch_index,set_window,set_augment)
+
+    
+    def _assemble(self,batch_index,set_window=True,set_augment=True,handler=None):
+        """ load inputs-targets(-sample_weights) batch for batch_index """
+        if handler is None:
+            handler=self.handler
+        with self._timer('select'):
+            rows=[ self.table.row(p) for p in self._batch_positions(batch_index) ]
+            augmentation=self._batch_augmentation(batch_index,set_augment)
+        try:
+            if self.remote is not None:
+                self._fetch_remote(batch_index,rows)
+            return self._assemble_rows(batch_index,rows,set_window,augmentation,handler)
+        finally:
+            if self.remote is not None:
+                self.remote.release(batch_index)
+
+
+    def _assemble_rows(self,batch_index,rows,set_window,augmentation,handler):
+        """ augmentation<list>: (k,flip) or False for each row """
+        if self._uses_processes():
+            inpts,targs,sample_weights=self._shared_batch(
+                batch_index,
+                set_window,
+                augmentation)
+        elif self.reuse_buffers:
+            inpts,targs,sample_weights=self._buffered_batch(
+                rows,
+                set_window,
+                augmentation,
+                handler)
         else:
-            targs=np.array(targs)
+            if self._coalesces(handler):
+                examples=self._coalesced_examples(rows,set_window,augmentation,handler)
+            elif self.num_workers and (self.num_workers>1):
+                examples=list(self._pool().map(
+                    lambda ra: self._load_example(
+                        ra[0],
+                        self._local_handler(),
+                        set_window,
+                        ra[1]),
+                    zip(rows,augmentation)))
+            else:
+                examples=[
+                    self._load_example(r,handler,set_window,a)
+                    for r,a in zip(rows,augmentation) ]
+            with self._timer('stack'):
+                inpts,targs=zip(*examples)
+                if self.raw_inputs:
+                    inpts=[np.array(a) for a in zip(*inpts)]
+                else:
+                    inpts=np.array(inpts)
+                if self.nb_classes_list:
+                    targs=[np.array(a) for a in list(zip(*targs))]
+                else:
+                    targs=np.array(targs)
+                if self.sample_weight_column:
+                    sample_weights=np.array([r[self.sample_weight_column] for r in rows])
         if self.grouping:
-            targs=[targs,self.grouping(targs)]
+            with self._timer('grouping'):
+                targs=self._group(targs)
         if self.sample_weight_column:
-            sample_weights=np.array([r[self.sample_weight_column] for r in self.batch_rows])
             return inpts, targs, sample_weights
         else:
             return inpts, targs
 
     
+    def _row_stat(self,row,dotcol,default=None):
+        if dotcol:
+            return row[self._dotted_column(row,dotcol)]
+        else:
+            return default
+
+
     def _dotted_column(self,row,dotcol):
         parts=dotcol.split('.')
         col=parts[0]
@@ -197,35 +427,258 @@ class DFSequence(tf.keras.utils.Sequence):
         return col
 
 
-    def get_input(self,row=None):
+    def get_input(self,row=None,handler=None):
         """ return input image for row or selected-row """
         if row is None:
             row=self.row
-        if self.means_column:
-            means=row[self._dotted_column(row,self.means_column)]
-        else:
+        if handler is None:
+            handler=self.handler
+        if self.raw_inputs:
             means=None
-        if self.stdevs_column:
-            stdevs=row[self._dotted_column(row,self.stdevs_column)]
-        else:
             stdevs=None
-        return self.handler.input(
-            row[self.input_column],
-            means=means,
-            stdevs=stdevs,
-            return_profile=False)
+        else:
+            means=self._row_stat(row,self.means_column)
+            stdevs=self._row_stat(row,self.stdevs_column)
+        path=row[self.input_column]
+        def _read():
+            return handler.input(
+                self._read_path(path),
+                means=means,
+                stdevs=stdevs,
+                return_profile=False)
+        if (self.cache is None) and (self.disk_cache is None) and (self.profiler is None):
+            return _read()
+        else:
+            key=(
+                INPUT,
+                path,
+                _hashable(handler.input_window),
+                _hashable(handler.input_bands),
+                handler.input_cropping,
+                handler.input_resolution,
+                _hashable(means),
+                _hashable(stdevs))
+            return self._decoded(handler,key,_read,path)
     
     
-    def get_target(self,row=None):
+    def get_input_stats(self,row=None,handler=None,nb_bands=None):
+        """ return (2,bands) array of input means and stdevs (`input_format='raw'`)
+
+        scalar means/stdevs are broadcast to every band. zeros/ones are used
+        for missing means/stdevs and for bands beyond the stats
+
+        Args:
+            - row<row|None>: row or selected-row
+            - handler<InputTargetHandler|None>: handler (for input_bands)
+            - nb_bands<int|None>: number of input bands
+        """
+        if row is None:
+            row=self.row
+        if handler is None:
+            handler=self.handler
+        means=self._row_stat(row,self.means_column,self.raw_means)
+        stdevs=self._row_stat(row,self.stdevs_column,self.raw_stdevs)
+        if means is None:
+            means,stdevs=[],[]
+        elif stdevs is None:
+            stdevs=1
+        means=np.ravel(np.asarray(means,dtype=STATS_DTYPE))
+        stdevs=np.ravel(np.asarray(stdevs,dtype=STATS_DTYPE))
+        if handler.input_bands:
+            size=len(handler.input_bands)
+        else:
+            size=nb_bands or max(means.size,stdevs.size)
+        means=self._band_stat(means,handler.input_bands,size)
+        stdevs=self._band_stat(stdevs,handler.input_bands,size)
+        stats=np.stack([means,stdevs])
+        if nb_bands and (nb_bands>stats.shape[1]):
+            pad=np.zeros((2,nb_bands-stats.shape[1]),dtype=STATS_DTYPE)
+            pad[1]=1
+            stats=np.concatenate([stats,pad],axis=1)
+        return stats
+
+
+    def _band_stat(self,values,input_bands,size):
+        """ scalar stats broadcast to `size` bands, band-wise stats selected by input_bands """
+        if values.size==1:
+            return np.repeat(values,size)
+        if input_bands and values.size:
+            return values[input_bands]
+        return values
+
+
+    def get_target(self,row=None,handler=None,onehot=True):
         """ return target image for row or selected-row """
         if row is None:
             row=self.row
-        targ=self.handler.target(
-            row[self.target_column],
-            return_profile=False)
-        if self.onehot:
-            targ=self._onehot(targ)
-        return targ
+        if handler is None:
+            handler=self.handler
+        path=row[self.target_column]
+        def _read():
+            return handler.target(self._read_path(path),return_profile=False)
+        if (self.cache is None) and (self.disk_cache is None) and (self.profiler is None):
+            targ=_read()
+        else:
+            key=(
+                TARGET,
+                path,
+                _hashable(handler.target_window),
+                handler.target_cropping,
+                handler.target_resolution)
+            targ=self._decoded(handler,key,_read,path)
+        return self._encode_target(targ,onehot)
+
+
+    def sync_local(self,
+            check_remote=False,
+            verify=False,
+            manifest=SYNC_MANIFEST,
+            **reader_kwargs):
+        """ download missing or changed remote input/target files to their localized paths
+
+        Files are downloaded concurrently (see `RemoteReader`). A manifest of the
+        source-url, size, md5 and etag of each local file is kept in the 
+        local-data-root so that re-runs only fetch files that are missing or
+        have changed.
+
+        Args:
+            - check_remote<bool>:
+                if true compare the remote size/etag (HEAD requests) to the manifest.
+                files whose HEAD request fails are downloaded
+            - verify<bool>: if true compare md5 of the local files to the manifest
+            - manifest<str>: manifest filename (within local_data_root)
+            - **reader_kwargs: RemoteReader kwargs (ie. max_connections, headers)
+
+        Returns:
+            <dict> with number of files downloaded and skipped, and bytes downloaded
+        """
+        if not self.localize:
+            raise ValueError(SYNC_LOCALIZE_ERROR)
+        manifest_path=os.path.join(self.local_data_root or os.getcwd(),manifest)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path,'r') as file:
+                records=json.load(file)
+        else:
+            records={}
+        items={}
+        for src,dest in [
+                (INPUT_SOURCE_COL,self.input_column),
+                (TARGET_SOURCE_COL,self.target_column)]:
+            for url,path in zip(self.data[src],self.data[dest]):
+                if is_remote(url):
+                    items[path]=url
+        items=[(url,path) for path,url in items.items()]
+        nb_files=len(items)
+        reader=RemoteReader(**reader_kwargs)
+        try:
+            if check_remote:
+                heads,head_errors=reader.head([url for url,_ in items],raise_errors=False)
+            else:
+                heads,head_errors={},{}
+            items=[
+                (url,path) for url,path in items 
+                if (url in head_errors) or 
+                    (not _is_synced(url,path,records.get(path),heads.get(url),verify)) ]
+            downloaded,errors=reader.download(items,raise_errors=False)
+        finally:
+            reader.close()
+        records.update(downloaded)
+        tmp_path=f'{manifest_path}.tmp'
+        with open(tmp_path,'w') as file:
+            json.dump(records,file)
+        os.replace(tmp_path,manifest_path)
+        if errors:
+            raise next(iter(errors.values()))
+        return {
+            'downloaded': len(downloaded),
+            'skipped': nb_files-len(items),
+            'bytes': sum(r['size'] for r in downloaded.values()) }
+
+
+    def as_dataset(self,
+            set_window=True,
+            set_augment=True,
+            num_parallel_reads=None,
+            deterministic=False,
+            batch_augment=False):
+        """ returns tf.data.Dataset of inputs-targets(-sample_weights) batches
+
+        Uses the same group-index, handler, windowing, onehot and group_maps logic
+        as `get_batch`. Examples are read through a parallel `map` using 
+        thread-local copies of the handler, onehot-encoding and grouping are 
+        applied in-graph through a second parallel `map`, and batches are prefetched. 
+        Each iteration over the dataset is a new (reset/shuffled) epoch. The
+        first iteration after `load_state_dict` resumes the restored epoch
+        (permutation and cursor). With a `seed` the row-sampling and augmentation match `get_batch`.
+        With `bucket_shapes` image dims are None and example order is 
+        preserved (`deterministic`) so each batch is a single bucket.
+
+        Args:
+            - set_window/augment:
+                if false ignore any window-cropping or augmentation
+                setup through `handler_kwargs`
+            - num_parallel_reads<int|None>: 
+                number of examples read concurrently. defaults to AUTOTUNE
+            - deterministic<bool>: 
+                if true preserve example order at the cost of throughput
+            - batch_augment<bool|dict>:
+                if truthy read un-augmented examples and augment whole batches 
+                in-graph with `augment.augment_dataset` (a dict is passed as kwargs)
+        """
+        if batch_augment:
+            set_augment=False
+        specs=self._example_spec()
+        if self.buckets is not None:
+            deterministic=True
+            specs=self._bucket_spec(specs)
+        dtypes=[tf.as_dtype(d) for (_,d) in specs]
+        def _read(item):
+            arrays=tf.numpy_function(
+                lambda i: self._read_example(i[0],set_window,_augmentation(i)),
+                [item],
+                dtypes)
+            for a,(shape,_) in zip(arrays,specs):
+                a.set_shape(shape)
+            return tuple(arrays)
+        def _augmentation(item):
+            if item[1]<0:
+                return False
+            else:
+                return int(item[1]), bool(item[2])
+        def _items():
+            if self._restored:
+                start=self.offset
+                self._restored=False
+            else:
+                self.reset()
+                start=0
+            for i in range(start,self.nb_batches):
+                augmentation=self._batch_augmentation(i,set_augment)
+                for p,a in zip(self._batch_positions(i),augmentation):
+                    if a:
+                        yield (p,)+a
+                    else:
+                        yield (p,-1,0)
+            if self.profiler is not None:
+                self.profiler.end_epoch()
+            self.epoch+=1
+        ds=tf.data.Dataset.from_generator(
+            _items,
+            output_signature=tf.TensorSpec(shape=(3,),dtype=tf.int64))
+        ds=ds.map(
+            _read,
+            num_parallel_calls=num_parallel_reads or AUTOTUNE,
+            deterministic=deterministic)
+        ds=ds.map(
+            self._nest_example,
+            num_parallel_calls=AUTOTUNE,
+            deterministic=deterministic)
+        ds=ds.batch(self.batch_size,drop_remainder=True)
+        if batch_augment:
+            if batch_augment is True:
+                batch_augment={}
+            ds=augment_dataset(ds,deterministic=deterministic,**batch_augment)
+        return ds.prefetch(AUTOTUNE)
 
         
     def reset(self):
@@ -239,8 +692,148 @@ class DFSequence(tf.keras.utils.Sequence):
         self.end_index=None
         self.batch_idents=None
         self.batch_rows=None
-        if self.shuffle:
-            random.shuffle(self.idents)
+        if self._prefetcher:
+            self._prefetcher.stop()
+        if self.remote is not None:
+            self.remote.release_all()
+        self.planned_positions={}
+        self.planned_augmentation={}
+        self._selections=self._rng(SEED_SELECT)
+        self._restored=False
+        self.cursor=0
+        if self._shared_pool:
+            self._shared_pool.reset()
+            self._shared_slot=None
+        if self.sampler is not None:
+            idents=self.sampler.sample(self._rng(SEED_SHUFFLE))
+        elif self.buckets is not None:
+            rng=self._rng(SEED_SHUFFLE)
+            if self.shuffle:
+                idents=rng.permutation(len(self.groups))
+            else:
+                idents=np.arange(len(self.groups))
+            idents=self._bucketed_idents(idents,rng)
+        elif self.shuffle and self.colocate_windows and self.has_windows:
+            idents=self._colocated_idents(self._rng(SEED_SHUFFLE))
+        elif self.shuffle:
+            idents=self._rng(SEED_SHUFFLE).permutation(len(self.groups)).astype(np.int32)
+        else:
+            idents=np.arange(len(self.groups),dtype=np.int32)
+        if self.shard_count>1:
+            idents=self._shard_idents(idents)
+        self.idents=idents
+
+
+    def shard(self,index,count):
+        """ restrict the sequence to shard `index` of `count` disjoint shards
+        
+        every shard computes the same (seeded) epoch permutation and takes every
+        `count`-th full batch of it, so shards are disjoint each epoch and have
+        the same number of batches (the remaining idents are dropped). row
+        sampling and augmentation are drawn independently for each shard.
+        
+        Args:
+            - index<int>: shard index (ie. worker/replica id)
+            - count<int>: number of shards
+        """
+        if not (0<=index<count):
+            raise ValueError(SHARD_INDEX_ERROR.format(index,count))
+        if (count>1) and (self.seed is None) and (self.shuffle or (self.sampler is not None)):
+            raise ValueError(SHARD_SEED_ERROR)
+        self.shard_index=index
+        self.shard_count=count
+        self._set_nb_batches()
+        self.offset=0
+        self.reset()
+
+
+    def set_sampler(self,sampler=None):
+        """ draw the idents of each epoch from a sampler (see loaders.sampler)
+        
+        Args:
+            - sampler<ClassSampler|None>:
+                object with `sample(rng)` and `__len__`. if None revert to
+                (shuffled) idents
+        """
+        if (sampler is not None) and self.bucket_shapes:
+            raise ValueError(BUCKET_SAMPLER_ERROR)
+        self.sampler=sampler
+        self._set_nb_batches()
+        self.offset=0
+        self.reset()
+
+
+    def state_dict(self):
+        """ iteration state: seed, epoch, shuffle permutation and batch cursor
+        
+        with a `seed` batches after the cursor are reproduced exactly after
+        `load_state_dict` (without a seed only the order of the idents is)
+        """
+        return {
+            'seed': self.seed,
+            'epoch': self.epoch,
+            'cursor': self.cursor,
+            'shard': (self.shard_index,self.shard_count),
+            'permutation': self.idents.copy() }
+
+
+    def load_state_dict(self,state):
+        """ restore iteration state
+        
+        the saved shard is re-applied, so `shard` does not need to be (and 
+        should not be) called after loading. the remaining batches of the 
+        epoch are served from index 0 (`__len__` and `__getitem__` are offset 
+        by the cursor until `on_epoch_end`) and by the first `as_dataset` iteration
+        """
+        index,count=state.get('shard',(0,1))
+        if not (0<=index<count):
+            raise ValueError(SHARD_INDEX_ERROR.format(index,count))
+        if (state['seed'] is not None) and self.handler.float_cropping:
+            raise ValueError(FLOAT_CROPPING_SEED_ERROR)
+        permutation=np.asarray(state['permutation'],dtype=np.int32)
+        previous=(self.seed,self.epoch,self.shard_index,self.shard_count)
+        self.seed=state['seed']
+        self.epoch=state['epoch']
+        self.shard_index=index
+        self.shard_count=count
+        self._set_nb_batches()
+        self.reset()
+        if len(permutation)!=len(self.idents):
+            size=len(self.idents)
+            self.seed,self.epoch,self.shard_index,self.shard_count=previous
+            self._set_nb_batches()
+            self.reset()
+            raise ValueError(STATE_SIZE_ERROR.format(len(permutation),size))
+        self.idents=permutation
+        self.cursor=state['cursor']
+        self.offset=self.cursor
+        self._restored=True
+
+
+    def release_batch(self):
+        """ release shared-memory slot of last batch (`worker_type=PROCESSES`)
+        
+        arrays returned by `get_batch` are views into the slot and are invalid
+        once released. the slot is released automatically on the next `get_batch`
+        """
+        if self._shared_slot is not None:
+            self._shared_pool.release(self._shared_slot)
+            self._shared_slot=None
+
+
+    def close(self):
+        """ shutdown worker threads/processes """
+        if self._prefetcher:
+            self._prefetcher.stop()
+        if self._executor:
+            self._executor.shutdown()
+            self._executor=None
+        if self._shared_pool:
+            self._shared_pool.close()
+            self._shared_pool=None
+            self._shared_slot=None
+        if self.remote is not None:
+            self.remote.close()
 
 
     #
@@ -248,19 +841,41 @@ class DFSequence(tf.keras.utils.Sequence):
     #
     def __len__(self):
         """ number of batches """
-        return self.nb_batches
+        return self.nb_batches-self.offset
     
     
     def __getitem__(self,batch_index):
         """ return input-target batch """
-        return self.get_batch(batch_index)
+        return self.get_batch(batch_index+self.offset)
     
 
     def on_epoch_end(self):
         """ on-epoch-end callback """
+        if self.profiler is not None:
+            self.profiler.end_epoch()
+        self.offset=0
+        self.epoch+=1
         self.reset()
 
 
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state['_local']=None
+        state['_executor']=None
+        state['_shared_pool']=None
+        state['_shared_slot']=None
+        state['_prefetcher']=None
+        state['_plan_lock']=None
+        state['profiler']=None
+        return state
+
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._local=threading.local()
+        self._plan_lock=threading.Lock()
+
+
     #
     # INTERNAL
     #
@@ -290,31 +905,242 @@ class DFSequence(tf.keras.utils.Sequence):
             self.group_column=group_column
 
 
-    def _init_dataset(self,data,converters,limit):
-        if self.has_windows:
-            converters=converters or {}
-            converters[self.window_column]=eval
+    def _init_dataset(self,data,converters,limit,columns=None,metadata_cache=None):
+        cache_key=None
+        cached=None
+        if metadata_cache and _is_paths(data):
+            cache_key=self._metadata_key(data,converters,columns)
+            cached=_load_metadata(metadata_cache,cache_key)
+        if cached is None:
+            data,windows=self._read_metadata(data,converters,columns)
+            if cache_key:
+                _save_metadata(metadata_cache,cache_key,data,windows)
+        else:
+            data,windows=cached
+        if limit:
+            idents=pd.unique(data[self.group_column])[:limit*self.batch_size]
+            keep=data[self.group_column].isin(idents).values
+            data=data[keep]
+            if windows is not None:
+                windows=windows[keep]
+        self.data,self.windows=self._group_data(data,windows)
+        self.table=Table(self.data,self._table_arrays())
+        if self.bucket_shapes:
+            self._set_buckets()
+        else:
+            self.shapes=None
+            self.buckets=None
+        self.idents=np.arange(len(self.groups),dtype=np.int32)
+        self._set_nb_batches()
+        self.reset()
+
+
+    def _table_arrays(self):
+        """ windows are only kept as the int32 `windows` array (not as a data column) """
+        if self.windows is None:
+            return None
+        else:
+            return { self.window_column: self.windows }
+
+
+    def _set_nb_batches(self):
+        self.nb_batches=self._nb_epoch_batches()//self.shard_count
+
+
+    def _nb_epoch_batches(self):
+        """ number of batches of the (unsharded) epoch """
+        if self.sampler is not None:
+            nb_idents=len(self.sampler)
+        elif self.buckets is not None:
+            return int((self.bucket_counts//self.batch_size).sum())
+        else:
+            nb_idents=len(self.groups)
+        return int(nb_idents//self.batch_size)
+
+
+    def _set_buckets(self):
+        """ (height,width) of each row and same-shape buckets of idents
+
+        sets:
+            - shapes<np.array[int32]>: (nb_rows,2) row shapes
+            - buckets<list>: (height,width) of each bucket
+            - ident_buckets<np.array>: (by group-code) bucket index
+            - bucket_counts<np.array>: number of idents in each bucket
+        """
+        if self.shape_column:
+            self.shapes=parse_windows(self.data[self.shape_column].tolist())[:,:2]
+        elif self.has_windows:
+            self.shapes=self.windows[:,[3,2]]
+        else:
+            self.shapes=self._probe_shapes()
+        ident_shapes=self.shapes[self.group_starts]
+        buckets,self.ident_buckets=np.unique(ident_shapes,axis=0,return_inverse=True)
+        self.ident_buckets=self.ident_buckets.ravel()
+        self.buckets=[tuple(b) for b in buckets.tolist()]
+        self.bucket_counts=np.bincount(self.ident_buckets,minlength=len(self.buckets))
+
+
+    def _probe_shapes(self):
+        """ (height,width) of each row's input read from the raster headers """
+        import rasterio
+        paths=self.table.column(self.input_column)
+        unique_paths,inverse=np.unique(paths.astype(str),return_inverse=True)
+        def _probe(path):
+            with self._fetched([self._remote_url(path)]):
+                with rasterio.open(self._read_path(path)) as src:
+                    return src.height, src.width
+        if self.num_workers and (self.num_workers>1):
+            shapes=list(self._pool().map(_probe,unique_paths))
+        else:
+            shapes=[_probe(p) for p in unique_paths]
+        return np.array(shapes,dtype=np.int32).reshape(-1,2)[inverse.ravel()]
+
+
+    def _bucketed_idents(self,idents,rng):
+        """ full same-shape batches of idents in (shuffled) batch order
+        
+        idents keep their (shuffled) order within each bucket. the remainder of
+        each bucket is dropped.
+        """
+        batches=[]
+        for b in range(len(self.buckets)):
+            bucket_idents=idents[self.ident_buckets[idents]==b]
+            nb_batches=len(bucket_idents)//self.batch_size
+            batches.append(
+                bucket_idents[:nb_batches*self.batch_size].reshape(nb_batches,self.batch_size))
+        batches=np.concatenate(batches)
+        if self.shuffle:
+            batches=batches[rng.permutation(len(batches))]
+        return batches.ravel().astype(np.int32)
+
+
+    def _shard_idents(self,idents):
+        """ every `shard_count`-th full batch of (global) idents starting at `shard_index` """
+        nb_batches=self._nb_epoch_batches()
+        batches=idents[:nb_batches*self.batch_size].reshape(nb_batches,self.batch_size)
+        return batches[self.shard_index::self.shard_count][:self.nb_batches].ravel()
+
+
+    def _read_metadata(self,data,converters,columns):
+        """ read and preprocess metadata
+
+        Returns:
+            (data<pd.DataFrame>, windows<np.array[int32]|None>)
+        """
         if isinstance(data,str):
-            data=pd.read_csv(data,converters=converters)
+            data=self._read_table(data,converters,columns)
         elif isinstance(data,list):
             if isinstance(data[0],str):
-                data=[pd.read_csv(d,converters=converters) for d in data]
-            data=pd.concat(data)
+                data=[self._read_table(d,converters,columns) for d in data]
+            data=pd.concat(data,ignore_index=True)
         else:
             data=data.copy()
-        if self.has_windows and self.window_index_column:
-            data.loc[:,self.group_column]=data.apply(self._window_group,axis=1)
+            keep=self._column_filter(columns)
+            if keep:
+                data=data[[c for c in data.columns if keep(c)]]
+        if self.has_windows:
+            windows=parse_windows(data[self.window_column])
+            data=data.drop(columns=[self.window_column])
+            if self.window_index_column:
+                data.loc[:,self.group_column]=(
+                    data[self.base_group_column].astype(str)+
+                    '__'+
+                    data[self.window_index_column].astype(str))
+        else:
+            windows=None
         if self.localize:
-            data.loc[:,self.input_column]=data[self.input_column].apply(self._localize_path)
-            data.loc[:,self.target_column]=data[self.target_column].apply(self._localize_path)
-        self.idents=data.loc[:,self.group_column].unique().tolist()
-        if limit:
-            self.idents=self.idents[:limit*self.batch_size]
-            data=data.copy()[data[self.group_column].isin(self.idents)]
-        self.data=data
-        self.nb_batches=int(len(self.idents)//self.batch_size)
-        self.reset()
-        
+            data.loc[:,INPUT_SOURCE_COL]=data[self.input_column]
+            data.loc[:,TARGET_SOURCE_COL]=data[self.target_column]
+            data.loc[:,self.input_column]=self._localize_paths(data[self.input_column])
+            data.loc[:,self.target_column]=self._localize_paths(data[self.target_column])
+        data=compact(data,float32_columns=[self.sample_weight_column])
+        return data, windows
+
+
+    def _read_table(self,path,converters,columns):
+        """ read csv, parquet or feather file (projected to the used columns) """
+        keep=self._column_filter(columns)
+        ext=os.path.splitext(path)[-1].lower()
+        if ext in PARQUET_EXTS:
+            if keep:
+                import pyarrow.parquet as pq
+                names=[c for c in pq.read_schema(path).names if keep(c)]
+            else:
+                names=None
+            data=pd.read_parquet(path,columns=names)
+        elif ext in FEATHER_EXTS:
+            if keep:
+                import pyarrow.ipc as ipc
+                names=[c for c in ipc.open_file(path).schema.names if keep(c)]
+            else:
+                names=None
+            data=pd.read_feather(path,columns=names)
+        else:
+            if keep:
+                converters={ k: v for k,v in converters.items() if keep(k) }
+            return pd.read_csv(path,converters=converters,usecols=keep)
+        for c,convert in converters.items():
+            if (c in data.columns) and _is_str_column(data[c]):
+                data[c]=data[c].map(convert)
+        return data
+
+
+    def _column_filter(self,columns):
+        """ column => keep-column function (or None to keep every column)
+
+        Args:
+            - columns<None|True|list>: 
+                None keeps all columns, True keeps only the columns used by the
+                loader, a list keeps the used columns and the listed columns
+        """
+        if columns is None:
+            return None
+        if columns is True:
+            columns=[]
+        used=set(columns)
+        used.update([
+            self.input_column,
+            self.target_column,
+            self.sample_weight_column,
+            self.window_column if self.has_windows else None,
+            self.window_index_column if self.has_windows else None,
+            self.shape_column,
+            getattr(self,'base_group_column',self.group_column) ])
+        prefixes=[]
+        for dotcol in [self.means_column,self.stdevs_column]:
+            if dotcol:
+                parts=dotcol.split('.')
+                if len(parts)>1:
+                    prefixes.append(f'{parts[0]}_')
+                    used.update(parts[1:])
+                else:
+                    used.add(dotcol)
+        prefixes=tuple(prefixes)
+        def _keep(column):
+            return (column in used) or (bool(prefixes) and column.startswith(prefixes))
+        return _keep
+
+
+    def _metadata_key(self,data,converters,columns):
+        if isinstance(data,str):
+            data=[data]
+        return _hash((
+            [(d,_source_stamp(d)) for d in data],
+            converters,
+            columns,
+            self.input_column,
+            self.target_column,
+            self.group_column,
+            self.has_windows,
+            self.window_index_column,
+            self.window_column,
+            self.means_column,
+            self.stdevs_column,
+            self.sample_weight_column,
+            self.shape_column,
+            self.localize,
+            self.local_data_root))
+
 
     def _onehot(self,targ):
         if self.nb_classes_list:
@@ -324,19 +1150,58 @@ class DFSequence(tf.keras.utils.Sequence):
 
 
     def _to_onehot(self,targ,nb_classes):
-        targ=to_categorical(targ,num_classes=nb_classes)
+        """ onehot (with droplast) as a single lookup into the identity matrix """
+        targ=np.asarray(targ)
+        if (targ.ndim>2) and (targ.shape[-1]==1):
+            targ=targ[...,0]
+        eye=np.eye(nb_classes,dtype=ONEHOT_DTYPE)
         if self.droplast:
-            targ=targ[:,:,:-1]
-        return targ
+            eye=eye[:,:-1]
+        return eye[targ]
+
+
+    def _sparse(self,targ):
+        """ cast integer class map(s) to the smallest sparse dtype """
+        if self.nb_classes_list:
+            return [ 
+                np.asarray(t).astype(sparse_dtype(n),copy=False) 
+                for (t,n) in zip(targ,self.nb_classes) ]
+        else:
+            return np.asarray(targ).astype(sparse_dtype(self.nb_classes),copy=False)
+
+
+    def _group(self,targ):
+        """ target => [target, grouped-target] """
+        if self.sparse:
+            grouped=self.group_lookup[targ].astype(
+                sparse_dtype(self.grouping.nb_groups+1),
+                copy=False)
+        else:
+            grouped=self.grouping.numpy(targ)
+        return [targ,grouped]
+
+
+    def _group_nb_classes(self):
+        if self.nb_classes_list:
+            return self.nb_classes[0]
+        else:
+            return self.nb_classes
     
 
-    def _window_group(self,row):
-        return f'{row[self.base_group_column]}__{row[self.window_index_column]}'
+    def _record(self,position,columns):
+        """ self-contained Record of the `columns` values for row-position """
+        row=self.table.row(position)
+        return Record({ c: row[c] for c in columns },position,self._window(row))
 
 
     def _window(self,row):
-        if self.has_windows:
-            return row[self.window_column]
+        if isinstance(row,Record):
+            return row.window
+        elif self.has_windows:
+            return tuple(self.windows[row.name].tolist())
+        elif self.buckets is not None:
+            height,width=self.shapes[row.name].tolist()
+            return (0,0,width,height)
         else:
             return None
 
@@ -350,21 +1215,764 @@ class DFSequence(tf.keras.utils.Sequence):
             self.local_data_root=os.getcwd() 
 
 
-    def _sample_row(self,ident=None,data=None):
-        if data is None:
-            data=self.data[self.data[self.group_column]==ident]
-        return data.sample().iloc[0]
+    def _local_handler(self):
+        """ thread-local (shallow) copy of handler 
+        
+        handler windows/augmentation are set per read so concurrent reads 
+        must not share a handler.
+        """
+        handler=getattr(self._local,'handler',None)
+        if handler is None:
+            handler=copy.copy(self.handler)
+            self._local.handler=handler
+        return handler
+
+
+    def _pool(self):
+        """ thread-pool for concurrent batch assembly """
+        if self._executor is None:
+            self._executor=ThreadPoolExecutor(max_workers=self.num_workers)
+        return self._executor
+
+
+    def _uses_processes(self):
+        return (self.worker_type==PROCESSES) and bool(self.num_workers)
+
+
+    def _shared_batch(self,batch_index,set_window,augmentation):
+        """ assemble batch (and schedule the following batches) with process-pool """
+        if self._shared_pool is None:
+            self._shared_pool=SharedMemoryPool(
+                self,
+                self._example_spec(onehot=True),
+                self.batch_size,
+                self.num_workers,
+                nb_slots=self.nb_slots)
+        self.release_batch()
+        pool=self._shared_pool
+        last_index=min(batch_index+pool.nb_slots-1,self.nb_batches)
+        set_augment=bool(augmentation) and any(augmentation)
+        for i in range(batch_index,last_index):
+            if not pool.submit(
+                    i,
+                    self._batch_positions(i),
+                    set_window,
+                    self._batch_augmentation(i,set_augment)):
+                break
+        self._shared_slot,arrays=pool.get(
+            batch_index,
+            self._batch_positions(batch_index),
+            set_window,
+            augmentation)
+        return self._split_batch(arrays)
+
+
+    def _buffered_batch(self,rows,set_window,augmentation,handler):
+        """ assemble batch in place into the next pre-allocated buffers 
+        
+        arrays are overwritten after `nb_buffers` further batches
+        """
+        if self._buffers is None:
+            self._buffers=BatchBuffers(
+                self._example_spec(onehot=True),
+                self.batch_size,
+                self.nb_buffers)
+        arrays=self._buffers.next()
+        def _fill(index,row,handler):
+            example=self._flat_example(
+                row,
+                handler,
+                set_window,
+                augmentation[index],
+                onehot=True)
+            with self._timer('stack'):
+                for a,e in zip(arrays,example):
+                    a[index]=e
+        if self.num_workers and (self.num_workers>1):
+            list(self._pool().map(
+                lambda ir: _fill(*ir,self._local_handler()),
+                enumerate(rows)))
+        else:
+            for i,r in enumerate(rows):
+                _fill(i,r,handler)
+        return self._split_batch(arrays)
+
+
+    def _split_batch(self,arrays):
+        """ flat list of batch arrays => inputs, targets, sample_weights """
+        nb_inputs=self._nb_inputs()
+        if self.raw_inputs:
+            inpts=list(arrays[:nb_inputs])
+        else:
+            inpts=arrays[0]
+        if self.nb_classes_list:
+            targs=arrays[nb_inputs:nb_inputs+len(self.nb_classes)]
+        else:
+            targs=arrays[nb_inputs]
+        if self.sample_weight_column:
+            sample_weights=arrays[-1]
+        else:
+            sample_weights=None
+        return inpts, targs, sample_weights
+
+
+    def _load_example(self,row,handler,set_window=True,set_augment=True,onehot=True):
+        """ set handler window/augmentation and return input-target pair for row 
+        
+        set_augment<bool|tuple>: true (random), false or explicit (k,flip)
+        """
+        self._set_example(row,handler,set_window,set_augment)
+        inpt=self.get_input(row,handler=handler)
+        if self.raw_inputs:
+            inpt=[inpt,self.get_input_stats(row,handler,nb_bands=inpt.shape[-1])]
+        targ=self.get_target(row,handler=handler,onehot=onehot)
+        return inpt, targ
+
+
+    def _set_example(self,row,handler,set_window=True,set_augment=True):
+        """ set handler window/augmentation for row """
+        with self._timer('window'):
+            if set_window:
+                handler.set_window(window=self._window(row))
+            if set_augment is True:
+                handler.set_augmentation()
+            elif set_augment and handler.augment:
+                k,flip=set_augment
+                handler.k=int(k) or False
+                handler.flip=bool(flip)
+            else:
+                handler.set_augmentation(k=False,flip=False)
+
+
+    def _encode_target(self,targ,onehot=True):
+        """ onehot, or (sparse/deferred onehot) cast to the smallest integer dtype """
+        if self.onehot and onehot:
+            with self._timer('onehot'):
+                targ=self._onehot(targ)
+        elif self.sparse or self.onehot:
+            with self._timer('onehot'):
+                targ=self._sparse(targ)
+        return targ
+
+
+    def _coalesces(self,handler):
+        """ windows sharing a source can be read as a single (union) window """
+        return bool(
+            self.coalesce_windows and 
+            self.has_windows and
+            (self.cache is None) and
+            (self.disk_cache is None) and
+            (not handler.input_resolution) and
+            (not handler.target_resolution) and
+            (not handler.input_padding) and
+            (not handler.target_padding) and
+            (not handler.input_preprocess) and
+            (not handler.target_preprocess) and
+            (not handler.input_bounds) and
+            (not handler.flip_input) and
+            (not handler.flip_target) and
+            (not handler.list_value_map) and
+            (handler.target_expand_axis is None))
+
+
+    def _coalesced_examples(self,rows,set_window,augmentation,handler):
+        """ load input-target pairs reading each source once per batch
+        
+        rows with the same input/target paths (and means/stdevs) are read as
+        the union of their windows and sliced. sources whose union window is
+        larger than `coalesce_windows` times the summed window areas (or 
+        single-window sources) are read per row.
+        """
+        plans=[]
+        sources={}
+        for i,(r,a) in enumerate(zip(rows,augmentation)):
+            self._set_example(r,handler,set_window,a)
+            plans.append((handler.input_window,handler.target_window,handler.k,handler.flip))
+            sources.setdefault(self._source_key(r),[]).append(i)
+        def _read(indices,handler):
+            return indices, self._read_source(
+                [rows[i] for i in indices],
+                [plans[i] for i in indices],
+                handler)
+        if self.num_workers and (self.num_workers>1):
+            groups=self._pool().map(
+                lambda indices: _read(indices,self._local_handler()),
+                sources.values())
+        else:
+            groups=(_read(indices,handler) for indices in sources.values())
+        examples=[None]*len(rows)
+        for indices,group_examples in groups:
+            for i,e in zip(indices,group_examples):
+                examples[i]=e
+        return examples
+
+
+    def _read_source(self,rows,plans,handler):
+        """ input-target pairs for rows with a shared source """
+        input_union=_union_window([p[0] for p in plans])
+        target_union=_union_window([p[1] for p in plans])
+        if (len(rows)>1) and self._coalesce_area(plans,input_union,target_union):
+            row=rows[0]
+            handler.k,handler.flip=False,False
+            means=None
+            stdevs=None
+            if not self.raw_inputs:
+                means=self._row_stat(row,self.means_column)
+                stdevs=self._row_stat(row,self.stdevs_column)
+            with self._timer('read'):
+                inpt=handler.input(
+                    self._read_path(row[self.input_column]),
+                    window=input_union,
+                    means=means,
+                    stdevs=stdevs,
+                    return_profile=False)
+                targ=handler.target(
+                    self._read_path(row[self.target_column]),
+                    window=target_union,
+                    return_profile=False)
+            if _window_shape(inpt,input_union) and _window_shape(targ,target_union):
+                examples=[]
+                for r,(input_window,target_window,k,flip) in zip(rows,plans):
+                    handler.k,handler.flip=k,flip
+                    with self._timer('augment'):
+                        i=self._augment(handler,_slice_window(inpt,input_window,input_union))
+                        t=self._augment(handler,_slice_window(targ,target_window,target_union))
+                    if self.raw_inputs:
+                        i=[i,self.get_input_stats(r,handler,nb_bands=i.shape[-1])]
+                    examples.append((i,self._encode_target(t)))
+                return examples
+        examples=[]
+        for r,(input_window,target_window,k,flip) in zip(rows,plans):
+            handler.input_window,handler.target_window=input_window,target_window
+            handler.k,handler.flip=k,flip
+            i=self.get_input(r,handler=handler)
+            if self.raw_inputs:
+                i=[i,self.get_input_stats(r,handler,nb_bands=i.shape[-1])]
+            examples.append((i,self.get_target(r,handler=handler)))
+        return examples
+
+
+    def _coalesce_area(self,plans,input_union,target_union):
+        window_area=sum(p[0][2]*p[0][3] for p in plans)
+        return (input_union[2]*input_union[3])<=(self.coalesce_windows*window_area)
+
+
+    def _source_key(self,row):
+        return (
+            row[self.input_column],
+            row[self.target_column],
+            _hashable(self._row_stat(row,self.means_column)),
+            _hashable(self._row_stat(row,self.stdevs_column)))
+
+
+    def _colocated_idents(self,rng):
+        """ shuffled idents ordered so windows of the same source share batches
+
+        sources are visited in random order (with idents shuffled within
+        each source) and the order of the resulting full batches is shuffled
+        """
+        if self._ident_sources is None:
+            sources=self.table.column(self.input_column)[self.group_starts]
+            self._ident_sources=pd.factorize(sources)[0]
+        idents=rng.permutation(len(self.groups))
+        source_order=rng.permutation(self._ident_sources.max()+1)
+        idents=idents[np.argsort(source_order[self._ident_sources[idents]],kind='stable')]
+        nb_batches=self._nb_epoch_batches()
+        nb_batched=nb_batches*self.batch_size
+        batches=idents[:nb_batched].reshape(nb_batches,self.batch_size)
+        idents=np.concatenate([
+            batches[rng.permutation(nb_batches)].ravel(),
+            idents[nb_batched:]])
+        return idents.astype(np.int32)
+
+
+    def _fetch_remote(self,batch_index,rows):
+        """ download remote files for batch (and start downloads for the next batches) """
+        last_index=min(batch_index+1+self.remote_lookahead,self.nb_batches)
+        for i in range(batch_index+1,last_index):
+            next_rows=[ self.table.row(p) for p in self._batch_positions(i) ]
+            self.remote.prefetch(self._remote_urls(next_rows),key=i)
+        self.remote.fetch(self._remote_urls(rows),key=batch_index)
+
+
+    def _remote_urls(self,rows):
+        urls=[]
+        for r in rows:
+            for col in [self.input_column,self.target_column]:
+                url=self._remote_url(r[col])
+                if url:
+                    urls.append(url)
+        return urls
+
+
+    def _remote_url(self,path):
+        if is_remote(path):
+            return path
+        elif self.read_from_gcs:
+            return f'gs://{path}'
+        else:
+            return None
+
+
+    @contextlib.contextmanager
+    def _fetched(self,urls):
+        """ download remote urls (`remote_fetch`) for the block and release them on exit """
+        urls=[u for u in urls if u]
+        if (self.remote is None) or (not urls):
+            yield
+        else:
+            key=(REMOTE_READ_KEY,next(self._remote_keys))
+            try:
+                self.remote.fetch(urls,key=key)
+                yield
+            finally:
+                self.remote.release(key)
+
+
+    def _read_path(self,path):
+        """ local path for remote files downloaded with `remote_fetch` 
+
+        files that were not fetched for a batch (`_fetch_remote`) or block 
+        (`_fetched`) are fetched on demand and released on `reset`
+        """
+        if self.remote is None:
+            return path
+        url=self._remote_url(path)
+        if url is None:
+            return path
+        local_path=self.remote.paths.get(url)
+        if local_path is None:
+            local_path=self.remote.fetch([url],key=(REMOTE_READ_KEY,url))[url]
+        return local_path
+
+
+    def _decoded(self,handler,key,read,path):
+        """ read un-augmented image then augment
+        
+        the un-augmented image is read from (in order): the in-memory cache, 
+        the on-disk cache, or the handler.
+        """
+        im=None
+        if self.cache is not None:
+            im=self.cache.get(key)
+            self._count_hit('cache',im)
+        if im is None:
+            if self.disk_cache is not None:
+                im=self.disk_cache.get(key,source=path)
+                self._count_hit('disk_cache',im)
+            if im is None:
+                k,flip=handler.k,handler.flip
+                handler.k,handler.flip=False,False
+                try:
+                    with self._timer('read'):
+                        im=read()
+                finally:
+                    handler.k,handler.flip=k,flip
+                self._count_read(path,im)
+                if self.disk_cache is not None:
+                    self.disk_cache.put(key,im,source=path)
+            if self.cache is not None:
+                im=self.cache.put(key,im)
+        with self._timer('augment'):
+            return self._augment(handler,im)
+
+
+    def _timer(self,stage):
+        if self.profiler is None:
+            return NULL_TIMER
+        else:
+            return self.profiler.timer(stage)
+
+
+    def _count_hit(self,cache,value):
+        if self.profiler is not None:
+            if value is None:
+                self.profiler.count(f'{cache}_misses')
+            else:
+                self.profiler.count(f'{cache}_hits')
+
+
+    def _count_read(self,path,im):
+        """ record file-bytes and decoded-bytes read """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.count('bytes_read',os.path.getsize(self._read_path(path)))
+        except (OSError,ValueError,TypeError):
+            pass
+        if isinstance(im,list):
+            nbytes=sum(np.asarray(i).nbytes for i in im)
+        else:
+            nbytes=np.asarray(im).nbytes
+        self.profiler.count('bytes_decoded',nbytes)
+
+
+    def _handler_config(self):
+        """ handler attributes (excluding per-read state) """
+        return { 
+            k: v for k,v in vars(self.handler).items() 
+            if k not in HANDLER_STATE_ATTRS }
+
+
+    def _augment(self,handler,im):
+        if not handler.augment:
+            return im
+        elif isinstance(im,list):
+            return [proc.augment(i,handler.k,handler.flip) for i in im]
+        else:
+            return proc.augment(im,handler.k,handler.flip)
+
+
+    def _read_example(self,position,set_window=True,set_augment=True,onehot=False):
+        """ read example for row-position as flat list of arrays """
+        return self._read_row(self.table.row(position),set_window,set_augment,onehot)
+
+
+    def _read_row(self,row,set_window=True,set_augment=True,onehot=False):
+        """ read example for row (or Record) as flat list of arrays """
+        with self._fetched(self._remote_urls([row])):
+            return self._flat_example(
+                row,
+                self._local_handler(),
+                set_window,
+                set_augment,
+                onehot=onehot)
+
+
+    def _flat_example(self,row,handler,set_window=True,set_augment=True,onehot=False):
+        """ load example for row as flat list of arrays: [input(,stats),*targets(,weight)] """
+        inpt,targ=self._load_example(
+            row,
+            handler,
+            set_window,
+            set_augment,
+            onehot=onehot)
+        if self.raw_inputs:
+            arrays=list(inpt)
+        else:
+            arrays=[inpt]
+        if self.nb_classes_list:
+            arrays+=list(targ)
+        else:
+            arrays.append(targ)
+        if self.sample_weight_column:
+            arrays.append(np.float32(row[self.sample_weight_column]))
+        return [np.asarray(a) for a in arrays]
+
+
+    def _example_spec(self,onehot=False):
+        """ (shape,dtype) for each array returned by `_read_example` """
+        arrays=self._read_example(self.group_starts[0],set_augment=False,onehot=onehot)
+        return [(a.shape,a.dtype) for a in arrays]
+
+
+    def _nest_example(self,*arrays):
+        """ in-graph onehot/grouping of flat example into (input,target[,weight]) """
+        return nest_example(
+            arrays,
+            self.nb_classes,
+            onehot=self.onehot,
+            droplast=self.droplast,
+            grouping=self.grouping,
+            sample_weights=bool(self.sample_weight_column),
+            sparse=self.sparse,
+            input_stats=self.raw_inputs)
+
+
+    def _bucket_spec(self,specs):
+        """ example specs with unknown (None) height/width for image arrays """
+        nb_inputs=self._nb_inputs()
+        if self.nb_classes_list:
+            nb_targets=len(self.nb_classes)
+        else:
+            nb_targets=1
+        images=[0]+list(range(nb_inputs,nb_inputs+nb_targets))
+        return [
+            (((None,None)+tuple(shape[2:])) if i in images else shape, dtype)
+            for i,(shape,dtype) in enumerate(specs) ]
+
+
+    def _nb_inputs(self):
+        """ number of input arrays in flat examples """
+        if self.raw_inputs:
+            return 2
+        else:
+            return 1
+
+
+    def _group_data(self,data,windows=None):
+        """ sort data (and windows) by group and index contiguous row-positions for each ident
+
+        sets:
+            - groups<np.array>: (by group-code) ident
+            - group_starts<np.array>: (by group-code) position of first row in group
+            - group_counts<np.array>: (by group-code) number of rows in group
+        
+        Returns:
+            (data,windows) sorted by group
+        """
+        codes,groups=pd.factorize(data[self.group_column])
+        order=np.argsort(codes,kind='stable')
+        data=data.iloc[order].reset_index(drop=True)
+        if windows is not None:
+            windows=windows[order]
+        self.group_counts=np.bincount(codes,minlength=len(groups))
+        self.group_starts=np.cumsum(self.group_counts)-self.group_counts
+        self.groups=np.asarray(groups)
+        return data, windows
+
+
+    def _batch_positions(self,batch_index):
+        """ row-positions for batch (fixed for the current epoch once selected) """
+        with self._plan_lock:
+            positions=self.planned_positions.get(batch_index)
+            if positions is None:
+                start_index=batch_index*self.batch_size
+                positions=self._row_positions(
+                    self.idents[start_index:start_index+self.batch_size],
+                    self._rng(SEED_ROWS,self.shard_index,batch_index))
+                self.planned_positions[batch_index]=positions
+        return positions
+
+
+    def _batch_augmentation(self,batch_index,set_augment=True):
+        """ (k,flip) for each example of batch, or False for each if not set_augment
+        
+        (fixed for the current epoch once selected)
+        """
+        if not (set_augment and self.handler.augment):
+            return [False]*self.batch_size
+        square=self._square_batch(batch_index)
+        with self._plan_lock:
+            augmentation=self.planned_augmentation.get(batch_index)
+            if augmentation is None:
+                rng=self._rng(SEED_AUGMENT,self.shard_index,batch_index)
+                ks=rng.integers(0,4,size=self.batch_size)
+                flips=rng.random(self.batch_size)<0.5
+                if not square:
+                    ks=ks-(ks%2)
+                augmentation=[(int(k),bool(f)) for k,f in zip(ks,flips)]
+                self.planned_augmentation[batch_index]=augmentation
+        return augmentation
+
+
+    def _example_augmentation(self,index):
+        """ seeded (k,flip) for `get(index)` """
+        rng=self._rng(SEED_SELECT,SEED_AUGMENT,index)
+        return int(rng.integers(0,4)), bool(rng.random()<0.5)
+
+
+    def _square_batch(self,batch_index):
+        """ false for (shape-bucketed) batches of non-square images (which can only be rotated by 0/180) """
+        if self.buckets is None:
+            return True
+        height,width=self.shapes[self._batch_positions(batch_index)[0]]
+        return height==width
+
+
+    def _rng(self,*keys):
+        """ random generator seeded by (seed,epoch,*keys) (unseeded if seed is None) """
+        if self.seed is None:
+            return np.random.default_rng()
+        else:
+            return np.random.default_rng([self.seed,self.epoch]+list(keys))
+
+
+    def _row_positions(self,codes,rng=None):
+        """ randomly select a row-position for each group-code """
+        if rng is None:
+            rng=np.random
+        codes=np.asarray(codes,dtype=np.int64)
+        counts=self.group_counts[codes]
+        offsets=(rng.random(len(codes))*counts).astype(int)
+        return self.group_starts[codes]+offsets
 
     
-    def _localize_path(self,path):
-        path=re.sub(REMOTE_HEAD,'',path)
+    def _localize_paths(self,paths):
+        paths=paths.astype(str).str.replace(REMOTE_HEAD,'',regex=True)
         if isinstance(self.localize,str):
-            path=path.split(self.localize,1)[-1]
-        path=re.sub(r'^\/','',path)
+            paths=paths.str.split(self.localize,n=1,regex=False).str[-1]
+        paths=paths.str.replace(r'^\/','',regex=True)
         if self.local_data_root:
-            path=f'{self.local_data_root}/{path}'
-        return path
+            paths=f'{self.local_data_root}/'+paths
+        return paths
+
+
+
+
+#
+# HELPERS
+#
+def nest_example(
+        arrays,
+        nb_classes,
+        onehot=True,
+        droplast=False,
+        grouping=None,
+        sample_weights=False,
+        sparse=False,
+        input_stats=False):
+    """ in-graph onehot/grouping of flat example into (input,target[,weight])
+
+    Args:
+        - arrays<list>: flat example [input(,stats),*targets(,weight)]
+        - nb_classes<int|list|None>: number of classes (list for multiple targets)
+        - onehot<bool>: onehot encode targets
+        - droplast<bool>: drop last onehot-class
+        - grouping<addons.Groups|None>: (optional) group-layer for grouped target 
+        - sample_weights<bool>: if true the last array is the sample weight
+        - sparse<bool>: targets are (sparse) integer class maps. group sparse targets.
+        - input_stats<bool>: 
+            if true the second array holds the (raw) input's normalization stats 
+            and the input is returned as (input,stats)
+    """
+    if input_stats:
+        inpt=(arrays[0],arrays[1])
+        arrays=arrays[1:]
+    else:
+        inpt=arrays[0]
+    nb_classes_list=isinstance(nb_classes,list)
+    if nb_classes_list:
+        nb_targs=len(nb_classes)
+    else:
+        nb_targs=1
+    targs=list(arrays[1:1+nb_targs])
+    if onehot:
+        if nb_classes_list:
+            targs=[tf_onehot(t,n,droplast) for (t,n) in zip(targs,nb_classes)]
+        else:
+            targs=[tf_onehot(targs[0],nb_classes,droplast)]
+    if nb_classes_list:
+        targ=tuple(targs)
+    else:
+        targ=targs[0]
+    if grouping and sparse:
+        if nb_classes_list:
+            nb_classes=nb_classes[0]
+        grouped=grouping.sparse(targ,nb_classes)
+        targ=(targ,tf.cast(grouped,sparse_dtype(grouping.nb_groups+1)))
+    elif grouping:
+        targ=(targ,grouping(targ))
+    if sample_weights:
+        return inpt, targ, arrays[-1]
+    else:
+        return inpt, targ
+
+
+def sparse_dtype(nb_classes):
+    """ smallest dtype for integer class maps with nb_classes """
+    if nb_classes<=UINT8_CLASSES:
+        return np.uint8
+    else:
+        return np.int16
+
+
+def tf_onehot(targ,nb_classes,droplast=False):
+    """ in-graph version of `DFSequence._to_onehot` """
+    if (len(targ.shape)>2) and (targ.shape[-1]==1):
+        targ=tf.squeeze(targ,axis=-1)
+    targ=tf.one_hot(tf.cast(targ,tf.int32),nb_classes,dtype=ONEHOT_DTYPE)
+    if droplast:
+        targ=targ[...,:-1]
+    return targ
+
+
+def parse_windows(values):
+    """ vectorized parse of window values into an int32 array
+
+    Args:
+        - values<pd.Series|list>:
+            window strings (ie. "(0, 0, 256, 256)") or window sequences
+
+    Returns:
+        <np.array[int32]> of shape (nb_windows, window-length)
+    """
+    values=pd.Series(values)
+    if not len(values):
+        return np.zeros((0,4),dtype=np.int32)
+    elif _is_str_column(values):
+        flat=','.join(values.astype(str).tolist()).translate(WINDOW_CHARS).split(',')
+        return np.array(flat,dtype=np.float64).reshape(len(values),-1).astype(np.int32)
+    else:
+        return np.array(values.tolist(),dtype=np.int32)
+
+
+def _is_str_column(values):
+    if pd.api.types.is_string_dtype(values.dtype):
+        return (len(values)==0) or isinstance(values.iloc[0],str)
+    else:
+        return False
+
+
+def _is_paths(data):
+    if isinstance(data,str):
+        return True
+    elif isinstance(data,list):
+        return bool(data) and all(isinstance(d,str) for d in data)
+    else:
+        return False
+
+
+def _load_metadata(path,key):
+    """ load cached (data,windows) if the cache-key matches """
+    if not os.path.isfile(path):
+        return None
+    try:
+        cached=pd.read_pickle(path,compression=None)
+    except Exception:
+        return None
+    if cached.get('key')==key:
+        return cached['data'], cached['windows']
+    else:
+        return None
+
+
+def _save_metadata(path,key,data,windows):
+    tmp_path=f'{path}.{os.getpid()}.tmp'
+    pd.to_pickle({'key': key, 'data': data, 'windows': windows},tmp_path,compression=None)
+    os.replace(tmp_path,path)
+
+
+def _union_window(windows):
+    """ smallest (x,y,w,h) window containing windows """
+    windows=np.asarray(windows)
+    x,y=windows[:,0].min(),windows[:,1].min()
+    return (
+        int(x),
+        int(y),
+        int((windows[:,0]+windows[:,2]).max()-x),
+        int((windows[:,1]+windows[:,3]).max()-y))
+
+
+def _slice_window(im,window,union):
+    """ view of (bands-last) image read with window union for window """
+    dx,dy=window[0]-union[0],window[1]-union[1]
+    return im[dy:dy+window[3],dx:dx+window[2]]
+
+
+def _window_shape(im,window):
+    return tuple(im.shape[:2])==(window[3],window[2])
+
 
+def _hashable(value):
+    if (value is None) or isinstance(value,(str,int,float)):
+        return value
+    else:
+        return tuple(np.ravel(value).tolist())
 
 
-    
\ No newline at end of file
+def _is_synced(url,path,record,head=None,verify=False):
+    """ check local file against its manifest record (and remote head) """
+    if (not record) or (record.get('url')!=url) or (not os.path.isfile(path)):
+        return False
+    if os.path.getsize(path)!=record['size']:
+        return False
+    if verify and (file_md5(path)!=record['md5']):
+        return False
+    if head:
+        if ('content-length' in head) and (int(head['content-length'])!=record['size']):
+            return False
+        etag=head.get('etag')
+        if etag and record.get('etag') and (etag!=record['etag']):
+            return False
+    return True
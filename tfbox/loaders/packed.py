@@ -0,0 +1,362 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import imagebox.processor as proc
+import tfbox.nn.addons as addons
+from tfbox.loaders.table import Table
+from tfbox.loaders.dfsequence import sparse_dtype, ONEHOT_DTYPE
+
+
+#
+# CONSTANTS
+#
+CONFIG_FILE='packed.json'
+INDEX_FILE='index.npz'
+ROWS_FILE='rows.pkl'
+FIELD_EXT='.bin'
+INPUT_FIELD='input'
+STATS_FIELD='input_stats'
+TARGET_FIELD='target'
+WEIGHT_FIELD='weight'
+BATCH_SIZE=6
+INDEX_ERROR='requested batch {} of {} batches'
+
+
+
+#
+# WRITER
+#
+def pack(sequence,directory,set_window=True,noisy=True):
+    """ pack the decoded examples of every row of a DFSequence into memmap-able files
+
+    Each field (input, target(s), weight) is written as one contiguous raw
+    array. `index.npz` holds the (element) offset and shape of every row
+    for each field along with the ident/group index (and windows), `rows.pkl`
+    the row metadata and `packed.json` the field specs and onehot/grouping config.
+
+    Args:
+        - sequence<DFSequence>: sequence to pack
+        - directory<str>: output directory
+        - set_window<bool>: if false ignore any window-cropping
+        - noisy<bool>: print progress
+
+    Returns:
+        <dict> config
+    """
+    os.makedirs(directory,exist_ok=True)
+    names=_field_names(sequence)
+    specs=sequence._example_spec()
+    nb_rows=len(sequence.data)
+    offsets=[np.zeros(nb_rows,dtype=np.int64) for _ in names]
+    shapes=[np.zeros((nb_rows,len(shape)),dtype=np.int64) for shape,_ in specs]
+    sizes=[0]*len(names)
+    if sequence.num_workers and (sequence.num_workers>1):
+        _map=sequence._pool().map
+    else:
+        _map=map
+    def _read(position):
+        return sequence._read_example(position,set_window=set_window,set_augment=False)
+    files=[open(_field_path(directory,n),'wb') for n in names]
+    try:
+        for p,arrays in enumerate(_map(_read,range(nb_rows))):
+            for i,(a,(_,dtype)) in enumerate(zip(arrays,specs)):
+                a=np.ascontiguousarray(a,dtype=dtype)
+                offsets[i][p]=sizes[i]
+                shapes[i][p]=a.shape
+                a.tofile(files[i])
+                sizes[i]+=a.size
+    finally:
+        for file in files:
+            file.close()
+    index={
+        'idents': np.array(
+            sequence.data[sequence.group_column].iloc[sequence.group_starts].tolist(),
+            dtype=str),
+        'group_starts': sequence.group_starts,
+        'group_counts': sequence.group_counts }
+    if sequence.windows is not None:
+        index['windows']=sequence.windows
+    for n,o,s in zip(names,offsets,shapes):
+        index[f'{n}_offsets']=o
+        index[f'{n}_shapes']=s
+    np.savez(os.path.join(directory,INDEX_FILE),**index)
+    sequence.data.to_pickle(os.path.join(directory,ROWS_FILE))
+    fields=[]
+    for n,s,(_,dtype),size in zip(names,shapes,specs,sizes):
+        if nb_rows and (s==s[0]).all():
+            shape=s[0].tolist()
+        else:
+            shape=None
+        fields.append({
+            'name': n,
+            'dtype': np.dtype(dtype).name,
+            'shape': shape,
+            'size': size })
+    if sequence.grouping:
+        group_maps=sequence.grouping.group_maps
+    else:
+        group_maps=None
+    config={
+        'fields': fields,
+        'nb_classes': sequence.nb_classes,
+        'onehot': sequence.onehot,
+        'sparse': sequence.sparse,
+        'input_stats': sequence.raw_inputs,
+        'droplast': sequence.droplast,
+        'group_maps': group_maps,
+        'sample_weights': bool(sequence.sample_weight_column),
+        'batch_size': sequence.batch_size,
+        'group_column': sequence.group_column,
+        'window_column': sequence.window_column if (sequence.windows is not None) else None,
+        'nb_rows': nb_rows }
+    with open(os.path.join(directory,CONFIG_FILE),'w') as file:
+        json.dump(config,file)
+    if noisy:
+        print(f'tfbox.packed: {nb_rows} rows ({sum(f.stat().st_size for f in os.scandir(directory))} bytes)')
+    return config
+
+
+
+
+#
+# SEQUENCE
+#
+class PackedSequence(tf.keras.utils.Sequence):
+    """ keras Sequence over a directory written by `pack`
+
+    Fields are memory-mapped so examples are read as slices of the page
+    cache with no per-file open or decode. Like `DFSequence`, one row is
+    sampled for each ident per epoch and `batch_rows` holds the rows of
+    the last selected batch.
+
+    Args:
+        - directory<str>: directory written by `pack`
+        - batch_size<int|None>: batch size. defaults to batch_size of the packed sequence
+        - shuffle<bool>: shuffle idents on reset
+        - augment<bool>: randomly rotate/flip inputs and targets
+    """
+    def __init__(self,directory,batch_size=None,shuffle=True,augment=False):
+        self.directory=directory
+        with open(os.path.join(directory,CONFIG_FILE),'r') as file:
+            self.config=json.load(file)
+        self.batch_size=batch_size or self.config['batch_size'] or BATCH_SIZE
+        self.shuffle=shuffle
+        self.augment=augment
+        self.nb_classes=self.config['nb_classes']
+        self.nb_classes_list=isinstance(self.nb_classes,list)
+        self.onehot=self.config['onehot']
+        self.sparse=self.config.get('sparse',False)
+        self.input_stats=self.config.get('input_stats',False)
+        self.droplast=self.config['droplast']
+        self.sample_weights=self.config['sample_weights']
+        self.group_column=self.config['group_column']
+        if self.config['group_maps']:
+            self.grouping=addons.Groups(self.config['group_maps'])
+        else:
+            self.grouping=False
+        if self.grouping and self.sparse:
+            if self.nb_classes_list:
+                nb_classes=self.nb_classes[0]
+            else:
+                nb_classes=self.nb_classes
+            self.group_lookup=self.grouping.sparse_lookup(nb_classes)
+        else:
+            self.group_lookup=None
+        self.data=pd.read_pickle(os.path.join(directory,ROWS_FILE))
+        index=np.load(os.path.join(directory,INDEX_FILE))
+        window_column=self.config.get('window_column')
+        if window_column:
+            self.table=Table(self.data,{ window_column: index['windows'] })
+        else:
+            self.table=Table(self.data)
+        self.group_starts=index['group_starts']
+        self.group_counts=index['group_counts']
+        self.groups=index['idents']
+        self.idents=np.arange(len(self.groups),dtype=np.int32)
+        self.fields=[ _Field(directory,f,index) for f in self.config['fields'] ]
+        self.nb_batches=int(len(self.idents)//self.batch_size)
+        self.reset()
+
+
+    def select_batch(self,batch_index):
+        """ select batch (w/o loading arrays) """
+        if batch_index>=self.nb_batches:
+            raise ValueError(INDEX_ERROR.format(batch_index,self.nb_batches))
+        self.batch_index=batch_index
+        self.start_index=self.batch_index*self.batch_size
+        self.end_index=self.start_index+self.batch_size
+        self.batch_idents=self.groups[self.idents[self.start_index:self.end_index]]
+        self.batch_positions=self._batch_positions(batch_index)
+        self.batch_rows=[ self.table.row(p) for p in self.batch_positions ]
+
+
+    def get_batch(self,batch_index):
+        """ returns inputs-targets(-sample_weights) batch """
+        self.select_batch(batch_index)
+        arrays=[ f.batch(self.batch_positions) for f in self.fields ]
+        if self.augment:
+            self._augment(arrays)
+        if self.input_stats:
+            inpts=arrays[:2]
+            arrays=arrays[1:]
+        else:
+            inpts=arrays[0]
+        if self.nb_classes_list:
+            targs=arrays[1:1+len(self.nb_classes)]
+        else:
+            targs=arrays[1]
+        if self.onehot:
+            targs=self._onehot(targs)
+        if self.grouping and self.sparse:
+            targs=[
+                targs,
+                self.group_lookup[targs].astype(sparse_dtype(self.grouping.nb_groups+1)) ]
+        elif self.grouping:
+            targs=[targs,self.grouping.numpy(targs)]
+        if self.sample_weights:
+            return inpts, targs, arrays[-1]
+        else:
+            return inpts, targs
+
+
+    def example(self,position):
+        """ flat list of (zero-copy, non-onehot) arrays for row-position """
+        return [ f.example(position) for f in self.fields ]
+
+
+    def reset(self):
+        """ reset loader properties. (optionally) shuffle dataset """
+        self.batch_index=0
+        self.start_index=None
+        self.end_index=None
+        self.batch_idents=None
+        self.batch_positions=None
+        self.batch_rows=None
+        self.planned_positions={}
+        if self.shuffle:
+            np.random.shuffle(self.idents)
+
+
+    #
+    # Sequence Interface
+    #
+    def __len__(self):
+        """ number of batches """
+        return self.nb_batches
+
+
+    def __getitem__(self,batch_index):
+        """ return input-target batch """
+        return self.get_batch(batch_index)
+
+
+    def on_epoch_end(self):
+        """ on-epoch-end callback """
+        self.reset()
+
+
+    #
+    # INTERNAL
+    #
+    def _batch_positions(self,batch_index):
+        """ row-positions for batch (fixed for the current epoch once selected) """
+        positions=self.planned_positions.get(batch_index)
+        if positions is None:
+            start_index=batch_index*self.batch_size
+            codes=self.idents[start_index:start_index+self.batch_size]
+            counts=self.group_counts[codes]
+            offsets=(np.random.random(len(codes))*counts).astype(int)
+            positions=self.group_starts[codes]+offsets
+            self.planned_positions[batch_index]=positions
+        return positions
+
+
+    def _augment(self,arrays):
+        """ in place rotate/flip of each example of the input and target batches
+
+        batches of non-square examples are only rotated by 0/180 degrees
+        """
+        nb_images=len(arrays)-int(self.sample_weights)
+        images=[arrays[0]]+arrays[1+int(self.input_stats):nb_images]
+        square=images[0].shape[1]==images[0].shape[2]
+        for b in range(self.batch_size):
+            k,flip=proc.augmentation()
+            if not square:
+                k=k-(k%2)
+            for a in images:
+                a[b]=proc.augment(a[b],k,flip,bands_first=False)
+
+
+    def _onehot(self,targ):
+        if self.nb_classes_list:
+            return [self._to_onehot(t,n) for (t,n) in zip(targ,self.nb_classes)]
+        else:
+            return self._to_onehot(targ,self.nb_classes)
+
+
+    def _to_onehot(self,targ,nb_classes):
+        if (targ.ndim>3) and (targ.shape[-1]==1):
+            targ=targ[...,0]
+        eye=np.eye(nb_classes,dtype=ONEHOT_DTYPE)
+        if self.droplast:
+            eye=eye[:,:-1]
+        return eye[targ]
+
+
+
+
+class _Field(object):
+    """ memory-mapped packed field """
+    def __init__(self,directory,config,index):
+        self.name=config['name']
+        self.dtype=np.dtype(config['dtype'])
+        self.shape=config['shape']
+        self.offsets=index[f'{self.name}_offsets']
+        self.shapes=index[f'{self.name}_shapes']
+        self.array=np.memmap(
+            _field_path(directory,self.name),
+            dtype=self.dtype,
+            mode='r',
+            shape=(config['size'],))
+        if self.shape is not None:
+            self.array=self.array.reshape([len(self.offsets)]+self.shape)
+
+
+    def example(self,position):
+        if self.shape is None:
+            shape=self.shapes[position]
+            offset=self.offsets[position]
+            return self.array[offset:offset+int(np.prod(shape))].reshape(shape)
+        else:
+            return self.array[position]
+
+
+    def batch(self,positions):
+        if self.shape is None:
+            return np.stack([self.example(p) for p in positions])
+        else:
+            return self.array[np.asarray(positions)]
+
+
+
+
+#
+# HELPERS
+#
+def _field_names(sequence):
+    names=[INPUT_FIELD]
+    if sequence.raw_inputs:
+        names.append(STATS_FIELD)
+    if sequence.nb_classes_list:
+        names+=[f'{TARGET_FIELD}_{i}' for i in range(len(sequence.nb_classes))]
+    else:
+        names.append(TARGET_FIELD)
+    if sequence.sample_weight_column:
+        names.append(WEIGHT_FIELD)
+    return names
+
+
+def _field_path(directory,name):
+    return os.path.join(directory,f'{name}{FIELD_EXT}')
@@ -0,0 +1,119 @@
+import queue
+import threading
+
+
+#
+# CONSTANTS
+#
+PUT_TIMEOUT=0.1
+
+
+
+class BatchPrefetcher(object):
+    """ background producer of upcoming batches
+
+    A producer thread assembles batches `start_index, start_index+1, ...`
+    into a bounded queue while the consumer works on earlier batches. Batches
+    are expected to be requested in order. Requesting any other batch (or
+    passing a different `key`) cancels the producer and restarts it at
+    the requested batch.
+
+    Args:
+        - depth<int>: maximum number of assembled batches waiting in the queue
+    """
+    def __init__(self,depth):
+        self.depth=depth
+        self._thread=None
+        self._stop=None
+        self._queue=None
+        self.next_index=None
+        self.key=None
+
+
+    def get(self,batch_index,produce,stop_index,key=None):
+        """ return batch from producer (restarting producer if needed)
+
+        Args:
+            - batch_index<int>: batch index
+            - produce<func>: batch_index => batch
+            - stop_index<int>: the producer stops after `stop_index-1`
+            - key<any>: batches produced with different keys are not reused
+        """
+        if (batch_index!=self.next_index) or (key!=self.key) or (not self.running):
+            self.stop()
+            self._start(batch_index,produce,stop_index,key)
+        index,batch,error=self._queue.get()
+        self.next_index=index+1
+        if error:
+            self.stop()
+            raise error
+        return batch
+
+
+    def stop(self):
+        """ cancel producer and discard queued batches """
+        if self._thread is not None:
+            self._stop.set()
+            while self._thread.is_alive():
+                self._drain()
+                self._thread.join(timeout=PUT_TIMEOUT)
+            self._drain()
+        self._thread=None
+        self._stop=None
+        self._queue=None
+        self.next_index=None
+        self.key=None
+
+
+    @property
+    def running(self):
+        if self._thread is None:
+            return False
+        else:
+            return self._thread.is_alive() or (not self._queue.empty())
+
+
+    #
+    # INTERNAL
+    #
+    def _start(self,start_index,produce,stop_index,key):
+        self._stop=threading.Event()
+        self._queue=queue.Queue(maxsize=self.depth)
+        self.next_index=start_index
+        self.key=key
+        self._thread=threading.Thread(
+            target=_produce,
+            args=(produce,start_index,stop_index,self._queue,self._stop),
+            daemon=True)
+        self._thread.start()
+
+
+    def _drain(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+
+
+#
+# PRODUCER
+#
+def _produce(produce,start_index,stop_index,batches,stop):
+    for index in range(start_index,stop_index):
+        if stop.is_set():
+            return
+        try:
+            item=(index,produce(index),None)
+        except Exception as e:
+            item=(index,None,e)
+        while not stop.is_set():
+            try:
+                batches.put(item,timeout=PUT_TIMEOUT)
+                break
+            except queue.Full:
+                pass
+        if item[2] is not None:
+            return
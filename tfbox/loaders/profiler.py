@@ -0,0 +1,156 @@
+import time
+import threading
+import contextlib
+import numpy as np
+
+
+#
+# CONSTANTS
+#
+STAGES=[
+    'batch',
+    'select',
+    'window',
+    'read',
+    'augment',
+    'onehot',
+    'grouping',
+    'stack' ]
+COUNTERS=[
+    'bytes_read',
+    'bytes_decoded',
+    'cache_hits',
+    'cache_misses',
+    'disk_cache_hits',
+    'disk_cache_misses' ]
+PERCENTILES=[50,95]
+HISTOGRAM_BINS=20
+NULL_TIMER=contextlib.nullcontext()
+
+
+
+class Profiler(object):
+    """ per-stage wall times and counters aggregated per epoch
+
+    Stage times are recorded for each call (ie. per example for `read` and
+    per batch for `stack`) so they can be summarized or histogrammed.
+    Recording is thread-safe. Stages run in worker processes are not recorded.
+
+    Args:
+        - noisy<bool>: print the epoch report on `end_epoch`
+    """
+    def __init__(self,noisy=False):
+        self.noisy=noisy
+        self.epoch=0
+        self.epochs=[]
+        self._lock=threading.Lock()
+        self._start_epoch()
+
+
+    @contextlib.contextmanager
+    def timer(self,stage):
+        """ context manager that records the wall time of the block for stage """
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage,time.perf_counter()-start)
+
+
+    def add(self,stage,seconds):
+        with self._lock:
+            self._times.setdefault(stage,[]).append(seconds)
+
+
+    def count(self,counter,value=1):
+        with self._lock:
+            self._counters[counter]=self._counters.get(counter,0)+value
+
+
+    def end_epoch(self):
+        """ close the current epoch (printing the report if noisy) """
+        with self._lock:
+            self.epochs.append({
+                'epoch': self.epoch,
+                'times': { k: np.array(v) for k,v in self._times.items() },
+                'counters': dict(self._counters) })
+            self.epoch+=1
+            self._start_epoch()
+        if self.noisy:
+            print(self.report(-1))
+
+
+    def summary(self,epoch=None):
+        """ count, total, mean, max and percentiles of each stage and the counters
+
+        Args:
+            - epoch<int|None>: index of a completed epoch (ie. -1). if None the current epoch
+        """
+        times,counters=self._epoch(epoch)
+        stages={}
+        for stage in _ordered(times,STAGES):
+            values=times[stage]
+            stage_summary={
+                'count': len(values),
+                'total': float(values.sum()),
+                'mean': float(values.mean()),
+                'max': float(values.max()) }
+            for p,v in zip(PERCENTILES,np.percentile(values,PERCENTILES)):
+                stage_summary[f'p{p}']=float(v)
+            stages[stage]=stage_summary
+        return { 'stages': stages, 'counters': counters }
+
+
+    def histogram(self,stage,epoch=None,bins=HISTOGRAM_BINS):
+        """ (counts,bin_edges) of the wall times of stage """
+        times,_=self._epoch(epoch)
+        return np.histogram(times.get(stage,np.array([])),bins=bins)
+
+
+    def report(self,epoch=None):
+        """ summary as a printable table """
+        summary=self.summary(epoch)
+        lines=[f'tfbox.profiler: epoch {self._epoch_number(epoch)}']
+        for stage,s in summary['stages'].items():
+            lines.append(
+                f'  {stage:<10}{s["count"]:>8} calls {s["total"]:>10.3f}s '
+                f'(mean {1000*s["mean"]:.3f}ms, p95 {1000*s["p95"]:.3f}ms)')
+        for counter in _ordered(summary['counters'],COUNTERS):
+            lines.append(f'  {counter:<18}{summary["counters"][counter]}')
+        return '\n'.join(lines)
+
+
+    #
+    # INTERNAL
+    #
+    def _start_epoch(self):
+        self._times={}
+        self._counters={}
+
+
+    def _epoch(self,epoch):
+        with self._lock:
+            if epoch is None:
+                times={ k: np.array(v) for k,v in self._times.items() }
+                counters=dict(self._counters)
+            else:
+                times=self.epochs[epoch]['times']
+                counters=self.epochs[epoch]['counters']
+        return { k: v for k,v in times.items() if len(v) }, counters
+
+
+    def _epoch_number(self,epoch):
+        if epoch is None:
+            return self.epoch
+        else:
+            return self.epochs[epoch]['epoch']
+
+
+
+
+#
+# HELPERS
+#
+def _ordered(keys,order):
+    """ keys in `order` followed by any other keys """
+    return [k for k in order if k in keys]+[k for k in keys if k not in order]
@@ -0,0 +1,620 @@
+import os
+import re
+import ssl
+import shutil
+import asyncio
+import hashlib
+import tempfile
+import functools
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit, urljoin
+
+
+#
+# CONSTANTS
+#
+GCS_URL='https://storage.googleapis.com'
+REMOTE_HEAD=r'^(gs|http|https)://'
+MAX_CONNECTIONS=16
+MAX_IN_FLIGHT=64
+RETRIES=3
+BACKOFF=0.5
+TIMEOUT=60
+MAX_REDIRECTS=5
+CHUNK_SIZE=2**20
+RETRY_STATUSES=[408,429,500,502,503,504]
+REDIRECT_STATUSES=[301,302,303,307,308]
+CREDENTIAL_HEADERS=['authorization','proxy-authorization','cookie']
+USER_AGENT='tfbox'
+PROCESS_ATTRS=[
+    'paths',
+    '_keys',
+    '_counts',
+    '_tasks',
+    '_downloaded',
+    '_lock',
+    '_loop',
+    '_thread',
+    '_pid',
+    '_pool',
+    '_in_flight',
+    '_ssl' ]
+
+
+
+class RemoteError(IOError):
+    """ failed remote request """
+    def __init__(self,url,status,retry=False):
+        super(RemoteError,self).__init__(f'RemoteError: {status} ({url})')
+        self.url=url
+        self.status=status
+        self.retry=retry
+
+
+
+
+class RemoteReader(object):
+    """ concurrent (asyncio) downloads of remote (gs/http/https) files
+
+    Files are fetched over a bounded pool of keep-alive HTTP/1.1 connections
+    with retries and a limit on the number of in-flight requests. The event
+    loop runs in a background thread so files for upcoming batches can be
+    requested (`prefetch`) while the current batch is being used.
+
+    Downloaded files are reference counted by key (ie. batch index) and
+    removed from the local directory once every key using them is released.
+    Only files downloaded by the reader are removed. A pickled (or forked)
+    reader, ie. in a worker process, shares the directory but starts with
+    its own keys and event loop.
+
+    Credential headers (Authorization, Cookie) are dropped when a request is
+    redirected to a different origin (scheme, host or port).
+
+    Args:
+        - directory<str|None>: local download directory (defaults to a tempdir)
+        - max_connections<int>: maximum number of open connections
+        - max_in_flight<int>: maximum number of concurrent requests
+        - retries<int>: number of retries for failed requests
+        - backoff<float>: exponential backoff (seconds) between retries
+        - timeout<float>:
+            timeout (seconds) for connecting and for each read, so large files
+            are not timed out as long as data keeps arriving
+        - headers<dict|func|None>:
+            request headers (ie auth) or function returning request headers
+    """
+    def __init__(self,
+            directory=None,
+            max_connections=MAX_CONNECTIONS,
+            max_in_flight=MAX_IN_FLIGHT,
+            retries=RETRIES,
+            backoff=BACKOFF,
+            timeout=TIMEOUT,
+            headers=None):
+        if directory:
+            os.makedirs(directory,exist_ok=True)
+            self._tmp_directory=False
+        else:
+            directory=tempfile.mkdtemp(prefix='tfbox_remote_')
+            self._tmp_directory=True
+        self.directory=directory
+        self.max_connections=max_connections
+        self.max_in_flight=max_in_flight
+        self.retries=retries
+        self.backoff=backoff
+        self.timeout=timeout
+        self.headers=headers
+        self._reset()
+
+
+    def fetch(self,urls,key=None):
+        """ download urls (if needed) and return dict of url => local path """
+        self.prefetch(urls,key=key)
+        return self.wait(urls)
+
+
+    def prefetch(self,urls,key=None):
+        """ start downloading urls without waiting (no-op if key was already fetched) """
+        urls=list(dict.fromkeys(urls))
+        self._ensure_loop()
+        with self._lock:
+            if (key is not None) and (key in self._keys):
+                return
+            if key is not None:
+                self._keys[key]=urls
+                for u in urls:
+                    self._counts[u]+=1
+        asyncio.run_coroutine_threadsafe(self._schedule_all(urls),self._loop).result()
+
+
+    def wait(self,urls):
+        """ wait for downloads and return dict of url => local path """
+        futures=[
+            asyncio.run_coroutine_threadsafe(self._await(u),self._loop)
+            for u in dict.fromkeys(urls) ]
+        return dict(f.result() for f in futures)
+
+
+    def download(self,items,raise_errors=True):
+        """ download (url,path) pairs concurrently
+
+        Returns:
+            <dict> path => {'url','size','md5','etag'}
+            (and <dict> url => exception, if not raise_errors)
+        """
+        self._ensure_loop()
+        future=asyncio.run_coroutine_threadsafe(self._download_all(items),self._loop)
+        records={}
+        errors={}
+        for (url,path),result in zip(items,future.result()):
+            if isinstance(result,BaseException):
+                errors[url]=result
+            else:
+                records[path]=result
+        if raise_errors:
+            if errors:
+                raise next(iter(errors.values()))
+            return records
+        else:
+            return records, errors
+
+
+    def head(self,urls,raise_errors=True):
+        """ concurrent HEAD requests
+
+        Returns:
+            <dict> url => (lower-case) headers
+            (and <dict> url => exception, if not raise_errors)
+        """
+        self._ensure_loop()
+        future=asyncio.run_coroutine_threadsafe(self._head_all(urls),self._loop)
+        heads={}
+        errors={}
+        for url,result in zip(urls,future.result()):
+            if isinstance(result,BaseException):
+                errors[url]=result
+            else:
+                heads[url]=result
+        if raise_errors:
+            if errors:
+                raise next(iter(errors.values()))
+            return heads
+        else:
+            return heads, errors
+
+
+    def release(self,key):
+        """ release files fetched with key (removing files no longer in use) """
+        with self._lock:
+            urls=self._keys.pop(key,[])
+            removed=[]
+            for u in urls:
+                self._counts[u]-=1
+                if self._counts[u]<=0:
+                    self._counts.pop(u)
+                    removed.append(u)
+        for u in removed:
+            self._discard(u)
+
+
+    def release_all(self):
+        for key in list(self._keys.keys()):
+            self.release(key)
+
+
+    def close(self):
+        """ stop event loop, close connections and remove (temporary) files """
+        self.release_all()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._close_pool(),self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop=None
+            self._thread=None
+        if self._tmp_directory:
+            shutil.rmtree(self.directory,ignore_errors=True)
+
+
+    def local_path(self,url):
+        """ local path for url """
+        name=os.path.basename(urlsplit(url).path) or 'index'
+        return os.path.join(
+            self.directory,
+            f'{hashlib.md5(url.encode()).hexdigest()[:16]}_{name}')
+
+
+    def __getstate__(self):
+        """ config only: the copy shares the directory but not keys, tasks or the event loop """
+        state={ k: v for k,v in self.__dict__.items() if k not in PROCESS_ATTRS }
+        state['_tmp_directory']=False
+        return state
+
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._reset()
+
+
+    #
+    # INTERNAL
+    #
+    def _reset(self):
+        """ reset per-process state (keys, downloads and event loop) """
+        self.paths={}
+        self._keys={}
+        self._counts=defaultdict(int)
+        self._tasks={}
+        self._downloaded=set()
+        self._lock=threading.Lock()
+        self._loop=None
+        self._thread=None
+        self._pid=os.getpid()
+
+
+    def _ensure_loop(self):
+        if self._pid!=os.getpid():
+            self._tmp_directory=False
+            self._reset()
+        with self._lock:
+            if self._loop is None:
+                self._loop=asyncio.new_event_loop()
+                self._thread=threading.Thread(target=self._run_loop,daemon=True)
+                self._thread.start()
+
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._pool=_ConnectionPool(self.max_connections)
+        self._in_flight=asyncio.Semaphore(self.max_in_flight)
+        self._ssl=ssl.create_default_context()
+        self._loop.run_forever()
+
+
+    async def _schedule_all(self,urls):
+        for u in urls:
+            await self._schedule(u)
+
+
+    async def _schedule(self,url):
+        if url not in self._tasks:
+            task=asyncio.ensure_future(self._download(url))
+            task.add_done_callback(functools.partial(self._drop_failed,url))
+            self._tasks[url]=task
+
+
+    def _drop_failed(self,url,task):
+        """ forget failed downloads so the next fetch requests them again """
+        if (task.cancelled() or task.exception()) and (self._tasks.get(url) is task):
+            self._tasks.pop(url)
+
+
+    async def _await(self,url):
+        await self._schedule(url)
+        path=await self._tasks[url]
+        self.paths[url]=path
+        return url, path
+
+
+    def _discard(self,url):
+        self.paths.pop(url,None)
+        def _remove():
+            task=self._tasks.pop(url,None)
+            if task and (not task.done()):
+                task.cancel()
+            if url in self._downloaded:
+                self._downloaded.remove(url)
+                path=self.local_path(url)
+                if os.path.exists(path):
+                    os.remove(path)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(_remove)
+        else:
+            _remove()
+
+
+    async def _download(self,url):
+        path=self.local_path(url)
+        if not os.path.exists(path):
+            self._downloaded.add(url)
+            await self._request_with_retries(url,path)
+        return path
+
+
+    async def _download_all(self,items):
+        async def _download_to(url,path):
+            dirname=os.path.dirname(path)
+            if dirname:
+                os.makedirs(dirname,exist_ok=True)
+            headers,info=await self._request_with_retries(url,path)
+            info['url']=url
+            info['etag']=headers.get('etag')
+            return info
+        return await asyncio.gather(
+            *[_download_to(u,p) for u,p in items],
+            return_exceptions=True)
+
+
+    async def _head_all(self,urls):
+        async def _head(url):
+            headers,_=await self._request_with_retries(url,method='HEAD')
+            return headers
+        return await asyncio.gather(
+            *[_head(u) for u in urls],
+            return_exceptions=True)
+
+
+    async def _request_with_retries(self,url,path=None,method='GET'):
+        async with self._in_flight:
+            for attempt in range(self.retries+1):
+                try:
+                    return await self._get(url,path,method=method)
+                except (RemoteError,OSError,asyncio.TimeoutError,asyncio.IncompleteReadError) as e:
+                    if (attempt==self.retries) or (isinstance(e,RemoteError) and not e.retry):
+                        raise
+                    await asyncio.sleep(self.backoff*(2**attempt))
+
+
+    async def _get(self,url,path=None,method='GET'):
+        """ request url and (for GET requests) write body to path
+
+        Returns:
+            (headers,info) where info is {'size','md5'} of the written file
+        """
+        request_url=_request_url(url)
+        request_origin=None
+        for _ in range(MAX_REDIRECTS+1):
+            parts=urlsplit(request_url)
+            origin=(parts.scheme,parts.hostname,parts.port or _default_port(parts.scheme))
+            if request_origin is None:
+                request_origin=origin
+            reader,writer=await _timed(self._pool.acquire(origin,self._ssl),self.timeout)
+            reader=_TimedReader(reader,self.timeout)
+            reuse=False
+            try:
+                target=parts.path or '/'
+                if parts.query:
+                    target=f'{target}?{parts.query}'
+                writer.write(self._request(
+                    parts.hostname,
+                    target,
+                    method,
+                    credentials=(origin==request_origin)).encode())
+                await _timed(writer.drain(),self.timeout)
+                status,headers=await _read_head(reader)
+                has_body=method!='HEAD'
+                if status in REDIRECT_STATUSES:
+                    if has_body:
+                        await _read_body(reader,headers,None)
+                    reuse=_keep_alive(headers)
+                    request_url=urljoin(request_url,headers['location'])
+                    continue
+                if status!=200:
+                    if has_body:
+                        await _read_body(reader,headers,None)
+                    reuse=_keep_alive(headers)
+                    raise RemoteError(url,status,retry=status in RETRY_STATUSES)
+                info={}
+                if has_body:
+                    hashed=await self._write_body(reader,headers,path)
+                    info={'size': hashed.size, 'md5': hashed.md5.hexdigest()}
+                reuse=_keep_alive(headers)
+                return headers, info
+            finally:
+                self._pool.release(origin,(reader.reader,writer),reuse)
+        raise RemoteError(url,'too many redirects')
+
+
+    async def _write_body(self,reader,headers,path):
+        """ write body to a temporary file unique to this writer and move it to path
+
+        readers in other processes (ie. workers and the parent's lookahead) may be
+        downloading the same file to the same directory
+        """
+        directory,name=os.path.split(path)
+        fd,tmp_path=tempfile.mkstemp(prefix=f'{name}.',suffix='.part',dir=directory or None)
+        try:
+            with os.fdopen(fd,'wb') as file:
+                hashed=_HashingWriter(file)
+                await _read_body(reader,headers,hashed)
+            os.replace(tmp_path,path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return hashed
+
+
+    def _request(self,host,target,method='GET',credentials=True):
+        """ request head. user credential headers are dropped if not credentials """
+        headers={
+            'Host': host,
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'identity',
+            'Connection': 'keep-alive' }
+        if callable(self.headers):
+            headers.update(self.headers())
+        elif self.headers:
+            headers.update(self.headers)
+        if not credentials:
+            headers={ k: v for k,v in headers.items() if k.lower() not in CREDENTIAL_HEADERS }
+        lines=[f'{method} {target} HTTP/1.1']+[f'{k}: {v}' for k,v in headers.items()]
+        return '\r\n'.join(lines)+'\r\n\r\n'
+
+
+    async def _close_pool(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks={}
+        self._pool.close()
+
+
+
+
+class _ConnectionPool(object):
+    """ bounded pool of keep-alive connections by origin """
+    def __init__(self,max_connections):
+        self.max_connections=max_connections
+        self._slots=asyncio.Semaphore(max_connections)
+        self._idle=defaultdict(list)
+
+
+    async def acquire(self,origin,ssl_context):
+        await self._slots.acquire()
+        try:
+            while self._idle[origin]:
+                reader,writer=self._idle[origin].pop()
+                if not (writer.is_closing() or reader.at_eof()):
+                    return reader,writer
+            scheme,host,port=origin
+            return await asyncio.open_connection(
+                host,
+                port,
+                ssl=ssl_context if scheme=='https' else None)
+        except BaseException:
+            self._slots.release()
+            raise
+
+
+    def release(self,origin,connection,reuse):
+        if reuse and (sum(len(v) for v in self._idle.values())<self.max_connections):
+            self._idle[origin].append(connection)
+        else:
+            connection[1].close()
+        self._slots.release()
+
+
+    def close(self):
+        for connections in self._idle.values():
+            for _,writer in connections:
+                writer.close()
+        self._idle=defaultdict(list)
+
+
+
+
+class _TimedReader(object):
+    """ stream reader wrapper with a timeout for each read """
+    def __init__(self,reader,timeout):
+        self.reader=reader
+        self.timeout=timeout
+
+
+    async def readline(self):
+        return await _timed(self.reader.readline(),self.timeout)
+
+
+    async def readexactly(self,size):
+        return await _timed(self.reader.readexactly(size),self.timeout)
+
+
+    async def read(self,size):
+        return await _timed(self.reader.read(size),self.timeout)
+
+
+
+
+class _HashingWriter(object):
+    """ file writer that tracks the md5 and size of the written bytes """
+    def __init__(self,file):
+        self.file=file
+        self.md5=hashlib.md5()
+        self.size=0
+
+
+    def write(self,chunk):
+        self.file.write(chunk)
+        self.md5.update(chunk)
+        self.size+=len(chunk)
+
+
+
+
+#
+# HELPERS
+#
+def is_remote(path):
+    return bool(re.search(REMOTE_HEAD,str(path)))
+
+
+def file_md5(path):
+    """ md5 hexdigest of local file """
+    md5=hashlib.md5()
+    with open(path,'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE),b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _request_url(url):
+    if url.startswith('gs://'):
+        return f'{GCS_URL}/{url[5:]}'
+    else:
+        return url
+
+
+async def _timed(awaitable,timeout):
+    if timeout:
+        return await asyncio.wait_for(awaitable,timeout)
+    else:
+        return await awaitable
+
+
+def _default_port(scheme):
+    return 443 if scheme=='https' else 80
+
+
+async def _read_head(reader):
+    status_line=await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('connection closed')
+    status=int(status_line.split()[1])
+    headers={}
+    while True:
+        line=await reader.readline()
+        if line in (b'\r\n',b'\n',b''):
+            break
+        k,v=line.decode('latin-1').split(':',1)
+        headers[k.strip().lower()]=v.strip()
+    return status, headers
+
+
+async def _read_body(reader,headers,file):
+    if headers.get('transfer-encoding','').lower()=='chunked':
+        while True:
+            size=int((await reader.readline()).split(b';')[0],16)
+            if size==0:
+                while (await reader.readline()) not in (b'\r\n',b'\n',b''):
+                    pass
+                break
+            await _read_exactly(reader,size,file)
+            await reader.readexactly(2)
+    elif 'content-length' in headers:
+        await _read_exactly(reader,int(headers['content-length']),file)
+    else:
+        while True:
+            chunk=await reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            _write(file,chunk)
+        headers['connection']='close'
+
+
+async def _read_exactly(reader,size,file):
+    """ read size bytes to file as they arrive (so timeouts apply to each read) """
+    remaining=size
+    while remaining:
+        chunk=await reader.read(min(remaining,CHUNK_SIZE))
+        if not chunk:
+            raise asyncio.IncompleteReadError(b'',remaining)
+        _write(file,chunk)
+        remaining-=len(chunk)
+
+
+def _write(file,chunk):
+    if file is not None:
+        file.write(chunk)
+
+
+def _keep_alive(headers):
+    return headers.get('connection','').lower()!='close'
@@ -0,0 +1,245 @@
+import os
+import hashlib
+import numpy as np
+from tfbox.loaders.cache import _hash
+
+
+#
+# CONSTANTS
+#
+COUNT_DTYPE=np.uint32
+EMPTY_CLASSES=[0]
+WEIGHTS_ERROR='sampler weights must be non-negative with a positive sum'
+SIZE_ERROR='sampler has {} weights for {} idents'
+
+
+
+#
+# CLASS INDEX
+#
+def class_index(sequence,path=None,set_window=True,noisy=True):
+    """ per-row class pixel histograms for the (un-augmented) targets of a DFSequence
+
+    Only targets are read. For multi-target sequences the histogram is
+    computed for the first target. Values outside [0,nb_classes) are ignored.
+    If `path` is given the index is loaded from (or saved to) an `.npz` file
+    keyed by the target paths, windows and handler config (ie. value_map,
+    target_preprocess, cropping, resolution).
+
+    Args:
+        - sequence<DFSequence>: sequence to index
+        - path<str|None>: (optional) cache path
+        - set_window<bool>: if false ignore any window-cropping
+        - noisy<bool>: print progress
+
+    Returns:
+        <np.array[uint32]> (nb_rows,nb_classes) pixel counts
+    """
+    key=_index_key(sequence,set_window)
+    if path and os.path.isfile(path):
+        cached=np.load(path)
+        if str(cached['key'])==key:
+            return cached['counts']
+    nb_classes=sequence._group_nb_classes()
+    def _counts(position):
+        if sequence.num_workers and (sequence.num_workers>1):
+            handler=sequence._local_handler()
+        else:
+            handler=sequence.handler
+        row=sequence.table.row(position)
+        if set_window:
+            handler.set_window(window=sequence._window(row))
+        handler.set_augmentation(k=False,flip=False)
+        with sequence._fetched([sequence._remote_url(row[sequence.target_column])]):
+            targ=sequence.get_target(row,handler=handler,onehot=False)
+        if sequence.nb_classes_list:
+            targ=targ[0]
+        targ=np.asarray(targ).astype(np.int64,copy=False).ravel()
+        targ=targ[(targ>=0)&(targ<nb_classes)]
+        return np.bincount(targ,minlength=nb_classes)
+    if sequence.num_workers and (sequence.num_workers>1):
+        _map=sequence._pool().map
+    else:
+        _map=map
+    nb_rows=len(sequence.data)
+    counts=np.zeros((nb_rows,nb_classes),dtype=COUNT_DTYPE)
+    for p,c in enumerate(_map(_counts,range(nb_rows))):
+        counts[p]=c
+    if path:
+        tmp_path=f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path,key=key,counts=counts)
+        os.replace(tmp_path,path)
+    if noisy:
+        print(f'tfbox.sampler: indexed {nb_rows} rows')
+    return counts
+
+
+def ident_histograms(sequence,counts):
+    """ sum per-row class histograms over the rows of each ident
+
+    Returns:
+        <np.array[int64]> (nb_idents,nb_classes) with rows ordered by ident-code
+    """
+    return np.add.reduceat(counts.astype(np.int64),sequence.group_starts,axis=0)
+
+
+def class_weights(
+        histograms,
+        weights=None,
+        skip_empty=False,
+        empty_classes=EMPTY_CLASSES):
+    """ per-ident sampling weights from class presence
+
+    Each ident is weighted by the largest class-weight of the classes present
+    in the ident. By default class-weights are the inverse of the fraction of
+    idents containing the class so idents with rare classes are drawn more often.
+
+    Args:
+        - histograms<np.array>: (nb_idents,nb_classes) class pixel counts
+        - weights<list|None>: (optional) user given class-weights
+        - skip_empty<bool>:
+            if true idents containing only `empty_classes` have zero weight
+        - empty_classes<list>: classes that do not count as labels
+
+    Returns:
+        <np.array[float64]> (nb_idents,) weights
+    """
+    presence=np.asarray(histograms)>0
+    if weights is None:
+        frequency=presence.mean(axis=0)
+        weights=np.zeros(len(frequency))
+        weights[frequency>0]=1/frequency[frequency>0]
+    else:
+        weights=np.asarray(weights,dtype=np.float64)
+    ident_weights=np.where(presence,weights,0).max(axis=1)
+    if skip_empty:
+        labeled=np.ones(presence.shape[1],dtype=bool)
+        labeled[list(empty_classes)]=False
+        ident_weights[~presence[:,labeled].any(axis=1)]=0
+    return ident_weights
+
+
+
+
+#
+# SAMPLERS
+#
+class AliasSampler(object):
+    """ weighted sampling with replacement in O(1) per draw (Vose's alias method)
+
+    Args:
+        - weights<array>: non-negative (unnormalized) weights
+    """
+    def __init__(self,weights):
+        weights=np.asarray(weights,dtype=np.float64)
+        total=weights.sum()
+        if (weights<0).any() or (total<=0):
+            raise ValueError(WEIGHTS_ERROR)
+        size=len(weights)
+        prob=weights*size/total
+        alias=np.arange(size,dtype=np.int64)
+        small=np.flatnonzero(prob<1).tolist()
+        large=np.flatnonzero(prob>=1).tolist()
+        while small and large:
+            s=small.pop()
+            l=large[-1]
+            alias[s]=l
+            prob[l]-=(1-prob[s])
+            if prob[l]<1:
+                small.append(large.pop())
+        prob[large]=1
+        prob[small]=1
+        self.size=size
+        self.prob=prob
+        self.alias=alias
+
+
+    def sample(self,size,rng=None):
+        """ draw `size` indices
+
+        Args:
+            - size<int>: number of draws
+            - rng<np.random.Generator|None>: random generator
+        """
+        if rng is None:
+            rng=np.random.default_rng()
+        index=rng.integers(0,self.size,size=size)
+        accept=rng.random(size)<self.prob[index]
+        return np.where(accept,index,self.alias[index])
+
+
+
+
+class ClassSampler(object):
+    """ class-balanced ident sampler for `DFSequence.set_sampler`
+
+    Each epoch draws `nb_samples` ident-codes (with replacement) from an
+    AliasSampler. Use `from_sequence` to build the weights from a (cached)
+    class index.
+
+    Args:
+        - weights<array>: (nb_idents,) per-ident weights (ordered by ident-code)
+        - nb_samples<int|None>:
+            idents per epoch. defaults to the number of idents with non-zero weight
+    """
+    @classmethod
+    def from_sequence(cls,
+            sequence,
+            path=None,
+            weights=None,
+            skip_empty=False,
+            empty_classes=EMPTY_CLASSES,
+            nb_samples=None,
+            noisy=True):
+        """ sampler weighted by (rare-)class presence
+
+        Args:
+            - sequence<DFSequence>: sequence to sample
+            - path<str|None>: (optional) class index cache path
+            - weights<list|None>: (optional) user given class-weights
+            - skip_empty<bool>: never draw idents containing only `empty_classes`
+            - empty_classes<list>: classes that do not count as labels
+            - nb_samples<int|None>: idents per epoch
+            - noisy<bool>: print progress
+        """
+        counts=class_index(sequence,path=path,noisy=noisy)
+        return cls(
+            class_weights(
+                ident_histograms(sequence,counts),
+                weights=weights,
+                skip_empty=skip_empty,
+                empty_classes=empty_classes),
+            nb_samples=nb_samples)
+
+
+    def __init__(self,weights,nb_samples=None):
+        self.weights=np.asarray(weights,dtype=np.float64)
+        self.alias=AliasSampler(self.weights)
+        self.nb_samples=nb_samples or int((self.weights>0).sum())
+
+
+    def sample(self,rng=None):
+        """ ident-codes for an epoch """
+        return self.alias.sample(self.nb_samples,rng).astype(np.int32)
+
+
+    def __len__(self):
+        return self.nb_samples
+
+
+
+
+#
+# INTERNAL
+#
+def _index_key(sequence,set_window):
+    md5=hashlib.md5()
+    md5.update(repr((
+        sequence._group_nb_classes(),
+        sequence.target_column,
+        set_window)).encode())
+    md5.update(_hash(sequence._handler_config()).encode())
+    md5.update('\n'.join(map(str,sequence.table.column(sequence.target_column))).encode())
+    if set_window and (sequence.windows is not None):
+        md5.update(np.ascontiguousarray(sequence.windows).tobytes())
+    return md5.hexdigest()
@@ -0,0 +1,321 @@
+import io
+import os
+import copy
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tfbox.loaders.dfsequence import (
+    DFSequence,
+    PARQUET_EXTS,
+    FEATHER_EXTS,
+    AUTOTUNE,
+    SEED_SHUFFLE,
+    _is_str_column )
+
+
+#
+# CONSTANTS
+#
+CHUNK_BYTES=64*2**20
+SHUFFLE_BUFFER=10000
+CSV_CHUNK='csv'
+PARQUET_CHUNK='parquet'
+TABLE_CHUNK='table'
+FRAME_CHUNK='frame'
+EMPTY_MANIFEST_ERROR='StreamingDFSequence: manifest has no rows'
+
+
+
+class StreamingDFSequence(object):
+    """ out-of-core DFSequence for manifests that do not fit in memory
+
+    The manifest is split into chunks: byte-ranges of csv files, row-groups
+    of parquet files (feather files are a single chunk). Each epoch visits the
+    chunks in a (seeded) random order, loading one chunk at a time as a
+    DFSequence that shares the handler/config of the first chunk. One row is
+    sampled for each ident of the chunk and rows pass through a bounded
+    shuffle buffer of self-contained row-records (the used column values and
+    window), so memory holds at most `shuffle_buffer` row-records and the
+    current chunk.
+
+    Idents are grouped within chunks: rows of an ident that are split across
+    chunks are sampled as separate idents. Keep the rows of each ident
+    contiguous in the manifest.
+
+    Args:
+        - data<str|list>: manifest path(s)
+        - chunk_bytes<int>: (approximate) size of csv chunks
+        - shuffle_buffer<int>: size of the row shuffle buffer
+        - shuffle<bool>: shuffle chunk order, idents and rows
+        - seed<int|None>: (optional) seed for the chunk order, shuffle and augmentation
+        - limit<int|None>:
+            (optional) limit the epoch to the first `limit` batches worth of
+            idents (read once and kept in memory)
+        - converters<dict>: column converters
+        - columns<None|True|list>: see `DFSequence`
+        - **kwargs: DFSequence kwargs (batch_size, nb_classes, windows, sample weights ...)
+    """
+    def __init__(self,
+            data,
+            chunk_bytes=CHUNK_BYTES,
+            shuffle_buffer=SHUFFLE_BUFFER,
+            shuffle=True,
+            seed=None,
+            limit=None,
+            converters={},
+            columns=None,
+            **kwargs):
+        if isinstance(data,str):
+            data=[data]
+        self.chunk_bytes=chunk_bytes
+        self.shuffle_buffer=shuffle_buffer
+        self.shuffle=shuffle
+        self.seed=seed
+        self.limit=limit
+        self.converters=converters
+        self.columns=columns
+        self.epoch=0
+        self.chunks=[c for path in data for c in manifest_chunks(path,chunk_bytes)]
+        self.sequence=None
+        for chunk in self.chunks:
+            frame=self._read_chunk(chunk)
+            if len(frame):
+                break
+        else:
+            raise ValueError(EMPTY_MANIFEST_ERROR)
+        self.sequence=DFSequence(
+            frame,
+            shuffle=False,
+            seed=seed,
+            columns=columns,
+            **kwargs)
+        self.batch_size=self.sequence.batch_size
+        if limit:
+            self.chunks=[(FRAME_CHUNK,self._limit_frame(limit))]
+
+
+    def __iter__(self):
+        """ input-target(-sample_weight) batches of an epoch (same structure as `DFSequence.get_batch`) """
+        items=self._items()
+        while True:
+            batch=[item for _,item in zip(range(self.batch_size),items)]
+            if len(batch)<self.batch_size:
+                break
+            arrays=[np.stack(a) for a in zip(*self._read(batch,onehot=True))]
+            inpts,targs,sample_weights=self.sequence._split_batch(arrays)
+            if self.sequence.grouping:
+                targs=self.sequence._group(targs)
+            if sample_weights is None:
+                yield inpts, targs
+            else:
+                yield inpts, targs, sample_weights
+
+
+    def as_dataset(self,deterministic=False):
+        """ tf.data.Dataset of batches
+
+        Examples are streamed from a generator (reading through the thread-pool
+        if `num_workers>1`), onehot-encoding/grouping are applied in-graph and
+        batches are prefetched. Each iteration is a new epoch.
+        """
+        specs=self.sequence._example_spec()
+        ds=tf.data.Dataset.from_generator(
+            self._flat_examples,
+            output_signature=tuple(
+                tf.TensorSpec(shape=shape,dtype=tf.as_dtype(dtype))
+                for shape,dtype in specs ))
+        ds=ds.map(
+            self.sequence._nest_example,
+            num_parallel_calls=AUTOTUNE,
+            deterministic=deterministic)
+        ds=ds.batch(self.batch_size,drop_remainder=True)
+        return ds.prefetch(AUTOTUNE)
+
+
+    def chunk_sequence(self,chunk):
+        """ DFSequence for a single manifest chunk (sharing handler and config) """
+        frame=self._read_chunk(chunk)
+        if not len(frame):
+            return None
+        sequence=copy.copy(self.sequence)
+        sequence._ident_sources=None
+        sequence._init_dataset(frame,{},self.limit,self.columns,None)
+        return sequence
+
+
+    #
+    # INTERNAL
+    #
+    def _items(self):
+        """ (record,augmentation) of an epoch in (buffer-)shuffled order """
+        rng=self._rng()
+        if self.shuffle:
+            order=rng.permutation(len(self.chunks))
+        else:
+            order=range(len(self.chunks))
+        buffer=[]
+        for index in order:
+            sequence=self.chunk_sequence(self.chunks[index])
+            if sequence is None:
+                continue
+            if self.shuffle:
+                codes=rng.permutation(len(sequence.groups))
+            else:
+                codes=np.arange(len(sequence.groups))
+            positions=sequence._row_positions(codes,rng)
+            if sequence.handler.augment:
+                ks=rng.integers(0,4,size=len(positions))
+                flips=rng.random(len(positions))<0.5
+                augmentation=[(int(k),bool(f)) for k,f in zip(ks,flips)]
+            else:
+                augmentation=[False]*len(positions)
+            keep=sequence._column_filter(True)
+            columns=[c for c in sequence.table.columns if keep(c)]
+            for p,a in zip(positions,augmentation):
+                item=(sequence._record(p,columns),a)
+                if (not self.shuffle) or (self.shuffle_buffer<2):
+                    yield item
+                elif len(buffer)<self.shuffle_buffer:
+                    buffer.append(item)
+                else:
+                    i=rng.integers(len(buffer))
+                    yield buffer[i]
+                    buffer[i]=item
+        if self.shuffle:
+            rng.shuffle(buffer)
+        yield from buffer
+        self.epoch+=1
+
+
+    def _flat_examples(self):
+        items=self._items()
+        while True:
+            block=[item for _,item in zip(range(self.batch_size),items)]
+            if not block:
+                break
+            yield from (tuple(e) for e in self._read(block,onehot=False))
+
+
+    def _read(self,items,onehot):
+        def _read_item(item):
+            record,augmentation=item
+            return self.sequence._read_row(
+                record,
+                set_augment=augmentation,
+                onehot=onehot)
+        if self.sequence.num_workers and (self.sequence.num_workers>1):
+            return list(self.sequence._pool().map(_read_item,items))
+        else:
+            return [_read_item(item) for item in items]
+
+
+    def _rng(self):
+        if self.seed is None:
+            return np.random.default_rng()
+        else:
+            return np.random.default_rng([self.seed,self.epoch,SEED_SHUFFLE])
+
+
+    def _read_chunk(self,chunk):
+        if self.sequence is None:
+            keep=None
+        else:
+            keep=self.sequence._column_filter(self.columns)
+        kind,path=chunk[0],chunk[1]
+        if kind==FRAME_CHUNK:
+            return path
+        elif kind==CSV_CHUNK:
+            converters=self.converters
+            if keep:
+                converters={ k: v for k,v in converters.items() if keep(k) }
+            return read_csv_chunk(path,chunk[2],chunk[3],converters=converters,usecols=keep)
+        elif kind==PARQUET_CHUNK:
+            import pyarrow.parquet as pq
+            file=pq.ParquetFile(path)
+            if keep:
+                names=[c for c in file.schema_arrow.names if keep(c)]
+            else:
+                names=None
+            frame=file.read_row_group(chunk[2],columns=names).to_pandas()
+        else:
+            frame=pd.read_feather(path)
+            if keep:
+                frame=frame[[c for c in frame.columns if keep(c)]]
+        for c,convert in self.converters.items():
+            if (c in frame.columns) and _is_str_column(frame[c]):
+                frame[c]=frame[c].map(convert)
+        return frame
+
+
+    def _limit_frame(self,limit):
+        """ rows of the first `limit*batch_size` idents (in manifest order) """
+        nb_idents=limit*self.batch_size
+        frames=[]
+        idents=set()
+        for chunk in self.chunks:
+            frame=self._read_chunk(chunk)
+            frames.append(frame)
+            idents.update(self._idents(frame))
+            if len(idents)>=nb_idents:
+                break
+        return pd.concat(frames,ignore_index=True)
+
+
+    def _idents(self,frame):
+        sequence=self.sequence
+        group_column=getattr(sequence,'base_group_column',sequence.group_column)
+        idents=frame[group_column].astype(str)
+        if sequence.has_windows and sequence.window_index_column:
+            idents=idents+'__'+frame[sequence.window_index_column].astype(str)
+        return idents.unique()
+
+
+
+
+#
+# HELPERS
+#
+def manifest_chunks(path,chunk_bytes=CHUNK_BYTES):
+    """ chunks of a manifest file
+
+    Returns:
+        list of ('csv',path,start,end) byte-ranges, ('parquet',path,row_group)
+        row-groups or a single ('table',path) chunk for feather files
+    """
+    ext=os.path.splitext(path)[-1].lower()
+    if ext in PARQUET_EXTS:
+        import pyarrow.parquet as pq
+        return [
+            (PARQUET_CHUNK,path,i)
+            for i in range(pq.ParquetFile(path).num_row_groups) ]
+    elif ext in FEATHER_EXTS:
+        return [(TABLE_CHUNK,path)]
+    else:
+        size=os.path.getsize(path)
+        with open(path,'rb') as file:
+            start=len(file.readline())
+        return [
+            (CSV_CHUNK,path,s,min(s+chunk_bytes,size))
+            for s in range(start,size,chunk_bytes) ]
+
+
+def read_csv_chunk(path,start,end,**kwargs):
+    """ read the csv rows whose first byte is in [start,end) (with the file's header)
+
+    Args:
+        - path<str>: csv path
+        - start/end<int>: byte-range (start must be past the header)
+        - **kwargs: pd.read_csv kwargs
+    """
+    with open(path,'rb') as file:
+        header=file.readline()
+        file.seek(start-1)
+        file.readline()
+        position=file.tell()
+        if position<end:
+            block=file.read(end-position)
+            if not block.endswith(b'\n'):
+                block+=file.readline()
+        else:
+            block=b''
+    return pd.read_csv(io.BytesIO(header+block),**kwargs)
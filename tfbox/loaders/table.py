@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+
+class Table(object):
+    """ compact array-backed view of (grouped) metadata
+
+    Columns are stored as numpy arrays. Categorical columns are stored as
+    their integer codes and categories (shared with the source dataframe),
+    so reading a row does not create a pandas Series.
+
+    Args:
+        - data<pd.DataFrame>: (compacted) metadata
+        - arrays<dict|None>:
+            column => (nb_rows,n) array (ie. parsed windows) kept outside of
+            `data`. row values are tuples of the array's row.
+    """
+    def __init__(self,data,arrays=None):
+        arrays=arrays or {}
+        self.columns=list(data.columns)+[c for c in arrays if c not in data.columns]
+        self.size=len(data)
+        self._codes={}
+        self._categories={}
+        self._values={}
+        self._arrays=dict(arrays)
+        for c in data.columns:
+            if c in self._arrays:
+                continue
+            values=data[c]
+            if isinstance(values.dtype,pd.CategoricalDtype):
+                self._codes[c]=values.cat.codes.to_numpy()
+                self._categories[c]=values.cat.categories.to_numpy()
+            else:
+                self._values[c]=values.to_numpy()
+
+
+    def row(self,position):
+        """ lightweight row-record for row-position """
+        return Row(self,int(position))
+
+
+    def value(self,column,position):
+        codes=self._codes.get(column)
+        if codes is None:
+            if column in self._arrays:
+                return tuple(self._arrays[column][position].tolist())
+            return self._values[column][position]
+        code=codes[position]
+        if code<0:
+            return np.nan
+        else:
+            return self._categories[column][code]
+
+
+    def column(self,column):
+        """ decoded values of column """
+        codes=self._codes.get(column)
+        if codes is None:
+            if column in self._arrays:
+                return self._arrays[column]
+            return self._values[column]
+        values=self._categories[column][codes]
+        missing=codes<0
+        if missing.any():
+            values=values.astype(object)
+            values[missing]=np.nan
+        return values
+
+
+    @property
+    def nbytes(self):
+        return (
+            sum(a.nbytes for a in self._codes.values())+
+            sum(a.nbytes for a in self._categories.values())+
+            sum(a.nbytes for a in self._values.values())+
+            sum(a.nbytes for a in self._arrays.values()) )
+
+
+    def __len__(self):
+        return self.size
+
+
+
+
+class Row(object):
+    """ row-record of a Table
+
+    Supports `row[column]` and `row.get(column)` like a pandas Series. `name`
+    is the row-position.
+    """
+    __slots__=('table','position')
+
+
+    def __init__(self,table,position):
+        self.table=table
+        self.position=position
+
+
+    @property
+    def name(self):
+        return self.position
+
+
+    def get(self,column,default=None):
+        if column in self.table.columns:
+            return self[column]
+        else:
+            return default
+
+
+    def keys(self):
+        return self.table.columns
+
+
+    def to_dict(self):
+        return { c: self[c] for c in self.table.columns }
+
+
+    def __getitem__(self,column):
+        return self.table.value(column,self.position)
+
+
+    def __contains__(self,column):
+        return column in self.table.columns
+
+
+    def __repr__(self):
+        return f'Row({self.position}, {self.to_dict()})'
+
+
+
+
+class Record(dict):
+    """ self-contained row-record: a dict of column values that (unlike Row)
+    does not reference its Table. `name` is the row-position in the source
+    table and `window` the resolved (x,y,w,h) window (or None)
+    """
+    __slots__=('name','window')
+
+
+    def __init__(self,values,name,window=None):
+        super(Record,self).__init__(values)
+        self.name=name
+        self.window=window
+
+
+
+
+#
+# HELPERS
+#
+def compact(data,float32_columns=[]):
+    """ convert (hashable) string/object columns to categoricals
+    and `float32_columns` to float32
+
+    Args:
+        - data<pd.DataFrame>: metadata (converted in place)
+        - float32_columns<list>: columns cast to float32
+    """
+    for c in data.columns:
+        values=data[c]
+        if c in float32_columns:
+            data[c]=values.astype(np.float32)
+        elif pd.api.types.is_object_dtype(values.dtype) or pd.api.types.is_string_dtype(values.dtype):
+            try:
+                data[c]=values.astype('category')
+            except TypeError:
+                pass
+    return data
@@ -0,0 +1,250 @@
+import os
+import json
+import struct
+import numpy as np
+import tensorflow as tf
+import tfbox.nn.addons as addons
+from tfbox.loaders.dfsequence import nest_example, AUTOTUNE
+
+
+#
+# CONSTANTS
+#
+INDEX_FILE='index.json'
+SHARD_NAME='shard-{:05d}.tfrecord'
+OFFSETS_EXT='.offsets.npy'
+RECORDS_PER_SHARD=1024
+ARRAY_KEY='array/{}'
+IDENT_KEY='ident'
+ROW_KEY='row/{}'
+RECORD_OVERHEAD=16
+
+
+
+#
+# WRITER
+#
+def write_tfrecords(
+        sequence,
+        directory,
+        records_per_shard=RECORDS_PER_SHARD,
+        row_keys=[],
+        all_rows=False,
+        set_window=True,
+        noisy=True):
+    """ compile a DFSequence into sharded tfrecord files
+
+    Writes the decoded (un-augmented, non-onehot) inputs and targets, sample weights,
+    ident and `row_keys` metadata of each example to tfrecord shards. An
+    `index.json` file stores the example specs and the onehot/grouping config
+    of the sequence, and each shard has a sidecar `.offsets.npy` file with
+    the byte offset of every record.
+
+    Args:
+        - sequence<DFSequence>: sequence to export
+        - directory<str>: output directory
+        - records_per_shard<int>: number of records per shard
+        - row_keys<list>: row columns to include as (string) metadata
+        - all_rows<bool>:
+            if true export every row, otherwise export one (sampled) row per ident
+        - set_window<bool>: if false ignore any window-cropping
+        - noisy<bool>: print progress
+
+    Returns:
+        <dict> index
+    """
+    os.makedirs(directory,exist_ok=True)
+    if all_rows:
+        positions=np.arange(len(sequence.data))
+    else:
+        positions=sequence._row_positions(sequence.idents)
+    if sequence.num_workers and (sequence.num_workers>1):
+        _map=sequence._pool().map
+    else:
+        _map=map
+    def _read(position):
+        return sequence._read_example(position,set_window=set_window,set_augment=False)
+    shards=[]
+    for start in range(0,len(positions),records_per_shard):
+        name=SHARD_NAME.format(len(shards))
+        shard_positions=positions[start:start+records_per_shard]
+        offsets=[]
+        offset=0
+        with tf.io.TFRecordWriter(os.path.join(directory,name)) as writer:
+            for p,arrays in zip(shard_positions,_map(_read,shard_positions)):
+                row=sequence.table.row(p)
+                record=_serialize(arrays,row[sequence.group_column],row,row_keys)
+                writer.write(record)
+                offsets.append(offset)
+                offset+=len(record)+RECORD_OVERHEAD
+        np.save(os.path.join(directory,f'{name}{OFFSETS_EXT}'),np.array(offsets,dtype=np.int64))
+        shards.append({
+            'path': name,
+            'offsets': f'{name}{OFFSETS_EXT}',
+            'nb_records': len(offsets) })
+        if noisy:
+            print(f'tfbox.tfrecords: {name} ({start+len(offsets)}/{len(positions)})')
+    if sequence.grouping:
+        group_maps=sequence.grouping.group_maps
+    else:
+        group_maps=None
+    index={
+        'specs': [
+            {'shape': list(shape), 'dtype': np.dtype(dtype).name}
+            for shape,dtype in sequence._example_spec() ],
+        'nb_classes': sequence.nb_classes,
+        'onehot': sequence.onehot,
+        'sparse': sequence.sparse,
+        'input_stats': sequence.raw_inputs,
+        'droplast': sequence.droplast,
+        'group_maps': group_maps,
+        'sample_weights': bool(sequence.sample_weight_column),
+        'row_keys': list(row_keys),
+        'batch_size': sequence.batch_size,
+        'nb_records': len(positions),
+        'shards': shards }
+    with open(os.path.join(directory,INDEX_FILE),'w') as file:
+        json.dump(index,file,default=_json_default)
+    return index
+
+
+
+
+#
+# READERS
+#
+def read_index(directory):
+    with open(os.path.join(directory,INDEX_FILE),'r') as file:
+        return json.load(file)
+
+
+def tfrecord_dataset(
+        directory,
+        batch_size=None,
+        shuffle=True,
+        shuffle_buffer=None,
+        cycle_length=None,
+        deterministic=False,
+        with_rows=False):
+    """ tf.data.Dataset of batches from tfrecords written by `write_tfrecords`
+
+    Batches have the same structure as `DFSequence.get_batch`. Shards are read
+    with an `interleave` of TFRecordDatasets and onehot-encoding/grouping are
+    applied in-graph.
+
+    Args:
+        - directory<str>: directory containing index.json and shards
+        - batch_size<int|None>: batch size. defaults to batch_size of the exported sequence
+        - shuffle<bool>: shuffle the order of the shards each iteration
+        - shuffle_buffer<int|None>: (optional) example-level shuffle buffer size
+        - cycle_length<int|None>: number of shards read concurrently. defaults to AUTOTUNE
+        - deterministic<bool>:
+            if true preserve example order at the cost of throughput
+        - with_rows<bool>: if true append a dict of ident/row_keys (strings) to each batch
+    """
+    index=read_index(directory)
+    paths=[os.path.join(directory,s['path']) for s in index['shards']]
+    files=tf.data.Dataset.from_tensor_slices(paths)
+    if shuffle:
+        files=files.shuffle(len(paths),reshuffle_each_iteration=True)
+    ds=files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=cycle_length or AUTOTUNE,
+        num_parallel_calls=AUTOTUNE,
+        deterministic=deterministic)
+    if shuffle and shuffle_buffer:
+        ds=ds.shuffle(shuffle_buffer,reshuffle_each_iteration=True)
+    if index['group_maps']:
+        grouping=addons.Groups(index['group_maps'])
+    else:
+        grouping=None
+    def _parse(record):
+        features=tf.io.parse_single_example(record,_feature_spec(index))
+        arrays=_decode_arrays(features,index['specs'])
+        example=nest_example(
+            arrays,
+            index['nb_classes'],
+            onehot=index['onehot'],
+            droplast=index['droplast'],
+            grouping=grouping,
+            sample_weights=index['sample_weights'],
+            sparse=index.get('sparse',False),
+            input_stats=index.get('input_stats',False))
+        if with_rows:
+            rows={ k: features[ROW_KEY.format(k)] for k in index['row_keys'] }
+            rows[IDENT_KEY]=features[IDENT_KEY]
+            example=example+(rows,)
+        return example
+    ds=ds.map(_parse,num_parallel_calls=AUTOTUNE,deterministic=deterministic)
+    ds=ds.batch(batch_size or index['batch_size'],drop_remainder=True)
+    return ds.prefetch(AUTOTUNE)
+
+
+def read_record(directory,shard_index,record_index,index=None):
+    """ random-access read of a single record using the sidecar offsets
+
+    Returns:
+        flat list of (non-onehot) numpy arrays: [input,*targets(,weight)]
+    """
+    if index is None:
+        index=read_index(directory)
+    shard=index['shards'][shard_index]
+    offset=np.load(os.path.join(directory,shard['offsets']),mmap_mode='r')[record_index]
+    with open(os.path.join(directory,shard['path']),'rb') as file:
+        file.seek(int(offset))
+        length=struct.unpack('<Q',file.read(8))[0]
+        file.seek(4,1)
+        record=file.read(length)
+    example=tf.train.Example.FromString(record)
+    return [
+        np.frombuffer(
+            example.features.feature[ARRAY_KEY.format(i)].bytes_list.value[0],
+            dtype=spec['dtype']).reshape(spec['shape'])
+        for i,spec in enumerate(index['specs']) ]
+
+
+
+
+#
+# INTERNAL
+#
+def _serialize(arrays,ident,row,row_keys):
+    feature={
+        ARRAY_KEY.format(i): _bytes_feature(np.ascontiguousarray(a).tobytes())
+        for i,a in enumerate(arrays) }
+    feature[IDENT_KEY]=_bytes_feature(str(ident).encode())
+    for k in row_keys:
+        feature[ROW_KEY.format(k)]=_bytes_feature(str(row[k]).encode())
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _feature_spec(index):
+    spec={
+        ARRAY_KEY.format(i): tf.io.FixedLenFeature([],tf.string)
+        for i in range(len(index['specs'])) }
+    spec[IDENT_KEY]=tf.io.FixedLenFeature([],tf.string)
+    for k in index['row_keys']:
+        spec[ROW_KEY.format(k)]=tf.io.FixedLenFeature([],tf.string)
+    return spec
+
+
+def _decode_arrays(features,specs):
+    return [
+        tf.reshape(
+            tf.io.decode_raw(features[ARRAY_KEY.format(i)],tf.as_dtype(s['dtype'])),
+            s['shape'])
+        for i,s in enumerate(specs) ]
+
+
+def _json_default(value):
+    if isinstance(value,np.integer):
+        return int(value)
+    elif isinstance(value,np.floating):
+        return float(value)
+    elif isinstance(value,np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value)} is not JSON serializable')
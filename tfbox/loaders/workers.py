@@ -0,0 +1,202 @@
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+
+#
+# CONSTANTS
+#
+WORKER_ERROR='SharedMemoryPool: worker failed on batch {}\n{}'
+
+
+
+class SharedMemoryPool(object):
+    """ process-pool that assembles batches into pre-allocated shared-memory slots
+
+    Worker processes read examples (`sequence._read_example`) and write them
+    directly into shared-memory buffers. The consumer receives numpy views of
+    the slot so image arrays are never pickled. Only row-positions are sent to
+    the workers, so batches follow the order chosen by the consumer (ie. the
+    order shuffled in `DFSequence.reset`).
+
+    A slot is recycled after it has been released by the consumer.
+
+    Args:
+        - sequence<DFSequence>: sequence providing `_read_example`
+        - specs<list>: (shape,dtype) for each (flat) array of a single example
+        - batch_size<int>: batch size
+        - num_workers<int>: number of worker processes
+        - nb_slots<int|None>: number of batch slots (defaults to num_workers+2)
+        - context<str|None>: multiprocessing start method
+    """
+    def __init__(self,
+            sequence,
+            specs,
+            batch_size,
+            num_workers,
+            nb_slots=None,
+            context=None):
+        self.specs=specs
+        self.batch_size=batch_size
+        self.num_workers=num_workers
+        self.nb_slots=nb_slots or (num_workers+2)
+        self._ctx=mp.get_context(context)
+        self._buffers=[]
+        self.arrays=[]
+        for shape,dtype in specs:
+            shape=(self.nb_slots,batch_size)+tuple(shape)
+            nbytes=max(int(np.prod(shape))*np.dtype(dtype).itemsize,1)
+            shm=shared_memory.SharedMemory(create=True,size=nbytes)
+            self._buffers.append(shm)
+            self.arrays.append(np.ndarray(shape,dtype=dtype,buffer=shm.buf))
+        self._tasks=self._ctx.Queue()
+        self._done=self._ctx.Queue()
+        self._processes=[
+            self._ctx.Process(
+                target=_worker,
+                args=(
+                    sequence,
+                    [b.name for b in self._buffers],
+                    specs,
+                    self.nb_slots,
+                    batch_size,
+                    self._tasks,
+                    self._done),
+                daemon=True)
+            for _ in range(num_workers) ]
+        for p in self._processes:
+            p.start()
+        self.free=list(range(self.nb_slots))
+        self.pending={}
+        self.ready={}
+        self.held=set()
+
+
+    def submit(self,key,positions,set_window=True,set_augment=True):
+        """ schedule batch if it isn't already scheduled and there is a free slot
+
+        Returns:
+            <bool> true if the batch is (or already was) scheduled
+        """
+        if (key in self.pending) or (key in self.ready):
+            return True
+        if not self.free:
+            return False
+        slot=self.free.pop(0)
+        self.pending[key]=slot
+        self._tasks.put((
+            slot,
+            key,
+            [int(p) for p in positions],
+            set_window,
+            set_augment))
+        return True
+
+
+    def get(self,key,positions,set_window=True,set_augment=True):
+        """ wait for batch and return slot and numpy-views of its arrays
+
+        * if the batch has not been scheduled, unused ready-slots are recycled
+          to make room for it.
+        * the returned arrays are only valid until the slot is released
+        """
+        if not self.submit(key,positions,set_window,set_augment):
+            self._recycle()
+            self.submit(key,positions,set_window,set_augment)
+        while key not in self.ready:
+            self._receive()
+        slot=self.ready.pop(key)
+        self.held.add(slot)
+        return slot, [a[slot] for a in self.arrays]
+
+
+    def release(self,slot):
+        """ return held slot to free slots """
+        if slot in self.held:
+            self.held.remove(slot)
+            self.free.append(slot)
+
+
+    def reset(self):
+        """ wait for in-flight batches and free all slots """
+        while self.pending:
+            self._receive(raise_errors=False)
+        self.free=list(range(self.nb_slots))
+        self.ready={}
+        self.held=set()
+
+
+    def close(self):
+        """ stop workers and unlink shared-memory """
+        for _ in self._processes:
+            self._tasks.put(None)
+        for p in self._processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self.arrays=[]
+        for b in self._buffers:
+            b.close()
+            b.unlink()
+        self._buffers=[]
+        self._processes=[]
+
+
+    #
+    # INTERNAL
+    #
+    def _receive(self,raise_errors=True):
+        slot,key,error=self._done.get()
+        self.pending.pop(key,None)
+        if error:
+            self.free.append(slot)
+            if raise_errors:
+                raise RuntimeError(WORKER_ERROR.format(key,error))
+        else:
+            self.ready[key]=slot
+
+
+    def _recycle(self):
+        while not self.free:
+            if self.ready:
+                key=next(iter(self.ready))
+                self.free.append(self.ready.pop(key))
+            else:
+                self._receive()
+
+
+
+
+#
+# WORKER
+#
+def _worker(sequence,names,specs,nb_slots,batch_size,tasks,done):
+    buffers=[shared_memory.SharedMemory(name=n) for n in names]
+    arrays=[
+        np.ndarray((nb_slots,batch_size)+tuple(shape),dtype=dtype,buffer=b.buf)
+        for b,(shape,dtype) in zip(buffers,specs) ]
+    while True:
+        task=tasks.get()
+        if task is None:
+            break
+        slot,key,positions,set_window,set_augment=task
+        try:
+            for i,p in enumerate(positions):
+                if isinstance(set_augment,list):
+                    augment=set_augment[i]
+                else:
+                    augment=set_augment
+                example=sequence._read_example(
+                    p,
+                    set_window=set_window,
+                    set_augment=augment,
+                    onehot=True)
+                for a,e in zip(arrays,example):
+                    a[slot,i]=e
+            done.put((slot,key,None))
+        except Exception:
+            done.put((slot,key,traceback.format_exc()))
+    del arrays
+    for b in buffers:
+        b.close()
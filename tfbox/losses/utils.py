@@ -1,10 +1,13 @@
 import tensorflow.keras.losses as losses
-from .weighted import weighted_categorical_crossentropy, focal_cross_entropy, masked_binary_cross_entropy
+from .weighted import weighted_categorical_crossentropy, focal_cross_entropy, masked_binary_cross_entropy, sparse_categorical_crossentropy, sparse_loss
 #
 # CONSTANTS
 #
 DEFAULT_LOSS='categorical_crossentropy'
 DEFAULT_WEIGHTED_LOSS='weighted_categorical_crossentropy'
+DEFAULT_SPARSE_LOSS='sparse_categorical_crossentropy'
+SPARSE_LOSSES=[DEFAULT_SPARSE_LOSS]
+SPARSE_OPTION_LOSSES=['weighted_categorical_crossentropy','focal_cross_entropy']
 
 
 #
@@ -14,25 +17,40 @@ LOSS_FUNCTIONS={
     'focal_cross_entropy': focal_cross_entropy,
     'masked_binary_cross_entropy': masked_binary_cross_entropy,
     'weighted_categorical_crossentropy': weighted_categorical_crossentropy,
-    'categorical_crossentropy': losses.CategoricalCrossentropy
+    'categorical_crossentropy': losses.CategoricalCrossentropy,
+    'sparse_categorical_crossentropy': sparse_categorical_crossentropy
 }
 
 
 #
 # MAIN
 #
-def get(loss_func=None,weights=None,**kwargs):
+def get(loss_func=None,weights=None,sparse=False,**kwargs):
+    """ get loss function
+
+    if `sparse` (integer class-map targets): losses with a `sparse` option
+    get sparse=True and other loss functions are wrapped with `sparse_loss`
+    """
     if not loss_func:
         if weights:
             loss_func=DEFAULT_WEIGHTED_LOSS
+        elif sparse:
+            loss_func=DEFAULT_SPARSE_LOSS
         else:
             loss_func=DEFAULT_LOSS
     if weights:
         kwargs['weights']=weights
+    if sparse and (loss_func in SPARSE_OPTION_LOSSES):
+        kwargs['sparse']=True
+        sparse=False
+    elif loss_func in SPARSE_LOSSES:
+        sparse=False
     if isinstance(loss_func,str):
         loss_func=LOSS_FUNCTIONS.get(loss_func,loss_func)
     if not isinstance(loss_func,str):
         loss_func=loss_func(**kwargs)
+        if sparse:
+            loss_func=sparse_loss(loss_func)
     return loss_func
 
 
@@ -22,17 +22,21 @@ CCE_ARGS=[
 #
 # CUSTOM LOSS FUNCTIIONS
 #
-def weighted_categorical_crossentropy(weights=None,**kwargs):
+def weighted_categorical_crossentropy(weights=None,sparse=False,**kwargs):
     """ weighted_categorical_crossentropy
         Args:
             * weights<ktensor|nparray|list>: crossentropy weights
+            * sparse<bool>: if true targets are integer class maps (onehot in-graph)
         Returns:
             * weighted categorical crossentropy function
     """
     kwargs={ k: kwargs[k] for k in kwargs.keys() if k in CCE_ARGS }
     if weights is None:
         print('WARNING: WCCE called without weights. Defaulting to CCE')
-        return losses.CategoricalCrossentropy(**kwargs)
+        if sparse:
+            return sparse_loss(losses.CategoricalCrossentropy(**kwargs))
+        else:
+            return losses.CategoricalCrossentropy(**kwargs)
     else:
         if isinstance(weights,list) or isinstance(np.ndarray):
             weights=K.variable(weights)
@@ -40,6 +44,8 @@ def weighted_categorical_crossentropy(weights=None,**kwargs):
         print('WCCE:',weights,kwargs)
         cce=losses.CategoricalCrossentropy(**kwargs)
         def _loss(target,output):
+            if sparse:
+                target=sparse_onehot(target,output)
             unweighted_losses=cce(target,output)
             pixel_weights=tf.reduce_sum(weights*target, axis=-1)
             weighted_losses=unweighted_losses*pixel_weights
@@ -56,8 +62,11 @@ def focal_cross_entropy(
         weights=None,
         ignore_labels=None,
         nb_classes=None,
+        sparse=False,
         **kwargs):
     """ generalized focal loss that defaults to "softmax-focal-loss"
+
+    if `sparse` targets are integer class maps (onehot in-graph)
     """
     if (not weights) and ignore_labels:
         weights=[1]*nb_classes
@@ -65,6 +74,8 @@ def focal_cross_entropy(
             weights[l]=0
     print('FOCAL LOSS',gamma,alpha,weights)
     def _loss(target,output):
+        if sparse:
+            target=sparse_onehot(target,output)
         return focalized_categorical_crossentropy(
             target,
             output,
@@ -114,9 +125,35 @@ def masked_binary_cross_entropy(
 
 
 
+def sparse_categorical_crossentropy(**kwargs):
+    """ categorical crossentropy for integer class map targets (onehot in-graph) """
+    kwargs={ k: kwargs[k] for k in kwargs.keys() if k in CCE_ARGS }
+    return sparse_loss(losses.CategoricalCrossentropy(**kwargs))
+
+
+
 #
 # METHODS
 #
+def sparse_onehot(target,output):
+    """ in-graph onehot of integer class map target with depth of output
+
+    class values >= depth (ie. the last class when using `droplast`)
+    become all-zero rows
+    """
+    target=tf.cast(target,tf.int32)
+    if len(target.shape)==len(output.shape):
+        target=tf.squeeze(target,axis=-1)
+    return tf.one_hot(target,tf.shape(output)[-1],dtype=output.dtype)
+
+
+def sparse_loss(loss_func):
+    """ wrap onehot-target loss function for integer class map targets """
+    def _loss(target,output):
+        return loss_func(sparse_onehot(target,output),output)
+    return _loss
+
+
 def pixel_weighted_categorical_crossentropy(weights,target, output, from_logits=False, axis=-1):
     """ pixel weighted version of tf.keras.backend.categorical_crossentropy
 
@@ -1,5 +1,6 @@
 import tensorflow as tf
 import tfbox.utils.helpers as h
+from tfbox.losses.weighted import sparse_onehot
 
 
 def get(metric):
@@ -19,7 +20,7 @@ def get(metric):
     return metric
 
 
-def weighted(weights,metric='categorical_accuracy'):
+def weighted(weights,metric='categorical_accuracy',sparse=False):
     """ weighted metric
     Args:
 
@@ -29,11 +30,15 @@ def weighted(weights,metric='categorical_accuracy'):
             * snake-case strings will be turned to camel-case
             * if metric is not a string the passed metric will be returned
               with the assumption that it is already a keras metric class
+        - sparse<bool>:
+            * if true y_true are integer class maps (onehot in-graph)
 
     Return: (weighted) metric instance 
     """
     metric=get(metric)()
     def _weighted_metric(y_true,y_pred):
+        if sparse:
+            y_true=sparse_onehot(y_true,y_pred)
         sample_weight=tf.reduce_sum(weights*y_true, axis=-1)
         metric.reset_states()
         metric.update_state(y_true,y_pred,sample_weight=sample_weight)
@@ -42,7 +47,7 @@ def weighted(weights,metric='categorical_accuracy'):
     return _weighted_metric
  
 
-def subset(ignore_labels,labels,metric='categorical_accuracy'):
+def subset(ignore_labels,labels,metric='categorical_accuracy',sparse=False):
     """ metric which ignores labels (wrapper for `weighted`)
     Args:
 
@@ -54,6 +59,8 @@ def subset(ignore_labels,labels,metric='categorical_accuracy'):
             * snake-case strings will be turned to camel-case
             * if metric is not a string the passed metric will be returned
               with the assumption that it is already a keras metric class
+        - sparse<bool>:
+            * if true y_true are integer class maps (onehot in-graph)
 
     Return: (weighted) metric instance 
     """
@@ -62,7 +69,7 @@ def subset(ignore_labels,labels,metric='categorical_accuracy'):
     if isinstance(labels,(int,float)):
         labels=list(range(labels))
     weights=[int(i not in ignore_labels) for i in labels]
-    return weighted(weights,metric=metric)
+    return weighted(weights,metric=metric,sparse=sparse)
  
 
 
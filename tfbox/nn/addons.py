@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 import abc
 import warnings
@@ -11,6 +12,7 @@ DEFAULT_CONV_CONFIG={
     'kernel_size': 3,
     'padding': 'same'
 }
+SPARSE_GROUPS_ERROR='sparse grouping requires non-overlapping "add" group_maps'
 
 
 #
@@ -45,6 +47,78 @@ class Groups(tf.keras.layers.Layer):
         return tf.concat(grouped_list,axis=-1)
 
 
+    def mapping(self,nb_channels):
+        """ compile group_maps into a (nb_channels,nb_groups) matrix and (nb_groups,) divisors
+
+        `call(x)` equals `tensordot(x,matrix)/divisors` for "add"/"avg" (and 0/1) maps.
+
+        Args:
+            - nb_channels<int>: number of channels of the (onehot) targets
+
+        Returns:
+            (matrix,divisors) or None if any group uses a (learned) conv method
+        """
+        matrix=np.zeros((nb_channels,self.nb_groups),dtype=np.float32)
+        divisors=np.ones(self.nb_groups,dtype=np.float32)
+        for index,gmap in enumerate(self.group_maps):
+            if gmap==0:
+                matrix[index,index]=EPS
+            elif gmap==1:
+                matrix[index,index]=1
+            else:
+                indices=gmap.get('indices',[index])
+                method=gmap.get('method','add')
+                if method=='avg':
+                    divisors[index]=len(indices)
+                elif method!='add':
+                    return None
+                np.add.at(matrix[:,index],indices,1)
+        return matrix, divisors
+
+
+    def numpy(self,x):
+        """ `call` for numpy arrays as a single tensordot (uses the layer for conv methods) """
+        mapping=self.mapping(x.shape[-1])
+        if mapping is None:
+            return self(x)
+        matrix,divisors=mapping
+        grouped=np.tensordot(x,matrix,axes=[[-1],[0]])
+        if (divisors!=1).any():
+            grouped/=divisors
+        return grouped.astype(x.dtype,copy=False)
+
+
+    def sparse_lookup(self,nb_classes):
+        """ class => group lookup table for sparse (integer) targets
+
+        classes not in any group map to `nb_groups` (an all-zero onehot row)
+
+        Args:
+            - nb_classes<int>: number of (ungrouped) classes
+        """
+        lookup=np.full(nb_classes,self.nb_groups,dtype=np.int32)
+        for index,gmap in enumerate(self.group_maps):
+            if gmap==0:
+                continue
+            elif gmap==1:
+                indices=[index]
+            elif gmap.get('method','add')=='add':
+                indices=gmap.get('indices',[index])
+            else:
+                raise ValueError(SPARSE_GROUPS_ERROR)
+            for i in indices:
+                if lookup[i]!=self.nb_groups:
+                    raise ValueError(SPARSE_GROUPS_ERROR)
+                lookup[i]=index
+        return lookup
+
+
+    def sparse(self,x,nb_classes):
+        """ sparse version of `call`: maps integer class targets to integer group targets """
+        lookup=tf.constant(self.sparse_lookup(nb_classes))
+        return tf.gather(lookup,tf.cast(x,tf.int32))
+
+
     def _group(self,index,gmap,x):
         ndim=len(x.shape)
         if ndim==4:
@@ -93,6 +167,45 @@ class Groups(tf.keras.layers.Layer):
 
 
 
+class Normalize(tf.keras.layers.Layer):
+    """ in-graph normalization of raw (ie. uint16/float16) inputs
+
+    Place before the Encoder to normalize inputs loaded with 
+    `DFSequence(input_format='raw')`:
+
+        inputs=keras.Input(shape,dtype='uint16')
+        stats=keras.Input((2,nb_bands))
+        x=Normalize()([inputs,stats])
+
+    Args (call):
+        - inputs<list>:
+            [x (B,H,W,bands), stats (B,2,bands)] with stats[:,0] the band-wise means
+            and stats[:,1] the band-wise stdevs
+    """
+    def __init__(self,output_dtype='float32',**kwargs):
+        super(Normalize, self).__init__(**kwargs)
+        self.output_dtype=output_dtype
+
+
+    def get_config(self):
+        config=super(Normalize, self).get_config()
+        config.update({"output_dtype": self.output_dtype})
+        return config
+
+
+    def call(self, inputs):
+        x,stats=inputs
+        x=tf.cast(x,self.output_dtype)
+        stats=tf.cast(stats,self.output_dtype)
+        means=stats[:,0][:,tf.newaxis,tf.newaxis,:]
+        stdevs=stats[:,1][:,tf.newaxis,tf.newaxis,:]
+        return (x-means)/stdevs
+
+
+
+
+
+
 # =========================================================================================
 #
 #
@@ -24,6 +24,9 @@ UPSAMPLE_ERROR=(
     'upsample called with scale==1. '
     'Use allow_identity=True to force.'
 )
+UPSAMPLE_DYNAMIC_ERROR=(
+    'upsample with unknown spatial dims requires `like`'
+)
 EPS=1e-8
 #
 # HELPERS
@@ -74,7 +77,12 @@ def upsample(
     if scale is None:
         if shape is None:
             shape=like.shape
+        if None in (x.shape[1],x.shape[2],shape[1],shape[2]):
+            return _resize_like(x,like,rescale,mode)
         scale=rescale*shape[2]/x.shape[2]
+        height=round(rescale*shape[1])
+        if allow_resize and (scale!=1) and (round(x.shape[1]*scale)!=height):
+            return tf.image.resize(x,(height,round(rescale*shape[2])),method=mode)
     if scale==1:
         if not allow_identity:
             raise ValueError(UPSAMPLE_ERROR)
@@ -92,6 +100,16 @@ def upsample(
 
 
 
+def _resize_like(x,like,rescale,mode):
+    """ resize to the (dynamic) spatial shape of like """
+    if like is None:
+        raise ValueError(UPSAMPLE_DYNAMIC_ERROR)
+    size=tf.shape(like)[1:3]
+    if rescale!=1:
+        size=tf.cast(tf.round(tf.cast(size,tf.float32)*rescale),tf.int32)
+    return tf.image.resize(x,size,method=mode)
+
+
 def build_block(config,btype=None,index=None):
     config=_config_dict(config)
     btype=config.pop('btype',btype or DEFAULT_BTYPE)
@@ -828,10 +846,10 @@ class Group(keras.Model):
         for layer in self.group:
             _x.append(layer(x))
         if self.pooling_stack:
-            shape=x.shape
+            like=x
             for layer in self.pooling_stack:
                 x=layer(x)
-            x=upsample(x,shape=shape)
+            x=upsample(x,like=like)
             _x.append(x)
         return layers.Concatenate()(_x) 
 
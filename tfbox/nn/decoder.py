@@ -61,7 +61,9 @@ class Decoder(base.Model):
         if add_classifier is None:
             add_classifier=self.config.get('classifier',False)
         # parse config
-        self._output_size=self.config.get('output_size')
+        self._config_output_size=self.config.get('output_size')
+        self._output_size=self._config_output_size
+        self._output_like=None
         self._output_ratio=self.config.get('output_ratio',1)
         self.output_conv_position=self.config.get(
             'output_conv_position',
@@ -98,8 +100,17 @@ class Decoder(base.Model):
 
 
     def set_output(self,like):
-        if not self._output_size:
-            self._output_size=self._output_rescale(like.shape[-2])
+        """ set output size from (input) like. recomputed for each input shape
+        (unless `output_size` is configured) so the decoder handles different
+        and unknown (None) spatial shapes
+        """
+        if not self._config_output_size:
+            self._upsample_scale=None
+            if like.shape[-2] is None:
+                self._output_size=None
+                self._output_like=like
+            else:
+                self._output_size=self._output_rescale(like.shape[-2])
 
 
     def __call__(self,inputs,skips=[],training=False):
@@ -117,11 +128,19 @@ class Decoder(base.Model):
             x,
             self.output_conv,
             test=self.output_conv_position==Decoder.BEFORE_UP)
-        x=blocks.upsample(
-            x,
-            scale=self._scale(x,inputs),
-            mode=self.upsample_mode,
-            allow_identity=True)
+        if self._output_size:
+            x=blocks.upsample(
+                x,
+                scale=self._scale(x,inputs),
+                mode=self.upsample_mode,
+                allow_identity=True)
+        else:
+            x=blocks.upsample(
+                x,
+                like=self._output_like,
+                rescale=self._output_ratio,
+                mode=self.upsample_mode,
+                allow_identity=True)
         x=self._conditional(
             x,
             self.output_conv,